@@ -2,8 +2,16 @@
 
 The default script config file locates at 'src/configs/scripts.json'.
 
+To archive multiple accounts, pass the Twitter setting file listing them. Each
+script containing the '{account}' placeholder then runs once per account, with
+the placeholder replaced by the username. Other scripts run once for all 
+accounts. See 'src/configs/scripts_accounts.json'.
+
 Usage example:
     python run.py -i "path/to/script/config/file"
+    python run.py \
+        -i "path/to/script/config/file" \
+        -a "path/to/twitter/setting/file"
 """
 
 import argparse
@@ -13,6 +21,31 @@ import sys
 from src.utils import color, io, shell
 
 
+# Placeholder of the username in script commands.
+ACCOUNT_PLACEHOLDER = '{account}'
+
+
+def _expand_accounts(commands: list, usernames: list) -> list:
+    expanded_commands = []
+    for command in commands:
+        if any(ACCOUNT_PLACEHOLDER in token for token in command):
+            for username in usernames:
+                expanded_commands.append([
+                    token.replace(ACCOUNT_PLACEHOLDER, username) 
+                    for token in command
+                ])
+        else:
+            expanded_commands.append(command)
+    return expanded_commands
+
+
+def _get_usernames(path: str) -> list:
+    settings = io.load_json(path)
+    if 'accounts' in settings:
+        return [account['username'] for account in settings['accounts']]
+    return [settings['username']]
+
+
 def _run(commands: list) -> bool:
     print(color.get_info(f'{len(commands)} script(s) to run.'))
 
@@ -37,12 +70,18 @@ def _get_options() -> dict:
     parser.add_argument(
         '-i', '--input', default='src/configs/scripts.json', type=str, 
         help='Path to script config.')
+    parser.add_argument(
+        '-a', '--accounts', default=None, type=str, 
+        help='Path to Twitter setting file. Runs scripts containing '
+             f'"{ACCOUNT_PLACEHOLDER}" once per account listed.')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     options = _get_options()
     commands = io.load_json(options.input)
+    if options.accounts:
+        commands = _expand_accounts(commands, _get_usernames(options.accounts))
 
     success = _run(commands)
     _print_horizontal_bar()
@@ -0,0 +1,191 @@
+"""This script benchmarks domain matching of the media downloader.
+
+It compares `media_downloader.config_downloads`, which matches URLs against a
+prefix trie compiled from the domains config, with the previous linear scan
+over every rule list. Synthetic domain rules and URLs are added to the domains
+config, so the growth of both can be measured. Both implementations are
+checked to produce the same downloads.
+
+The default domains config file locates at 'configs/domains.json'.
+
+Example usage:
+    python domain_matcher_benchmark.py \
+        -s "path/to/the/domains/config/file" \
+        --rules 10000 \
+        --urls 50000
+"""
+
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from media_downloader import HTTP_DOWNLOADER, config_downloads # pylint: disable=import-error
+from utils import color, io, string # pylint: disable=import-error
+
+
+def config_downloads_linear(urls: dict, domains: dict) -> tuple[dict, dict]:
+    """Configs media downloads with a linear scan per rule list.
+
+    The reference implementation of `media_downloader.config_downloads`.
+    """
+    skip_domains = set(domains['skip'])
+    local_domains = set(domains['local'])
+    urls_resolved = {}
+    downloads = {}
+
+    for url, path in sorted(urls.items()):
+        url_download = _map_domain(url, domains['map'])
+        if _get_domain(url_download, skip_domains):
+            continue
+
+        if _get_domain(url_download, local_domains):
+            urls_resolved[url] = path
+        else:
+            url_download = _clean_domain(url_download, domains['redundant'])
+            downloader = _get_downloader(url_download, domains['downloaders'])
+
+            if url_download not in downloads:
+                downloads[url_download] = {
+                    'downloader': downloader,
+                    'path': path
+                }
+            urls_resolved[url] = downloads[url_download]['path']
+
+    direct_paths = {
+        download['path'] for download in downloads.values()
+        if download['downloader'] == HTTP_DOWNLOADER
+    }
+    downloads = {
+        url: download for url, download in downloads.items()
+        if (download['downloader'] == HTTP_DOWNLOADER or
+            download['path'] not in direct_paths)
+    }
+    return downloads, urls_resolved
+
+
+def generate_domains(
+        domains: dict, count: int, generator: random.Random) -> dict:
+    """Adds synthetic rules spread over all rule classes to the domains config."""
+    domains = {
+        'map': dict(domains['map']),
+        'local': list(domains['local']),
+        'skip': list(domains['skip']),
+        'redundant': dict(domains['redundant']),
+        'downloaders': dict(domains['downloaders']),
+    }
+    for i in range(count):
+        domain = f'https://host{i}.example.com/{generator.randrange(100)}/'
+        rule = i % 5
+        if rule == 0:
+            domains['map'][domain] = f'https://mapped{i}.example.com/'
+        elif rule == 1:
+            domains['local'].append(domain)
+        elif rule == 2:
+            domains['skip'].append(domain)
+        elif rule == 3:
+            domains['redundant'][domain] = ['/photo/1']
+        else:
+            domains['downloaders'][domain] = 'youtube-dl'
+    return domains
+
+
+def generate_urls(
+        domains: dict, count: int, generator: random.Random) -> dict:
+    """Generates URLs under the configured domains and some unknown ones."""
+    prefixes = (
+        list(domains['map']) + domains['local'] + domains['skip'] +
+        list(domains['redundant']) +
+        [domain for domain in domains['downloaders'] if domain != 'default'])
+    urls = {}
+    for i in range(count):
+        if generator.random() < 0.8:
+            prefix = generator.choice(prefixes)
+        else:
+            prefix = f'https://unknown{generator.randrange(1000)}.example.org/'
+        urls[f'{prefix}status/{i}/photo/1'] = f'directory/{i}'
+    return urls
+
+
+def measure(function: callable, repeat: int, *args) -> tuple[float, tuple]:
+    """Gets the best wall time in seconds of several runs and the result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _get_domain(url: str, domains: tuple[dict, list, set]) -> str:
+    for domain in domains:
+        if url.startswith(domain):
+            return domain
+    return None
+
+
+def _map_domain(url: str, domains: dict) -> str:
+    domain = _get_domain(url, domains)
+    if domain:
+        return string.replace_first(url, domain, domains[domain])
+    return url
+
+
+def _clean_domain(url: str, domains: dict) -> str:
+    domain = _get_domain(url, domains)
+    if domain:
+        for target in domains[domain]:
+            url = string.remove_last(url, target)
+    return url
+
+
+def _get_downloader(url: str, domains: dict) -> str:
+    domain = _get_domain(url, domains)
+    if domain:
+        return domains[domain]
+    return domains['default']
+
+
+def _get_options() -> dict:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks domain matching of the media downloader.')
+    parser.add_argument(
+        '-s', '--settings', default='configs/domains.json', type=str,
+        help='Path to the domain config file.')
+    parser.add_argument(
+        '--rules', default=1000, type=int,
+        help='Number of synthetic domain rules to add.')
+    parser.add_argument(
+        '--urls', default=10000, type=int,
+        help='Number of synthetic URLs.')
+    parser.add_argument(
+        '--repeat', default=3, type=int,
+        help='Number of runs of each implementation. The best one counts.')
+    parser.add_argument(
+        '--seed', default=0, type=int,
+        help='Seed of the synthetic rules and URLs.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = _get_options()
+    generator = random.Random(options.seed)
+    domains = generate_domains(
+        io.load_json(options.settings), options.rules, generator)
+    urls = generate_urls(domains, options.urls, generator)
+    print(color.get_info(
+        f'Matching {len(urls)} URLs against {options.rules} synthetic rules...'))
+
+    linear_time, linear_result = measure(
+        config_downloads_linear, options.repeat, urls, domains)
+    print(f'Linear scan: {linear_time * 1000:.1f} ms')
+    trie_time, trie_result = measure(
+        config_downloads, options.repeat, urls, domains)
+    print(f'Prefix trie: {trie_time * 1000:.1f} ms')
+
+    if trie_result != linear_result:
+        print(color.get_warning(
+            'WARNING: Results differ. Overlapping domains may match '
+            'differently, as the longest domain wins in the prefix trie.'))
+    print(color.get_ok(f'Speedup: {linear_time / trie_time:.1f}x.'))
@@ -6,6 +6,9 @@ The default
 - Media settings file locates at 'configs/media.json'.
 - Export destination is '../../kano_hanayori_twitter'.
 
+Media hardlinked by the media deduplicator are copied once and hardlinked in
+the destination afterwards.
+
 Example usage:
     python export.py \
         -i "path/to/the/project/root/directory" \
@@ -16,7 +19,6 @@ Example usage:
 
 import argparse
 import os
-import shutil
 from typing import Callable
 
 from utils import color, io # pylint: disable=import-error
@@ -24,7 +26,8 @@ from utils import color, io # pylint: disable=import-error
 
 def export_media_directory(
         dirname: str, base: str, export: str, overwrite: bool, ignored: set, 
-        use_remote_video: bool, video_exts: set, img_exts: set) -> None:
+        use_remote_video: bool, video_exts: set, img_exts: set, 
+        exported: dict = None) -> None:
     """Export files in the media directory to the destination.
 
     Parameters
@@ -46,20 +49,22 @@ def export_media_directory(
         Set of acceptable video extensions.
     img_exts: set
         Set of acceptable image extensions.
-    condition: Callable[[str], bool], default: lambda filename: True
-        Condition check before file export.
+    exported: dict, default: None
+        Exported hardlinked files. See `export_file`.
     """
     def _is_media_required(filename: str) -> bool:
         ext = io.get_extension(filename)
         return ext in img_exts or (not use_remote_video and ext in video_exts)
 
     return export_directory(
-        dirname, base, export, overwrite, ignored, condition=_is_media_required)
+        dirname, base, export, overwrite, ignored, _is_media_required, 
+        exported)
 
 
 def export_directory(
         dirname: str, base: str, export: str, overwrite: bool, ignored: set,
-        condition: Callable[[str], bool] = lambda filename: True) -> None:
+        condition: Callable[[str], bool] = lambda filename: True, 
+        exported: dict = None) -> None:
     """Export files in the directory to the destination.
 
     Parameters
@@ -76,6 +81,8 @@ def export_directory(
         Directory names to ignore.
     condition: Callable[[str], bool], default: lambda filename: True
         Condition check before file export.
+    exported: dict, default: None
+        Exported hardlinked files. See `export_file`.
     """
     for root, _, files in os.walk(io.join_paths(base, dirname)):
         if _required_directory(root, ignored):
@@ -83,10 +90,12 @@ def export_directory(
                 src = os.path.join(root, file)
                 filename = io.remove_parent(src, base)
                 if condition(filename):
-                    export_file(filename, base, export, overwrite)
+                    export_file(filename, base, export, overwrite, exported)
 
 
-def export_file(filename: str, base: str, export: str, overwrite: bool) -> None:
+def export_file(
+        filename: str, base: str, export: str, overwrite: bool, 
+        exported: dict = None) -> None:
     """Export the file to the destination.
 
     Parameters
@@ -99,14 +108,34 @@ def export_file(filename: str, base: str, export: str, overwrite: bool) -> None:
         Path to the export destination directory.
     overwrite: bool
         Whether or not to overwrite files in the export destination directory.
+    exported: dict, default: None
+        Maps (device, inode) of exported source files with several hardlinks
+        to their destinations. If set, a source whose inode is exported 
+        already is hardlinked to the previous destination instead of copied.
+        Updated with the file.
+        Format:
+        {
+            (int('Device'), int('Inode')): str('Destination path.')
+        }
     """
     dst = io.join_paths(export, filename)
+    src = io.join_paths(base, filename)
+    key = None
+    if exported is not None:
+        stat = os.stat(src)
+        if stat.st_nlink > 1:
+            key = (stat.st_dev, stat.st_ino)
+
     if overwrite or not os.path.isfile(dst):
         io.make_directory(os.path.dirname(dst))
-        src = io.join_paths(base, filename)
         print(f'{color.get_highlight(src)} -> ', end='')
-        shutil.copyfile(src, dst)
-        print(color.get_ok(dst))
+        if key in (exported or {}) and _link_file(exported[key], dst):
+            print(color.get_ok(f'{dst} (linked)'))
+        else:
+            io.copy_file(src, dst)
+            print(color.get_ok(dst))
+    if key:
+        exported.setdefault(key, dst)
 
 
 def verify_requirements(base: str, requirements: list) -> None:
@@ -130,6 +159,15 @@ def verify_requirements(base: str, requirements: list) -> None:
             raise FileNotFoundError(f"ERROR: '{path}' not found.")
 
 
+def _link_file(src: str, dst: str) -> bool:
+    # Copies instead if the destination does not support hardlinks.
+    try:
+        io.link_file(src, dst)
+        return True
+    except OSError:
+        return False
+
+
 def _required_directory(path: str, ignored: set) -> bool:
     for parent in ignored:
         if io.has_parent(path, parent):
@@ -179,13 +217,16 @@ if __name__ == '__main__':
     export = options.export
     
     print(color.get_info(f"Exporting the project to '{export}'..."))
+    exported = {}
     export_media_directory(
         required_media, base, export, options.overwrite, ignored,
-        options.use_remote_video, video_exts, img_exts)
+        options.use_remote_video, video_exts, img_exts, exported)
 
     for dirname in required_dirs:
-        export_directory(dirname, base, export, options.overwrite, ignored)
+        export_directory(
+            dirname, base, export, options.overwrite, ignored, 
+            exported=exported)
     for filename in required_files:
-        export_file(filename, base, export, options.overwrite)
+        export_file(filename, base, export, options.overwrite, exported)
     print()
     print(color.get_ok('Done.'))
@@ -0,0 +1,152 @@
+"""This script deduplicates media files by content with hardlinks.
+
+The same image or video is often downloaded several times under different URLs,
+e.g. a quote of an own Tweet or a re-shared clip, each into its own directory.
+Files of the same content are hardlinked to a single copy, so each unique blob
+is stored once while every directory keeps its files.
+
+Only files sharing a size with another file can be duplicates, so only those
+are hashed. Hashes are cached in an index (see `utils.dedup`), so later runs
+only hash new or modified files. The exporter copies hardlinked files once.
+
+The default
+- Media directory locates at '../data/media'.
+- Hash index file locates at '../data/texts/media_hashes.json'.
+
+Example usage:
+    python media_deduplicator.py \
+        -i "path/to/the/media/directory" \
+        -x "path/to/the/hash/index/file" \
+        --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import os
+
+from utils import color, io # pylint: disable=import-error
+from utils.dedup import HashIndex # pylint: disable=import-error
+from utils.manifest import is_partial # pylint: disable=import-error
+
+
+def deduplicate(root: str, index: HashIndex, dry_run: bool = False) -> dict:
+    """Hardlinks files of the same content under the directory.
+
+    Among files of the same content, the first one by path is kept and the
+    others are replaced by hardlinks to it. Files that cannot be hardlinked
+    (e.g. across file systems) are kept as they are.
+
+    Parameters
+    ----------
+    root: str
+        Media directory.
+    index: HashIndex
+        Cached hashes of files under the directory. Pruned to existing files.
+    dry_run: bool, default: False
+        Whether to only report duplicates without linking them.
+
+    Returns
+    -------
+    dict
+        Format:
+        {
+            'files': int('Number of files.'),
+            'hashed': int('Number of files hashed in this run.'),
+            'duplicates': int('Number of files linked (or to link) now.'),
+            'linked': int('Number of files hardlinked already.'),
+            'saved_bytes': int('Disk space freed (or to free) now.'),
+            'errors': int('Number of files failing to be linked.')
+        }
+    """
+    stats = {}
+    for parent, _, filenames in os.walk(root):
+        for filename in filenames:
+            if is_partial(filename):
+                continue
+            path = os.path.join(parent, filename)
+            stats[os.path.relpath(path, root)] = os.stat(path)
+    index.prune(set(stats))
+
+    # Files of unique sizes have no duplicates.
+    sizes = {}
+    for filename, stat in stats.items():
+        if stat.st_size:
+            sizes.setdefault(stat.st_size, []).append(filename)
+    groups = {}
+    for filenames in sizes.values():
+        if len(filenames) < 2:
+            continue
+        for filename in filenames:
+            digest = index.get_hash(filename, stats[filename])
+            groups.setdefault(digest, []).append(filename)
+
+    result = {
+        'files': len(stats),
+        'hashed': index.hashed,
+        'duplicates': 0,
+        'linked': 0,
+        'saved_bytes': 0,
+        'errors': 0,
+    }
+    for digest, filenames in groups.items():
+        source, *duplicates = sorted(filenames)
+        source_stat = stats[source]
+        for filename in duplicates:
+            stat = stats[filename]
+            if (stat.st_dev, stat.st_ino) == (
+                    source_stat.st_dev, source_stat.st_ino):
+                result['linked'] += 1
+                continue
+            if not dry_run:
+                try:
+                    io.link_file(
+                        io.join_paths(root, source),
+                        io.join_paths(root, filename))
+                except OSError as err:
+                    print(color.get_warning(
+                        f"WARNING: Failed to link '{filename}': {err}"))
+                    result['errors'] += 1
+                    continue
+                index.update(filename, digest)
+            print(f"'{filename}' -> '{source}'")
+            result['duplicates'] += 1
+            # Other links keep the replaced content.
+            if stat.st_nlink == 1:
+                result['saved_bytes'] += stat.st_size
+    return result
+
+
+def _get_options() -> dict:
+    parser = argparse.ArgumentParser(
+        description='Hardlinks media files of the same content.')
+    parser.add_argument(
+        '-i', '--input', default='../data/media', type=str,
+        help='Path to the media directory.')
+    parser.add_argument(
+        '-x', '--index', default='../data/texts/media_hashes.json', type=str,
+        help='Path to the hash index file.')
+    parser.add_argument(
+        '--dry-run', action='store_true', default=False,
+        help='Reports duplicates without linking them. The hash index is '
+             'still saved.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = _get_options()
+    index = HashIndex(options.index, options.input)
+    print(color.get_info(f"Deduplicating media in '{options.input}'..."))
+    result = deduplicate(options.input, index, options.dry_run)
+    index.save()
+    print(f"Saved the hash index to '{options.index}'.")
+    print()
+
+    print(
+        f"Files: {result['files']}, hashed: {result['hashed']}, "
+        f"hardlinked already: {result['linked']}.")
+    if result['errors']:
+        print(color.get_error(f"Failed to link {result['errors']} files."))
+    action = 'Found' if options.dry_run else 'Linked'
+    print(color.get_ok(
+        f"{action} {result['duplicates']} duplicates, "
+        f"{result['saved_bytes'] / (1 << 20):.1f} MiB."))
@@ -12,28 +12,165 @@ Example usage:
         -s "path/to/the/domains/config/file" \
         -o "path/to/the/media/output/directory" \
         -x "path/to/the/texts/output/directory" \
+        --delta "path/to/the/urls_raw_delta/file" \
+        --resolve-jobs 16 \
+        --jobs 8 \
+        --in-process \
+        --batch youtube-dl \
+        --max-rate 10M \
         --skip-existing-directories
 """
 
 from __future__ import annotations
 import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
 import os
 from subprocess import CompletedProcess
+import sys
+import threading
+import time
+from typing import Callable
+import urllib.parse
 
-from utils import color, io, shell, string # pylint: disable=import-error
+from utils import color, http, io, retry, shell, string # pylint: disable=import-error
+from utils.cache import ExpiringCache # pylint: disable=import-error
+from utils.database import ArchiveDatabase # pylint: disable=import-error
+from utils.extractors import ExtractorPool, YOUTUBE_DL_TEMPLATE # pylint: disable=import-error
+from utils import manifest as manifests # pylint: disable=import-error
+from utils.manifest import DownloadManifest # pylint: disable=import-error
+from utils.retry import FailureJournal # pylint: disable=import-error
+from utils import telemetry # pylint: disable=import-error
+from utils.telemetry import MetricsLog # pylint: disable=import-error
+from utils.throttle import ByteBucket, Throttle, parse_size # pylint: disable=import-error
+from utils.trie import PrefixTrie # pylint: disable=import-error
 
 
 URL_OUTPUT_FILENAME = 'urls.json'
+USER_FILENAME = 'user_raw.json'
+MANIFEST_FILENAME = 'downloads_manifest.json'
+JOURNAL_FILENAME = 'downloads_failures.json'
+METRICS_FILENAME = 'downloads_metrics.jsonl'
+RESOLUTION_CACHE_FILENAME = 'urls_resolved_cache.json'
 
 # Profile images may get updated.
 PROFILE_IMAGE_DIRECTORIES = ('avatar', 'banner')
 
+# Built-in downloader of direct file URLs. e.g. Attached media of Tweets.
+HTTP_DOWNLOADER = 'http'
 
-def config_downloads(urls: dict, domains: dict) -> tuple[dict, dict]:
+# Errors of URLs that will never succeed. They are not retried.
+PERMANENT_ERRORS = (
+    'HTTP Error 404', 'HTTP Error 410', 'Video unavailable', 
+    'This video has been removed', 'Private video',
+)
+
+# Policies ordering downloads, in the order they apply. See `order_downloads`.
+ORDER_POLICIES = ('profile', 'newest', 'oldest', 'smallest')
+DEFAULT_ORDER = ('profile', 'newest', 'smallest')
+
+# Rough sizes in bytes of media not downloaded yet, by kind.
+EXPECTED_SIZES = {
+    'image': 256 << 10,
+    'file': 16 << 20,
+    'page': 64 << 20,
+}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# Rule classes of the domains config matched against each URL.
+DOMAIN_RULES = ('map', 'local', 'skip', 'redundant', 'downloaders')
+
+# Download results.
+SUCCESS = 'success'
+SKIP = 'skip'
+FAILURE = 'failure'
+
+# Status of a failed attempt that is retried, in metrics.
+RETRY = 'retry'
+
+
+class DomainLimiter:
+    """This class caps the number of concurrent downloads per domain.
+
+    Domains without a specific cap are limited per host by the default cap, if
+    any.
+
+    Tasks wait in a queue per domain instead of blocking workers. `pop` only
+    hands out tasks of domains below their caps, in the order of priority, so
+    workers stay busy with other domains while a domain is at its cap. It is
+    not thread-safe and is meant to be driven by the dispatching thread.
+    """
+    def __init__(self, limits: dict) -> None:
+        self.limits = PrefixTrie()
+        for domain, limit in limits.items():
+            if domain != 'default':
+                self.limits.insert(domain, 'limit', limit)
+        self.default = limits.get('default')
+        self.queues = {}
+        self.active = {}
+        self.count = 0
+
+    def __len__(self) -> int:
+        return sum(map(len, self.queues.values()))
+
+    def push(self, url: str, task: object, priority: float) -> None:
+        """Queues the task of the URL. Lower priorities are popped first."""
+        key = self._get_key(url)
+        # The counter breaks ties without comparing tasks.
+        heapq.heappush(
+            self.queues.setdefault(key, []), (priority, self.count, task))
+        self.count += 1
+
+    def pop(self) -> tuple[tuple, object]:
+        """Removes the next task of a domain below its cap.
+
+        Returns
+        -------
+        tuple
+            The domain and cap of the task, to `release` once it is done.
+            None if no task can start now.
+        object
+            The task.
+        """
+        ready = [
+            (queue[0], key) for key, queue in self.queues.items()
+            if queue and (not key[1] or self.active.get(key, 0) < key[1])
+        ]
+        if not ready:
+            return None, None
+        _, key = min(ready)
+        self.active[key] = self.active.get(key, 0) + 1
+        return key, heapq.heappop(self.queues[key])[2]
+
+    def release(self, key: tuple) -> None:
+        """Frees a slot of the domain of a popped task."""
+        self.active[key] -= 1
+
+    def get_cap(self, url: str) -> tuple[str, int]:
+        """Gets the domain of the URL and its cap (None if unlimited)."""
+        match = self.limits.find(url, 'limit')
+        if match:
+            return match
+        return urllib.parse.urlsplit(url).netloc, self.default
+
+    def _get_key(self, url: str) -> tuple[str, int]:
+        domain, limit = self.get_cap(url)
+        # Unlimited domains share a queue.
+        return (domain, limit) if limit else (None, None)
+
+
+def config_downloads(
+        urls: dict, domains: dict, resolved: dict = None) -> tuple[dict, dict]:
     """Configs media downloads.
 
+    Domains are compiled into a prefix trie, so each URL is matched against
+    all rules in one pass. The longest matching domain of each rule wins.
+
     Maps URLs to the expanded ones, omits skipped URLs, removes redundant tokens
-    from URLs, and gets downloaders depending on URLs.
+    from URLs, and gets downloaders depending on URLs. If a download directory
+    has direct file URLs (downloaded by the built-in 'http' downloader), other
+    URLs to the same directory are not downloaded, as they would scrape the
+    same media again.
 
     Parameters
     ----------
@@ -51,6 +188,9 @@ def config_downloads(urls: dict, domains: dict) -> tuple[dict, dict]:
         leave the 'local' attribute empty in the domains config file.)
         Format:
         {
+            'resolve': [
+                str('A domain of a URL shortener. See `resolve_urls`.')
+            ],
             'map': {
                 str('A shortened URL'): str('The fully expanded URL.')
             },
@@ -70,6 +210,9 @@ def config_downloads(urls: dict, domains: dict) -> tuple[dict, dict]:
                 str('A domain that requires a specific downloader'): str('A specific downloader.')
             }
         }
+    resolved: dict, default: None
+        Mappings from URLs to their final URLs after following redirects. See
+        `resolve_urls`. Applied before the static 'map' of domains.
 
     Returns
     -------
@@ -87,22 +230,30 @@ def config_downloads(urls: dict, domains: dict) -> tuple[dict, dict]:
         Maps each URL to its local download directory. Domains of locally 
         available media are preserved, while skipped domains are removed.
     """
-    skip_domains = set(domains['skip'])
-    local_domains = set(domains['local'])
+    trie = compile_domains(domains)
+    default_downloader = domains['downloaders']['default']
     urls_resolved = {}
     downloads = {}
 
     for url, path in sorted(urls.items()):
-        url_download = url
-        url_download = _map_domain(url_download, domains['map'])
-        if _get_domain(url_download, skip_domains):
+        url_download = (resolved or {}).get(url, url)
+        rules = trie.match(url_download)
+        if 'map' in rules:
+            domain, target = rules['map']
+            url_download = string.replace_first(url_download, domain, target)
+            rules = trie.match(url_download)
+        if 'skip' in rules:
             continue
 
-        if _get_domain(url_download, local_domains):
+        if 'local' in rules:
             urls_resolved[url] = path
         else:
-            url_download = _clean_domain(url_download, domains['redundant'])
-            downloader = _get_downloader(url_download, domains['downloaders'])
+            if 'redundant' in rules:
+                for target in rules['redundant'][1]:
+                    url_download = string.remove_last(url_download, target)
+            downloader = default_downloader
+            if 'downloaders' in rules:
+                downloader = rules['downloaders'][1]
             
             if url_download not in downloads:
                 downloads[url_download] = {
@@ -110,79 +261,897 @@ def config_downloads(urls: dict, domains: dict) -> tuple[dict, dict]:
                     'path': path
                 }
             urls_resolved[url] = downloads[url_download]['path']
+
+    direct_paths = {
+        download['path'] for download in downloads.values() 
+        if download['downloader'] == HTTP_DOWNLOADER
+    }
+    downloads = {
+        url: download for url, download in downloads.items() 
+        if (download['downloader'] == HTTP_DOWNLOADER or 
+            download['path'] not in direct_paths)
+    }
     return downloads, urls_resolved
 
 
-def download_media(downloader: str, url: str, dst: str) -> CompletedProcess:
+def compile_domains(domains: dict) -> PrefixTrie:
+    """Compiles the domain rules into a prefix trie. See `config_downloads`.
+
+    Each domain of the rules in `DOMAIN_RULES` is inserted with its value, e.g.
+    the mapped domain of 'map', the redundant parameters of 'redundant', the
+    downloader of 'downloaders' and True for lists.
+    """
+    trie = PrefixTrie()
+    for rule in DOMAIN_RULES:
+        rule_domains = domains.get(rule, [])
+        if isinstance(rule_domains, dict):
+            items = rule_domains.items()
+        else:
+            items = ((domain, True) for domain in rule_domains)
+        for domain, value in items:
+            if rule == 'downloaders' and domain == 'default':
+                continue
+            trie.insert(domain, rule, value)
+    return trie
+
+
+def resolve_urls(
+        urls: tuple[dict, list], domains: list, cache: ExpiringCache,
+        jobs: int = 8) -> dict:
+    """Follows redirects of shortened URLs concurrently.
+
+    Final URLs are looked up in the cache first and stored in it afterwards.
+    URLs failed to resolve are kept as they are and retried in the next run.
+
+    Parameters
+    ----------
+    urls: dict | list
+        URLs to resolve. Only those of the given domains are resolved.
+    domains: list
+        Domains of URL shorteners. e.g. 'https://t.co/'.
+    cache: ExpiringCache
+        Cache of final URLs.
+    jobs: int, default: 8
+        Maximum number of concurrent requests.
+
+    Returns
+    -------
+    dict
+        Mappings from URLs to their final URLs, for resolved URLs only.
+    """
+    trie = PrefixTrie()
+    for domain in domains:
+        trie.insert(domain, 'resolve', True)
+    resolved = {}
+    pending = []
+    for url in urls:
+        if not trie.find(url, 'resolve'):
+            continue
+        final_url = cache.get(url)
+        if final_url:
+            resolved[url] = final_url
+        else:
+            pending.append(url)
+    if not pending:
+        return resolved
+
+    pool = http.ConnectionPool(max_idle=jobs, timeout=10)
+
+    def resolve(url: str) -> str:
+        try:
+            return http.resolve_url(url, pool)
+        except OSError as err:
+            print(color.get_warning(f"Failed to resolve '{url}': {err}"))
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        for url, final_url in zip(pending, executor.map(resolve, pending)):
+            if final_url:
+                cache.set(url, final_url)
+                resolved[url] = final_url
+    return resolved
+
+
+def order_downloads(
+        downloads: dict, policy: tuple[list, tuple] = DEFAULT_ORDER, 
+        manifest: DownloadManifest = None) -> list:
+    """Orders URLs to download by priority.
+
+    Parameters
+    ----------
+    downloads: dict
+        Download configs. See `config_downloads`.
+    policy: list | tuple, default: DEFAULT_ORDER
+        Policies applied in order, each breaking ties of the previous ones:
+        - 'profile': Profile images (avatar and banner) first.
+        - 'newest': Media of the newest Tweets (by snowflake id) first.
+        - 'oldest': Media of the oldest Tweets first.
+        - 'smallest': Smallest expected size first. Sizes are taken from the
+            manifest if recorded, or else guessed from the URL.
+        Remaining ties are ordered by URL.
+    manifest: DownloadManifest, default: None
+        Download states with recorded file sizes.
+
+    Returns
+    -------
+    list
+        URLs of downloads in priority order.
+    """
+    def get_key(url: str) -> tuple:
+        path = downloads[url]['path']
+        # Media directories of Tweets are named after their ids.
+        # e.g. '1234567890123456789_0'
+        tid = os.path.basename(path).split('_')[0]
+        tid = int(tid) if tid.isdigit() else 0
+        keys = []
+        for rule in policy:
+            if rule == 'profile':
+                keys.append(not path.endswith(PROFILE_IMAGE_DIRECTORIES))
+            elif rule == 'newest':
+                keys.append(-tid)
+            elif rule == 'oldest':
+                keys.append(tid or float('inf'))
+            elif rule == 'smallest':
+                keys.append(_get_expected_size(url, downloads[url], manifest))
+            else:
+                raise ValueError(f"Unsupported order policy '{rule}'.")
+        keys.append(url)
+        return tuple(keys)
+    return sorted(downloads, key=get_key)
+
+
+def download_all(
+        downloads: dict, output: str, jobs: int = 1, limits: dict = None,
+        skip_existing_directories: bool = False, 
+        extractors: ExtractorPool = None, batch: tuple[list, set] = (), 
+        manifest: DownloadManifest = None, verify: bool = False, 
+        journal: FailureJournal = None, retries: int = 0, 
+        retry_delay: float = 5, ranges: dict = None, 
+        order: tuple[list, tuple] = DEFAULT_ORDER, 
+        throttle: Throttle = None, metrics: MetricsLog = None) -> dict:
+    """Downloads media concurrently.
+
+    Parameters
+    ----------
+    downloads: dict
+        Download configs. See `config_downloads`.
+    output: str
+        Media output directory.
+    jobs: int, default: 1
+        Number of concurrent downloads. Downloader outputs are only printed on
+        failures if more than 1.
+    limits: dict, default: None
+        Maximum numbers of concurrent downloads per domain. See `DomainLimiter`.
+        Format:
+        {
+            'default': int('The default cap per host. Optional.'),
+            str('A domain'): int('The cap of the domain.')
+        }
+    skip_existing_directories: bool, default: False
+        Whether to skip existing directories without checking files inside.
+        Only applies to URLs not recorded in the manifest.
+    extractors: ExtractorPool, default: None
+        Worker processes to run 'you-get' and 'youtube-dl' in. If not set, 
+        each download runs them as a new process.
+    batch: list | set, default: ()
+        Downloaders whose URLs are grouped into batches, at most one per job
+        and domain cap. Each batch runs in a single extractor session. 
+        Requires extractors.
+    manifest: DownloadManifest, default: None
+        Download states of URLs. If set, verifiably complete URLs are skipped
+        and the state of every download is recorded. Profile images are
+        always refreshed with conditional requests instead, using the 
+        recorded validators.
+    verify: bool, default: False
+        Whether to verify file hashes of complete URLs in the manifest.
+    journal: FailureJournal, default: None
+        Failures of URLs across runs. If set, dead URLs are skipped and final
+        failures are recorded.
+    retries: int, default: 0
+        Maximum number of retries per URL, unless its error is permanent. 
+        Retries are delayed by a jittered exponential backoff, while other
+        downloads carry on.
+    retry_delay: float, default: 5
+        Delay ceiling in seconds of the first retry.
+    ranges: dict, default: None
+        Numbers of byte ranges downloaded in parallel per domain of direct
+        file URLs, for large files whose servers accept range requests.
+        Format:
+        {
+            str('A domain'): int('Maximum number of parallel ranges.')
+        }
+    order: list | tuple, default: DEFAULT_ORDER
+        Policies ordering downloads. See `order_downloads`.
+    throttle: Throttle, default: None
+        Limits of bandwidth, disk writes and free disk space. Downloads wait
+        while free space is low. Each job gets an equal share of the
+        bandwidth, built-in downloads and 'youtube-dl' alike. 'you-get' is not
+        limited, and disk writes are only limited for built-in downloads, as
+        extractors write on their own. Its jobs should match `jobs`.
+    metrics: MetricsLog, default: None
+        Log of metrics records. If set, every download attempt is recorded
+        with its size and timings. See `utils.telemetry`.
+
+    Returns
+    -------
+    dict
+        Maps each URL to its result, either 'success', 'skip' or 'failure'.
+    """
+    limiter = DomainLimiter(limits or {})
+    pool = http.ConnectionPool(max_idle=max(jobs, 1))
+    range_parts = PrefixTrie()
+    for domain, parts in (ranges or {}).items():
+        range_parts.insert(domain, 'parts', parts)
+    quiet = jobs > 1
+    rate_limit = throttle and throttle.job_rate
+    lock = threading.Lock()
+    results = {}
+
+    def finish(url: str, status: str, message: str) -> None:
+        with lock:
+            results[url] = status
+            print(f"({len(results)}/{len(downloads)}) {message}")
+
+    def get_message(
+            url: str, dst: str, result: CompletedProcess, error: str) -> str:
+        if not error:
+            return f"Downloaded media from '{url}' to '{dst}'."
+        message = color.get_error(
+            f"Failed to download media from '{url}' to '{dst}'.")
+        if quiet and (result.stdout or result.stderr):
+            message += '\n' + (result.stdout or '') + (result.stderr or '')
+        elif not result.returncode:
+            message += '\n' + error
+        return message
+
+    def record(
+            url: str, start_time: float, returncode: int, 
+            info: dict = None) -> str:
+        # Returns the status of the download. Without a manifest, it only
+        # depends on the exit status.
+        if not manifest:
+            return manifests.FAILED if returncode else manifests.COMPLETE
+        downloader = downloads[url]['downloader']
+        dst = io.join_paths(output, downloads[url]['path'])
+        if info and not info['path']:
+            # Not modified since the last download.
+            files = manifest.get(url)['files']
+            has_partial = False
+        elif info:
+            # Direct file downloads know their file.
+            path = info['path']
+            files = {}
+            if os.path.isfile(path):
+                files[os.path.basename(path)] = manifests.get_file(path)
+            has_partial = os.path.isfile(path + io.TEMPORARY_SUFFIX)
+        else:
+            files, has_partial = manifests.scan_files(dst, start_time)
+
+        # Downloaders may exit successfully without downloading anything.
+        if not returncode and files and not has_partial:
+            status = manifests.COMPLETE
+        elif files or has_partial:
+            status = manifests.PARTIAL
+        else:
+            status = manifests.FAILED
+        info = info or {}
+        manifest.record(
+            url, downloader, downloads[url]['path'], status, files, 
+            info.get('etag'), info.get('last_modified'))
+        return status
+
+    def download(url: str) -> list:
+        downloader = downloads[url]['downloader']
+        dst = io.join_paths(output, downloads[url]['path'])
+        consume = None
+        if throttle:
+            throttle.wait_for_space()
+            consume = throttle.get_consumer()
+        if not quiet:
+            print(color.get_highlight(
+                f"Downloding media from '{url}' to '{dst}'..."))
+        start_time = time.time()
+        started = start_time
+        info = None
+        if dst.endswith(PROFILE_IMAGE_DIRECTORIES):
+            entry = (manifest and manifest.get(url)) or {}
+            result, info = _refresh_file(url, dst, entry, quiet, consume)
+        elif downloader == HTTP_DOWNLOADER:
+            _, parts = range_parts.find(url, 'parts') or (None, 1)
+            result, info = _download_file(
+                url, dst, quiet, pool, parts, consume)
+        else:
+            result, started = download_media(
+                downloader, url, dst, quiet, extractors, rate_limit)
+        end_time = time.time()
+        status = record(url, start_time, result.returncode, info)
+        stats = measure(url, start_time, started, end_time, info)
+        return [(url, result, stats, status)]
+
+    def download_batch(downloader: str, urls: list) -> list:
+        dsts = [io.join_paths(output, downloads[url]['path']) for url in urls]
+        if throttle:
+            throttle.wait_for_space()
+        if not quiet:
+            print(color.get_highlight(
+                f"Downloding a batch of {len(urls)} media "
+                f"with {downloader}..."))
+        start_time = time.time()
+        outputs = extractors.run_batch(
+            downloader, list(zip(urls, dsts)), quiet, rate_limit)
+        end_time = time.time()
+        # Each URL lasts until the next one starts. The startup of the session
+        # only counts for the first one.
+        ends = [started for _, _, started in outputs[1:]] + [end_time]
+        attempts = []
+        for i, (url, (returncode, stdout, started)) in enumerate(
+                zip(urls, outputs)):
+            status = record(url, start_time, returncode)
+            result = CompletedProcess([downloader, url], returncode, stdout)
+            if started is None:
+                # The worker crashed.
+                stats = measure(url, start_time, None, end_time)
+            else:
+                stats = measure(
+                    url, start_time if i == 0 else started, started, ends[i])
+            attempts.append((url, result, stats, status))
+        return attempts
+
+    def measure(
+            url: str, start_time: float, started: float, end_time: float,
+            info: dict = None) -> dict:
+        if not metrics:
+            return None
+        dst = io.join_paths(output, downloads[url]['path'])
+        return {
+            'bytes': _get_size(dst, start_time, info),
+            'wall_time': end_time - start_time,
+            'startup_time': None if started is None else started - start_time,
+        }
+
+    def report(
+            url: str, result: CompletedProcess, stats: dict, 
+            status: str) -> None:
+        if not metrics:
+            return
+        metrics.write({
+            'url': url,
+            'downloader': downloads[url]['downloader'],
+            'domain': urllib.parse.urlsplit(url).netloc,
+            'status': status,
+            'returncode': result.returncode,
+            **stats,
+            'retries': attempt_counts.get(url, 0),
+        })
+
+    queue = retry.RetryQueue()
+    attempt_counts = {}
+
+    def handle(
+            url: str, result: CompletedProcess, stats: dict, 
+            status: str) -> None:
+        # Results, the journal and the delta follow the recorded status, so a
+        # download without files is retried like any other failure.
+        dst = io.join_paths(output, downloads[url]['path'])
+        if status == manifests.COMPLETE:
+            report(url, result, stats, SUCCESS)
+            if journal:
+                journal.record_success(url)
+            finish(url, SUCCESS, get_message(url, dst, result, None))
+            return
+
+        if result.returncode:
+            error = _get_error(result)
+        else:
+            error = 'No complete files downloaded.'
+
+        permanent = any(pattern in error for pattern in PERMANENT_ERRORS)
+        will_retry = not permanent and attempt_counts.get(url, 0) < retries
+        report(url, result, stats, RETRY if will_retry else FAILURE)
+        attempt_counts[url] = attempt_counts.get(url, 0) + 1
+        if will_retry:
+            delay = retry.get_backoff(attempt_counts[url], retry_delay)
+            queue.push(url, delay)
+            print(color.get_warning(
+                f"Retries '{url}' in {delay:.1f}s "
+                f"({attempt_counts[url]}/{retries}): {error}"))
+            return
+        message = get_message(url, dst, result, error)
+        if journal and journal.record_failure(url, error, permanent):
+            message += '\n' + color.get_warning(f"Marked '{url}' as dead.")
+        finish(url, FAILURE, message)
+
+    # Groups batched downloads by downloader and domain. Priorities are ranks
+    # in the download order.
+    singles = []
+    batches = {}
+    priorities = {}
+    for priority, url in enumerate(
+            order_downloads(downloads, order, manifest)):
+        priorities[url] = priority
+        download_config = downloads[url]
+        downloader = download_config['downloader']
+        dst = io.join_paths(output, download_config['path'])
+        is_profile_image = dst.endswith(PROFILE_IMAGE_DIRECTORIES)
+        if (manifest and not is_profile_image and 
+                manifest.is_complete(url, output, verify)):
+            finish(url, SKIP, f"Skips download as '{url}' is complete.")
+        elif journal and journal.is_dead(url):
+            finish(url, SKIP, f"Skips download as '{url}' is dead.")
+        # Direct file downloads check existing files instead, as several of
+        # them may share a directory.
+        elif (skip_existing_directories and 
+                not (manifest and manifest.get(url)) and
+                os.path.isdir(dst) and 
+                downloader != HTTP_DOWNLOADER and
+                not is_profile_image):
+            finish(url, SKIP, f"Skips download as '{dst}' exists.")
+        elif extractors and downloader in batch:
+            key = (downloader, *limiter.get_cap(url))
+            batches.setdefault(key, []).append(url)
+        else:
+            singles.append(url)
+
+    # Tasks start in the order of priority, as domain caps allow. A batch
+    # takes the priority of its first URL, the highest of its members.
+    for url in singles:
+        limiter.push(url, (download, url), priorities[url])
+    for (downloader, _, limit), urls in batches.items():
+        count = max(min(jobs, limit or jobs, len(urls)), 1)
+        for i in range(count):
+            limiter.push(
+                urls[i], (download_batch, downloader, urls[i::count]), 
+                priorities[urls[i]])
+    priority = len(priorities)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        # Maps running tasks to their domain keys in the limiter.
+        futures = {}
+        while True:
+            # Only as many tasks as workers run, so none waits for a worker.
+            while len(futures) < max(jobs, 1):
+                key, task = limiter.pop()
+                if task is None:
+                    break
+                futures[executor.submit(*task)] = key
+            if not futures and not len(queue):
+                break
+
+            # Retries are downloaded one by one once due.
+            if futures:
+                done, _ = wait(futures, queue.get_wait(), FIRST_COMPLETED)
+                for future in done:
+                    limiter.release(futures.pop(future))
+                    for attempt in future.result():
+                        handle(*attempt)
+            else:
+                time.sleep(queue.get_wait())
+            for url in queue.pop_due():
+                limiter.push(url, (download, url), priority)
+                priority += 1
+    return results
+
+
+def get_pending_urls(
+        urls: dict, urls_configured: dict, downloads: dict, results: dict,
+        journal: FailureJournal = None) -> dict:
+    """Gets URLs to download again in the next run of a delta.
+
+    URLs are kept if a download of their directory failed, or was skipped as
+    dead. Dead URLs are retried once they expire in the journal, which only
+    happens if the delta still has them.
+
+    Parameters
+    ----------
+    urls: dict
+        Mappings from URL to its local download directory, as loaded from the
+        delta.
+    urls_configured: dict
+        The configured URLs among them. See `config_downloads`.
+    downloads: dict
+        Download configs. See `config_downloads`.
+    results: dict
+        Results of the downloads. See `download_all`.
+    journal: FailureJournal, default: None
+        Failures of URLs across runs, after the downloads.
+
+    Returns
+    -------
+    dict
+        Mappings from URL to its local download directory. Profile images are
+        omitted, as they are added to every delta anyway.
+    """
+    pending_paths = {
+        downloads[url]['path'] for url, status in results.items()
+        if status == FAILURE or (journal and journal.is_dead(url))
+    }
+    return {
+        url: path for url, path in urls.items()
+        if (url in urls_configured and 
+            urls_configured[url] in pending_paths and 
+            path not in PROFILE_IMAGE_DIRECTORIES)
+    }
+
+
+def plan_downloads(
+        downloads: dict, output: str, jobs: int = 1, limits: dict = None,
+        skip_existing_directories: bool = False, 
+        extractors: ExtractorPool = None, manifest: DownloadManifest = None, 
+        journal: FailureJournal = None, history: list = (), 
+        probe_jobs: int = 8) -> dict:
+    """Estimates downloads per domain without downloading.
+
+    URLs are classified as `download_all` would. Sizes of pending direct file
+    URLs are taken from HEAD requests, and those of other URLs from metadata of
+    extractors. Durations are estimated from the throughput of past downloads
+    of the same domain, or else of the same downloader.
+
+    Parameters
+    ----------
+    downloads: dict
+        Download configs. See `config_downloads`.
+    output: str
+        Media output directory.
+    jobs: int, default: 1
+        Number of concurrent downloads planned.
+    limits: dict, default: None
+        Maximum numbers of concurrent downloads per domain. See `download_all`.
+        Probes are capped by them as well.
+    skip_existing_directories: bool, default: False
+        See `download_all`.
+    extractors: ExtractorPool, default: None
+        Worker processes to extract metadata in. If not set, sizes of URLs of
+        'you-get' and 'youtube-dl' are unknown.
+    manifest: DownloadManifest, default: None
+        Download states of URLs. Verifiably complete URLs are not probed.
+    journal: FailureJournal, default: None
+        Failures of URLs across runs. Dead URLs are not probed.
+    history: list, default: ()
+        Past metrics records. See `utils.telemetry`.
+    probe_jobs: int, default: 8
+        Maximum number of concurrent probes.
+
+    Returns
+    -------
+    dict
+        Format:
+        {
+            str('Host'): {
+                'pending': int('Number of URLs to download.'),
+                'complete': int('Number of complete URLs.'),
+                'dead': int('Number of dead URLs.'),
+                'errors': int('Number of pending URLs failing to be probed.'),
+                'unknown': int('Number of pending URLs of unknown sizes.'),
+                'files': int('Number of files downloaded already.'),
+                'existing_bytes': int('Size of files downloaded already.'),
+                'bytes': int('Expected bytes to download, guessed if unknown.'),
+                'concurrency': int('Number of concurrent downloads.'),
+                'duration': float('Estimated seconds, or None without history.')
+            }
+        }
+    """
+    limiter = DomainLimiter(limits or {})
+    pool = http.ConnectionPool(max_idle=max(probe_jobs, 1))
+    summaries = {
+        key: telemetry.summarize(history, key) 
+        for key in ('domain', 'downloader')
+    }
+
+    def get_seconds(url: str, size: int) -> float:
+        for key, summary in summaries.items():
+            stats = summary.get(
+                urllib.parse.urlsplit(url).netloc if key == 'domain' else
+                downloads[url]['downloader'])
+            if stats and stats['throughput']:
+                return size / stats['throughput']
+            if stats:
+                # Nothing downloaded yet.
+                return stats['wall_time'][50]
+        return None
+
+    def probe(url: str) -> dict:
+        download_config = downloads[url]
+        downloader = download_config['downloader']
+        dst = io.join_paths(output, download_config['path'])
+        entry = (manifest and manifest.get(url)) or {}
+        files = entry.get('files', {})
+        estimate = {
+            'status': 'pending',
+            'files': len(files),
+            'existing_bytes': sum(file['size'] for file in files.values()),
+            'size': None,
+            'error': None,
+        }
+        is_profile_image = dst.endswith(PROFILE_IMAGE_DIRECTORIES)
+        if (manifest and not is_profile_image and 
+                manifest.is_complete(url, output)):
+            estimate['status'] = 'complete'
+            return estimate
+        if journal and journal.is_dead(url):
+            estimate['status'] = 'dead'
+            return estimate
+        if downloader == HTTP_DOWNLOADER:
+            path = io.join_paths(dst, http.get_filename(url))
+            if os.path.isfile(path) and not is_profile_image:
+                estimate.update(
+                    status='complete', files=1, 
+                    existing_bytes=os.path.getsize(path))
+                return estimate
+        elif (skip_existing_directories and not entry and 
+                os.path.isdir(dst) and not is_profile_image):
+            paths, _ = manifests.list_files(dst)
+            estimate.update(
+                status='complete', files=len(paths), 
+                existing_bytes=sum(map(os.path.getsize, paths.values())))
+            return estimate
+
+        return estimate
+
+    def get_size(url: str, estimate: dict) -> None:
+        downloader = downloads[url]['downloader']
+        dst = io.join_paths(output, downloads[url]['path'])
+        if downloader == HTTP_DOWNLOADER:
+            try:
+                estimate['size'] = http.get_size(url, pool)
+            except OSError as err:
+                estimate['error'] = str(err)
+            # Resumes from the unfinished file.
+            partial_path = io.join_paths(
+                dst, http.get_filename(url) + io.TEMPORARY_SUFFIX)
+            if estimate['size'] and os.path.isfile(partial_path):
+                estimate['size'] = max(
+                    estimate['size'] - os.path.getsize(partial_path), 0)
+        elif extractors:
+            estimate['size'], estimate['error'] = extractors.get_size(
+                downloader, url)
+
+    plan = {}
+    with ThreadPoolExecutor(max_workers=max(probe_jobs, 1)) as executor:
+        estimates = dict(zip(downloads, executor.map(probe, downloads)))
+        # Sizes are probed as domain caps allow.
+        for priority, (url, estimate) in enumerate(estimates.items()):
+            if estimate['status'] == 'pending':
+                limiter.push(url, (get_size, url, estimate), priority)
+        futures = {}
+        while futures or len(limiter):
+            while len(futures) < max(probe_jobs, 1):
+                key, task = limiter.pop()
+                if task is None:
+                    break
+                futures[executor.submit(*task)] = key
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                limiter.release(futures.pop(future))
+                # Raises unexpected errors of the probe, if any.
+                future.result()
+    for url, estimate in sorted(estimates.items()):
+        domain = urllib.parse.urlsplit(url).netloc
+        _, cap = limiter.get_cap(url)
+        stats = plan.setdefault(domain, {
+            'pending': 0,
+            'complete': 0,
+            'dead': 0,
+            'errors': 0,
+            'unknown': 0,
+            'files': 0,
+            'existing_bytes': 0,
+            'bytes': 0,
+            'concurrency': max(min(jobs, cap or jobs), 1),
+            'duration': 0,
+        })
+        stats[estimate['status']] += 1
+        stats['files'] += estimate['files']
+        stats['existing_bytes'] += estimate['existing_bytes']
+        if estimate['status'] != 'pending':
+            continue
+        stats['errors'] += bool(estimate['error'])
+        size = estimate['size']
+        if size is None:
+            stats['unknown'] += 1
+            size = _get_expected_size(url, downloads[url], manifest)
+        stats['bytes'] += size
+        seconds = get_seconds(url, size)
+        if seconds is None or stats['duration'] is None:
+            stats['duration'] = None
+        else:
+            stats['duration'] += seconds / stats['concurrency']
+    return plan
+
+
+def download_media(
+        downloader: str, url: str, dst: str, quiet: bool = False, 
+        extractors: ExtractorPool = None, 
+        rate_limit: float = None) -> tuple[CompletedProcess, float]:
     """Downloads a piece of media.
 
     Parameters
     ----------
     downloader: str
-        Represents a media downloader, either 'you-get' or 'youtube-dl'.
+        Represents a media downloader, either 'you-get', 'youtube-dl' or 
+        'http' (built-in, for direct file URLs).
     url: str
         URL to download.
     dst: str
         Local download directory.
+    quiet: bool, default: False
+        Whether to capture outputs of the downloader instead of printing them.
+    extractors: ExtractorPool, default: None
+        Worker processes to run 'you-get' and 'youtube-dl' in, instead of
+        running them as new processes.
+    rate_limit: float, default: None
+        Maximum download rate in bytes per second, if any. Only applies to
+        'youtube-dl' and 'http', as 'you-get' has no rate option.
     
     Returns
     -------
+    CompletedProcess
         The execution result including the following attribute:
         - returncode: an integer representing the exit status.
             0 indicates a success while 1 indicates an error.
+    float
+        Unix timestamp when the downloader started working on the URL, or 
+        None if unknown. The outputs of a new process have to be captured to 
+        know it.
 
     Raise
     -----
         ValueError if unsupported downloader.
     """
-    if downloader == 'you-get':
-        return shell.run([
+    if extractors and downloader in ('you-get', 'youtube-dl'):
+        returncode, output, started = extractors.run(
+            downloader, url, dst, quiet, rate_limit)
+        result = CompletedProcess([downloader, url], returncode, stdout=output)
+        return result, started
+    elif downloader == 'you-get':
+        return shell.run_timed([
             'you-get', 
             '--skip-existing-file-size-check', # No overwrite
             url,
             '-o', # Output directory
             dst
-        ], capture_output=False)
+        ], capture_output=quiet)
     elif downloader == 'youtube-dl':
-        return shell.run([
+        args = [
             'youtube-dl',
             '-i', # Continues on download errors
             '-w', # No overwrite
             url,
             '-o', # Output filename template
-            io.join_paths(dst, '%(title)s-%(id)s.%(ext)s')
-        ], capture_output=False)
+            io.join_paths(dst, YOUTUBE_DL_TEMPLATE)
+        ]
+        if rate_limit:
+            args += ['--limit-rate', str(int(rate_limit))]
+        return shell.run_timed(args, capture_output=quiet)
+    elif downloader == HTTP_DOWNLOADER:
+        started = time.time()
+        consume = None
+        if rate_limit:
+            consume = ByteBucket(rate_limit).consume
+        return _download_file(url, dst, quiet, throttle=consume)[0], started
     else:
         raise ValueError(f"Unsupported downloader.")
 
 
-def _get_domain(url: str, domains: tuple[dict, list, set]) -> str:
-    for domain in domains:
-        if url.startswith(domain):
-            return domain
-    return None
+def _get_expected_size(
+        url: str, download_config: dict, manifest: DownloadManifest) -> int:
+    entry = manifest and manifest.get(url)
+    if entry and entry['files']:
+        return sum(file['size'] for file in entry['files'].values())
+    if download_config['downloader'] != HTTP_DOWNLOADER:
+        return EXPECTED_SIZES['page']
+    if http.get_filename(url).lower().endswith(IMAGE_EXTENSIONS):
+        return EXPECTED_SIZES['image']
+    return EXPECTED_SIZES['file']
+
+
+def _format_plan(plan: dict, jobs: int, rate: float = None) -> str:
+    rows = [[
+        'domain', 'pending', 'complete', 'dead', 'errors', 'unknown', 'files', 
+        'existing MiB', 'MiB', 'duration'
+    ]]
+    total = {key: 0 for key in rows[0][1:-1]}
+    durations = [stats['duration'] for stats in plan.values()]
+    for domain, stats in plan.items():
+        row = [
+            stats['pending'], stats['complete'], stats['dead'], 
+            stats['errors'], stats['unknown'], stats['files'], 
+            stats['existing_bytes'] / (1 << 20), stats['bytes'] / (1 << 20)
+        ]
+        for key, value in zip(total, row):
+            total[key] += value
+        rows.append([domain] + _format_cells(row) + [
+            _format_duration(stats['duration'])
+        ])
+
+    # Domains download in parallel, sharing the jobs and the rate.
+    duration = None
+    if None not in durations:
+        work = sum(
+            stats['duration'] * stats['concurrency'] 
+            for stats in plan.values())
+        duration = max(durations + [work / max(jobs, 1)])
+        if rate:
+            duration = max(duration, total['MiB'] * (1 << 20) / rate)
+    rows.append(['total'] + _format_cells(list(total.values())) + [
+        _format_duration(duration)
+    ])
+    return string.format_table(rows)
+
 
+def _format_cells(values: list) -> list:
+    return [
+        f'{value:.1f}' if isinstance(value, float) else str(value)
+        for value in values
+    ]
 
-def _map_domain(url: str, domains: dict) -> str:
-    domain = _get_domain(url, domains)
-    if domain:
-        return string.replace_first(url, domain, domains[domain])
-    return url
 
+def _format_duration(seconds: float) -> str:
+    if seconds is None:
+        return '-'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
 
-def _clean_domain(url: str, domains: dict) -> str:
-    domain = _get_domain(url, domains)
-    if domain:
-        for target in domains[domain]:
-            url = string.remove_last(url, target)
-    return url
 
+def _get_size(dst: str, since: float, info: dict = None) -> int:
+    # Direct file downloads know their file.
+    if info:
+        path = info['path']
+        return os.path.getsize(path) if path and os.path.isfile(path) else 0
+    # Only counts files written since the download started. Existing files
+    # that are not overwritten were not downloaded now. The change time is
+    # used, as extractors may set the modification time of a new file to that
+    # of its source.
+    paths, _ = manifests.list_files(dst)
+    return sum(
+        os.path.getsize(path) for path in paths.values()
+        if os.path.getctime(path) >= since)
 
-def _get_downloader(url: str, domains: dict) -> str:
-    domain = _get_domain(url, domains)
-    if domain:
-        return domains[domain]
-    return domains['default']
+
+def _get_error(result: CompletedProcess) -> str:
+    # The last line of the outputs usually tells the error.
+    for output in (result.stderr, result.stdout):
+        lines = (output or '').strip().splitlines()
+        if lines:
+            return lines[-1].strip()
+    return f'Exit status {result.returncode}.'
+
+
+def _refresh_file(
+        url: str, dst: str, entry: dict, quiet: bool, 
+        throttle: Callable[[int], None] = None) -> tuple[CompletedProcess, dict]:
+    try:
+        info = http.refresh_file(
+            url, dst, entry.get('etag'), entry.get('last_modified'), 
+            throttle=throttle)
+        if not quiet:
+            if info['changed']:
+                print(f"Saved '{info['path']}'.")
+            else:
+                print(f"'{url}' is not modified.")
+        return CompletedProcess([HTTP_DOWNLOADER, url], 0), info
+    except OSError as err:
+        if not quiet:
+            print(color.get_error(str(err)))
+        result = CompletedProcess([HTTP_DOWNLOADER, url], 1, stderr=str(err))
+        return result, None
+
+
+def _download_file(
+        url: str, dst: str, quiet: bool, pool: http.ConnectionPool = None, 
+        parts: int = 1, 
+        throttle: Callable[[int], None] = None) -> tuple[CompletedProcess, dict]:
+    try:
+        info = http.download_file(
+            url, dst, pool, parts=parts, throttle=throttle)
+        if not quiet:
+            print(f"Saved '{info['path']}'.")
+        return CompletedProcess([HTTP_DOWNLOADER, url], 0), info
+    except OSError as err:
+        if not quiet:
+            print(color.get_error(str(err)))
+        result = CompletedProcess([HTTP_DOWNLOADER, url], 1, stderr=str(err))
+        return result, None
 
 
 def _get_options() -> dict:
@@ -200,58 +1169,239 @@ def _get_options() -> dict:
     parser.add_argument(
         '-x', '--export', default='../data/texts', type=str, 
         help='Path to the texts output directory.')
+    parser.add_argument(
+        '-d', '--database', default=None, type=str, 
+        help='Path to an SQLite archive database. If set, valid URLs are '
+             'upserted into it as well, as media paths of the user.')
+    parser.add_argument(
+        '-u', '--user', default=None, type=str,
+        help='Path to the raw user info file of the account the URLs belong '
+             'to. Used with --database. Defaults to '
+             f"'{USER_FILENAME}' in the texts output directory.")
+    parser.add_argument(
+        '--delta', default=None, type=str, 
+        help='Path to the new URLs file written by the Twitter downloader. If '
+             'set (and a valid URLs file exists), only new URLs are '
+             'downloaded. Consumed URLs are removed from it afterwards, except '
+             'failed ones.')
+    parser.add_argument(
+        '--resolve-cache', default=None, type=str, 
+        help='Path to the cache of resolved shortened URLs. Defaults to '
+             f"'{RESOLUTION_CACHE_FILENAME}' in the texts output directory.")
+    parser.add_argument(
+        '--resolve-ttl', default=30, type=float, 
+        help='Number of days before a resolved URL expires in the cache.')
+    parser.add_argument(
+        '--resolve-jobs', default=8, type=int, 
+        help='Maximum number of concurrent requests to resolve URLs, and to '
+             'probe sizes with --plan.')
+    parser.add_argument(
+        '-j', '--jobs', default=1, type=int, 
+        help='Number of concurrent downloads. Caps per domain are set by '
+             "'concurrency' in the domains config file.")
+    parser.add_argument(
+        '--in-process', action='store_true', default=False, 
+        help='Runs you-get and youtube-dl in long-lived worker processes (one '
+             'per job) that import them once, instead of a new process per '
+             'URL.')
+    parser.add_argument(
+        '--batch', nargs='*', default=[], choices=('you-get', 'youtube-dl'), 
+        help='Downloaders whose URLs are grouped into batches. Each batch runs '
+             'in a single extractor session of a worker process (implies '
+             '--in-process).')
+    parser.add_argument(
+        '--manifest', default=None, type=str, 
+        help='Path to the download manifest. Verifiably complete URLs in it '
+             'are skipped. Defaults to '
+             f"'{MANIFEST_FILENAME}' in the texts output directory.")
+    parser.add_argument(
+        '--verify', action='store_true', default=False, 
+        help='Verifies file hashes of complete URLs in the manifest in '
+             'addition to sizes.')
+    parser.add_argument(
+        '--order', nargs='*', default=list(DEFAULT_ORDER), 
+        choices=ORDER_POLICIES, 
+        help='Policies ordering downloads, each breaking ties of the previous '
+             'ones.')
+    parser.add_argument(
+        '--retries', default=2, type=int, 
+        help='Maximum number of retries per URL on transient errors.')
+    parser.add_argument(
+        '--retry-delay', default=5, type=float, 
+        help='Delay ceiling in seconds of the first retry. Doubles per retry.')
+    parser.add_argument(
+        '--journal', default=None, type=str, 
+        help='Path to the failure journal. Defaults to '
+             f"'{JOURNAL_FILENAME}' in the texts output directory.")
+    parser.add_argument(
+        '--dead-after', default=3, type=int, 
+        help='Number of failed runs before a URL is considered dead.')
+    parser.add_argument(
+        '--dead-ttl', default=30, type=float, 
+        help='Number of days dead URLs are skipped for.')
+    parser.add_argument(
+        '--metrics', default=None, type=str, 
+        help='Path to the JSONL metrics file that every download attempt is '
+             'appended to. Defaults to '
+             f"'{METRICS_FILENAME}' in the texts output directory.")
+    parser.add_argument(
+        '--max-rate', default=None, type=parse_size, 
+        help='Maximum total download rate in bytes per second, with an '
+             "optional unit. e.g. '10M'. Split equally among jobs. Limits "
+             f"'{HTTP_DOWNLOADER}' and 'youtube-dl' downloads. 'you-get' has "
+             'no rate option and is not limited.')
+    parser.add_argument(
+        '--max-write-rate', default=None, type=parse_size, 
+        help='Maximum total disk write rate in bytes per second, with an '
+             "optional unit. e.g. '50M'. Only limits "
+             f"'{HTTP_DOWNLOADER}' downloads, as extractors write on their own.")
+    parser.add_argument(
+        '--min-free-space', default='1G', type=parse_size, 
+        help='Pauses downloads while free disk space of the media output '
+             "directory is below this size. e.g. '1G'. 0 to disable.")
+    parser.add_argument(
+        '--plan', action='store_true', default=False, 
+        help='Reports expected bytes, file counts and durations per domain '
+             'without downloading or writing anything but the resolution '
+             'cache. Sizes are probed with HEAD requests, or metadata of '
+             'extractors. Durations are estimated from past metrics.')
     parser.add_argument(
         '--skip-existing-directories', action='store_true', default=False, 
-        help='Skips existing directories without checking files inside.')
+        help='Skips existing directories without checking files inside, for '
+             'URLs not in the manifest yet. e.g. Downloaded before the '
+             'manifest existed.')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     options = _get_options()
-    io.make_directory(options.output)
-    urls_raw = io.load_json(options.input)
     domains = io.load_json(options.settings)
+    urls_path = io.join_paths(options.export, URL_OUTPUT_FILENAME)
 
     # Stage 1: Configs downloads
     print(color.get_info('Configuring downloads...'))
-    downloads, urls = config_downloads(urls_raw, domains)
-    urls_path = io.join_paths(options.export, URL_OUTPUT_FILENAME)
-    if os.path.isfile(urls_path):
-        archive_path = io.archive_file(urls_path)
-        print(f"Archived '{urls_path}' to '{archive_path}'.")
-    io.dump_json(urls, urls_path)
-    print(f"Saved {len(urls)} valid URLs to '{urls_path}''.")
+    use_delta = (
+        options.delta and os.path.isfile(options.delta) and 
+        os.path.isfile(urls_path))
+    if use_delta:
+        # Only new URLs are configured and downloaded.
+        urls_raw = io.load_json(options.delta)
+        print(f"Loaded {len(urls_raw)} new URLs from '{options.delta}'.")
+    else:
+        urls_raw = io.load_json(options.input)
+
+    cache_path = options.resolve_cache or io.join_paths(
+        options.export, RESOLUTION_CACHE_FILENAME)
+    cache = ExpiringCache(cache_path, options.resolve_ttl * 24 * 3600)
+    resolved = resolve_urls(
+        urls_raw, domains.get('resolve', []), cache, options.resolve_jobs)
+    cache.save()
+    print(f"Resolved {len(resolved)} shortened URLs.")
+
+    if use_delta:
+        downloads, urls_configured = config_downloads(
+            urls_raw, domains, resolved)
+        urls = io.load_json(urls_path)
+        urls.update(urls_configured)
+    else:
+        downloads, urls = config_downloads(urls_raw, domains, resolved)
+        urls_configured = urls
+    if not options.plan:
+        if not use_delta and os.path.isfile(urls_path):
+            archive_path = io.archive_file(urls_path)
+            print(f"Archived '{urls_path}' to '{archive_path}'.")
+        io.dump_json(urls, urls_path, atomic=True)
+        print(f"Saved {len(urls)} valid URLs to '{urls_path}''.")
+    if options.database and not options.plan:
+        user_path = options.user or io.join_paths(
+            options.export, USER_FILENAME)
+        database = ArchiveDatabase(options.database)
+        database.upsert_media_paths(io.load_json(user_path)['id'], urls)
+        database.close()
+        print(f"Upserted {len(urls)} valid URLs into '{options.database}'.")
     print()
 
-    # Stage 2: Downloads media
-    print(color.get_info(f'{len(downloads)} media to download.'))
-    error_count = 0
-    skip_count = 0
-    for i, url in enumerate(downloads):
-        downloader = downloads[url]['downloader']
-        dst = io.join_paths(options.output, downloads[url]['path'])
-        print(color.get_highlight(
-            f"({i + 1}/{len(downloads)}) "
-            f"Downloding media from '{url}' to '{dst}'..."))
+    manifest_path = options.manifest or io.join_paths(
+        options.export, MANIFEST_FILENAME)
+    manifest = DownloadManifest(manifest_path)
+    journal_path = options.journal or io.join_paths(
+        options.export, JOURNAL_FILENAME)
+    journal = FailureJournal(
+        journal_path, options.dead_after, options.dead_ttl * 24 * 3600)
+    metrics_path = options.metrics or io.join_paths(
+        options.export, METRICS_FILENAME)
 
-        if (options.skip_existing_directories and 
-                os.path.isdir(dst) and 
-                not dst.endswith(PROFILE_IMAGE_DIRECTORIES)):
-            print(f"Skips download as '{dst}' exists.")
-            skip_count += 1
-            continue
+    if options.plan:
+        # Stage 2: Plans downloads
+        print(color.get_info(f'Planning {len(downloads)} media...'))
+        extractors = ExtractorPool(options.jobs)
+        plan = plan_downloads(
+            downloads, options.output, options.jobs, 
+            domains.get('concurrency'), options.skip_existing_directories, 
+            extractors, manifest, journal, 
+            telemetry.load_records(metrics_path), options.resolve_jobs)
+        extractors.close()
+        print(_format_plan(plan, options.jobs, options.max_rate))
+        sys.exit()
 
-        result = download_media(downloader, url, dst)
-        if result.returncode:
-            error_count += 1
+    # Stage 2: Downloads media
+    print(color.get_info(f'{len(downloads)} media to download.'))
+    io.make_directory(options.output)
+    extractors = None
+    if options.in_process or options.batch:
+        extractors = ExtractorPool(options.jobs)
+    throttle = Throttle(
+        options.output, options.max_rate, options.max_write_rate, 
+        options.min_free_space, options.jobs)
+    downloaders = {config['downloader'] for config in downloads.values()}
+    if options.max_rate and 'you-get' in downloaders:
+        print(color.get_warning(
+            "WARNING: Downloads with 'you-get' are not limited by --max-rate."))
+    if options.max_write_rate and downloaders - {HTTP_DOWNLOADER}:
+        print(color.get_warning(
+            'WARNING: Only direct file downloads are limited by '
+            '--max-write-rate.'))
+    metrics = MetricsLog(metrics_path)
+    results = download_all(
+        downloads, options.output, options.jobs, domains.get('concurrency'),
+        options.skip_existing_directories, extractors, options.batch, 
+        manifest, options.verify, journal, options.retries, 
+        options.retry_delay, domains.get('ranges'), options.order, throttle,
+        metrics)
+    metrics.close()
+    print(f"Appended {len(metrics.records)} metrics records to "
+          f"'{metrics_path}'.")
+    manifest.save()
+    print(f"Saved the download manifest to '{manifest_path}'.")
+    journal.save()
+    print(f"Saved the failure journal to '{journal_path}'.")
+    if extractors:
+        extractors.close()
     print()
+
+    if options.delta:
+        # Keeps failed and dead URLs for the next run.
+        urls_pending = get_pending_urls(
+            urls_raw, urls_configured, downloads, results, journal)
+        io.dump_json(urls_pending, options.delta, atomic=True)
+        print(
+            f"Kept {len(urls_pending)} failed or dead URLs in "
+            f"'{options.delta}'.")
     
     messages = []
+    error_count = list(results.values()).count(FAILURE)
     if error_count > 0:
         messages.append(color.get_error(f'Failure: {error_count}'))
+    skip_count = list(results.values()).count(SKIP)
     if skip_count > 0:
         messages.append(color.get_warning(f'Skip: {skip_count}'))
-    success_count = len(downloads) - error_count - skip_count
+    success_count = list(results.values()).count(SUCCESS)
     if success_count > 0:
         messages.append(color.get_ok(f'Success: {success_count}'))
+
+    if metrics.records:
+        for key in ('domain', 'downloader'):
+            summary = telemetry.summarize(metrics.records, key)
+            print(telemetry.format_summary(summary, key))
+            print()
     print(', '.join(messages) + '.')
@@ -0,0 +1,289 @@
+"""This script serves a local stand-in of the Twitter API v2 for benchmarking.
+
+Only the endpoints used by the Twitter downloader are implemented:
+- User lookup by username: GET /2/users/by/username/:username
+- User Tweet timeline: GET /2/users/:id/tweets
+  (with 'pagination_token', 'since_id', 'start_time', 'end_time')
+- Tweets lookup: GET /2/tweets?ids=...
+
+Synthetic Tweets are generated deterministically from the seed, with a
+configurable volume, response latency and rate limit. Each endpoint returns
+'x-rate-limit-*' headers and a 429 response once its limit is exceeded, so
+pagination, concurrency and rate limit scheduling can be benchmarked offline.
+Any credentials are accepted.
+
+Example usage:
+    python mock_twitter_server.py --port 8080 --tweets 10000 --latency 0.2
+    python twitter_downloader.py --api-host "http://localhost:8080" ...
+"""
+
+from __future__ import annotations
+import argparse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+from utils import color, rate_limit # pylint: disable=import-error
+
+
+# Snowflake id of the oldest synthetic Tweet and the step between Tweets.
+BASE_TWEET_ID = 1156716507042205696
+TWEET_ID_STEP = 1 << 22
+
+# Time format of the Twitter API.
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+
+# The timeline endpoint only reaches the most recent Tweets.
+TIMELINE_CAP = 3200
+
+
+class MockTwitter:
+    """This class generates synthetic users and Tweets and tracks rate limits."""
+    def __init__(
+            self, tweet_count: int, rate_limit_count: int, window: float,
+            media_ratio: float, seed: int) -> None:
+        self.tweet_count = tweet_count
+        self.rate_limit_count = rate_limit_count
+        self.window = window
+        self.media_ratio = media_ratio
+        self.seed = seed
+        self.start_time = datetime(2019, 8, 1, tzinfo=timezone.utc)
+        self.interval = timedelta(hours=1)
+        self.quotas = {}
+        self.lock = threading.Lock()
+
+    def consume(self, endpoint: str) -> dict:
+        """Consumes a request of the endpoint. Returns the rate limit state."""
+        with self.lock:
+            now = time.time()
+            quota = self.quotas.get(endpoint)
+            if not quota or now >= quota['reset']:
+                quota = {'remaining': self.rate_limit_count,
+                         'reset': now + self.window}
+                self.quotas[endpoint] = quota
+            quota['remaining'] -= 1
+            return {
+                'x-rate-limit-limit': str(self.rate_limit_count),
+                'x-rate-limit-remaining': str(max(quota['remaining'], 0)),
+                'x-rate-limit-reset': str(int(quota['reset'] + 0.999)),
+                'exceeded': quota['remaining'] < 0,
+            }
+
+    def get_user(self, username: str) -> dict:
+        return {
+            'id': '1000',
+            'name': username,
+            'username': username,
+            'created_at': self.start_time.strftime(TIME_FORMAT),
+            'description': f'Synthetic user {username}.',
+            'profile_image_url':
+                f'https://pbs.twimg.com/profile_images/1000/{username}_normal.jpg',
+            'protected': False,
+            'public_metrics': {
+                'followers_count': 100, 'following_count': 10,
+                'tweet_count': self.tweet_count, 'listed_count': 1,
+            },
+        }
+
+    def get_tweet(self, index: int) -> tuple[dict, list]:
+        """Generates the Tweet at the index (0 is the oldest) and its media."""
+        tid = BASE_TWEET_ID + index * TWEET_ID_STEP
+        generator = random.Random(self.seed * 1000003 + index)
+        tweet = {
+            'id': str(tid),
+            'text': f'Synthetic Tweet #{index} #mock https://t.co/{index}',
+            'created_at':
+                (self.start_time + self.interval * index).strftime(TIME_FORMAT),
+            'source': 'Mock Twitter',
+            'public_metrics': {
+                'retweet_count': generator.randrange(100),
+                'reply_count': generator.randrange(100),
+                # Likes keep growing, so refreshed metrics differ.
+                'like_count': generator.randrange(1000) + int(time.time()) // 60,
+                'quote_count': generator.randrange(10),
+            },
+            'entities': {
+                'hashtags': [{'start': 20, 'end': 25, 'tag': 'mock'}],
+                'urls': [],
+            },
+        }
+
+        media = []
+        if generator.random() < self.media_ratio:
+            media_key = f'3_{tid}'
+            if generator.random() < 0.8:
+                media.append({
+                    'media_key': media_key, 'type': 'photo',
+                    'url': f'https://pbs.twimg.com/media/{media_key}.jpg',
+                })
+            else:
+                media.append({
+                    'media_key': media_key, 'type': 'video',
+                    'variants': [
+                        {'content_type': 'video/mp4', 'bit_rate': bit_rate,
+                         'url': f'https://video.twimg.com/ext_tw_video/{tid}/'
+                                f'vid/{bit_rate}/{media_key}.mp4'}
+                        for bit_rate in (256000, 832000, 2176000)
+                    ],
+                })
+            tweet['attachments'] = {'media_keys': [media_key]}
+            tweet['entities']['urls'].append({
+                'start': 26, 'end': 49, 'url': f'https://t.co/{index}',
+                'display_url': f'pic.twitter.com/{index}',
+                'expanded_url':
+                    f'https://twitter.com/mock/status/{tid}/photo/1',
+            })
+        return tweet, media
+
+    def get_index(self, tid: str) -> int:
+        offset = int(tid) - BASE_TWEET_ID
+        if offset < 0 or offset % TWEET_ID_STEP:
+            return None
+        index = offset // TWEET_ID_STEP
+        return index if index < self.tweet_count else None
+
+    def get_timeline(self, params: dict) -> dict:
+        """Gets a page of the timeline, most recent Tweets first."""
+        newest = self.tweet_count - 1
+        oldest = max(self.tweet_count - TIMELINE_CAP, 0)
+        if 'since_id' in params:
+            since = (int(params['since_id']) - BASE_TWEET_ID) // TWEET_ID_STEP
+            oldest = max(oldest, since + 1)
+        if 'start_time' in params:
+            oldest = max(oldest, self._get_time_index(params['start_time'], 1))
+        if 'end_time' in params:
+            newest = min(newest, self._get_time_index(params['end_time'], 0))
+
+        max_results = int(params.get('max_results', 10))
+        offset = int(params.get('pagination_token', 0))
+        indices = range(newest - offset, oldest - 1, -1)[:max_results]
+        next_offset = offset + max_results
+        return self._get_page(
+            indices, params,
+            next_offset if newest - next_offset >= oldest else None)
+
+    def get_tweets(self, params: dict) -> dict:
+        indices = [self.get_index(tid) for tid in params['ids'].split(',')]
+        return self._get_page(
+            [index for index in indices if index is not None], params, None)
+
+    def _get_page(self, indices: list, params: dict, next_offset: int) -> dict:
+        data = []
+        media = []
+        for index in indices:
+            tweet, tweet_media = self.get_tweet(index)
+            data.append(tweet)
+            media.extend(tweet_media)
+
+        page = {'meta': {'result_count': len(data)}}
+        if data:
+            page['data'] = data
+            page['meta']['newest_id'] = data[0]['id']
+            page['meta']['oldest_id'] = data[-1]['id']
+        if media and 'attachments.media_keys' in params.get('expansions', ''):
+            page['includes'] = {'media': media}
+        if next_offset is not None:
+            page['meta']['next_token'] = str(next_offset)
+        return page
+
+    def _get_time_index(self, timestamp: str, ceiling: int) -> int:
+        moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        steps = (moment - self.start_time) / self.interval
+        index = int(steps)
+        if ceiling and index < steps:
+            index += 1
+        return index
+
+
+class MockTwitterHandler(BaseHTTPRequestHandler):
+    """This class serves requests to the mock Twitter API."""
+    twitter = None
+    latency = 0.0
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        route = url.path
+        time.sleep(self.latency)
+
+        quota = self.twitter.consume(rate_limit.get_endpoint('GET', route))
+        if quota.pop('exceeded'):
+            self._send(429, {'title': 'Too Many Requests'}, quota)
+            return
+
+        username = re.fullmatch(r'/2/users/by/username/(\w+)', route)
+        if username:
+            self._send(200, {'data': self.twitter.get_user(username[1])}, quota)
+        elif re.fullmatch(r'/2/users/\d+/tweets', route):
+            self._send(200, self.twitter.get_timeline(params), quota)
+        elif route == '/2/tweets' and 'ids' in params:
+            self._send(200, self.twitter.get_tweets(params), quota)
+        else:
+            self._send(404, {'title': 'Not Found Error'}, quota)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict) -> None:
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _get_options() -> dict:
+    parser = argparse.ArgumentParser(
+        description='Serves a local mock of the Twitter API for benchmarking.')
+    parser.add_argument(
+        '--host', default='localhost', type=str,
+        help='Host to listen on.')
+    parser.add_argument(
+        '--port', default=8080, type=int,
+        help='Port to listen on.')
+    parser.add_argument(
+        '--tweets', default=5000, type=int,
+        help='Number of synthetic Tweets of each user.')
+    parser.add_argument(
+        '--latency', default=0.0, type=float,
+        help='Delay in seconds before each response.')
+    parser.add_argument(
+        '--rate-limit', default=900, type=int,
+        help='Number of requests allowed per endpoint per window.')
+    parser.add_argument(
+        '--window', default=900, type=float,
+        help='Length of the rate limit window in seconds.')
+    parser.add_argument(
+        '--media-ratio', default=0.3, type=float,
+        help='Ratio of Tweets with attached media.')
+    parser.add_argument(
+        '--seed', default=0, type=int,
+        help='Seed of the synthetic Tweets.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = _get_options()
+    MockTwitterHandler.twitter = MockTwitter(
+        options.tweets, options.rate_limit, options.window,
+        options.media_ratio, options.seed)
+    MockTwitterHandler.latency = options.latency
+
+    server = ThreadingHTTPServer((options.host, options.port), MockTwitterHandler)
+    print(color.get_info(
+        f'Serving {options.tweets} synthetic Tweets per user on '
+        f'http://{options.host}:{options.port}...'))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print(color.get_ok('Done.'))
@@ -22,7 +22,8 @@ Change Example:
     ]
 
 The default
-- Raw Tweets file locates at '../data/texts/tweets_raw.json'.
+- Raw Tweets store locates at '../data/texts/tweets_raw'. A legacy raw Tweets
+  JSON file is accepted as well.
 - Raw user file locates at '../data/texts/user_raw.json'.
 - Reference/URLs file locates at '../data/texts/urls.json'.
 - Media config file locates at 'configs/media.json'.
@@ -36,7 +37,7 @@ The final HTML file by default locates at the project root directory.
 
 Example usage:
     python path_resolver.py \
-        -i "path/to/the/raw/tweets/file" \
+        -i "path/to/the/raw/tweets/store" \
         -u "path/to/the/raw/user/file" \
         -r "path/to/the/reference/urls/file" \
         -s "path/to/the/media/config/file" \
@@ -48,11 +49,14 @@ Example usage:
 from __future__ import annotations
 import argparse
 from datetime import datetime
+import functools
 import os
 from PIL import Image
 import shutil
+from typing import Callable
 
-from utils import color, html, io, shell, video # pylint: disable=import-error
+from utils import color, html, io, shell, store, video # pylint: disable=import-error
+from utils.database import ArchiveDatabase # pylint: disable=import-error
 
 
 # Output files
@@ -142,6 +146,56 @@ def get_tweets_media_paths(
     return sort_media_paths(new_parent, url, paths)
 
 
+def get_tweet_media(
+        tweet: dict, get_media_directory: Callable[[str], str], media: str,
+        dst: str, video_settings: dict, image_settings: dict, 
+        keep_thumbnails: bool) -> list:
+    """Resolves paths to all media attached to a Tweet.
+
+    Duplicated URLs within the same Tweet are resolved once.
+
+    Parameters
+    ----------
+    tweet: dict
+        A raw Tweet.
+    get_media_directory: Callable[[str], str]
+        Maps an expanded URL to its local media directory name, or None if the
+        URL has no media. e.g. `dict.get` of the reference URLs.
+    media: str
+        Path to the media directory.
+    dst: str
+        Destination directory of media relative in the final HTML.
+    video_settings: dict
+        See `get_tweets_media_paths`.
+    image_settings: dict
+        See `get_tweets_media_paths`.
+    keep_thumbnails: bool
+        Whether or not to keep existing thumbnails.
+
+    Returns
+    -------
+    list
+        Media paths used in the final HTML. See `get_tweets_media_paths`.
+    """
+    paths = []
+    seen_urls = set()
+    for url in tweet['text'].get('urls', []):
+        expanded_url = url['expanded_url']
+        if expanded_url in seen_urls:
+            continue
+        seen_urls.add(expanded_url)
+
+        directory = get_media_directory(expanded_url)
+        if directory is None:
+            continue
+        local_directory = io.join_paths(media, directory)
+        if os.path.isdir(local_directory):
+            paths.extend(get_tweets_media_paths(
+                local_directory, dst, expanded_url, video_settings, 
+                image_settings, keep_thumbnails))
+    return paths
+
+
 def get_profile_image_path(
         src: str, dst: str, url: str, image_settings: dict) -> dict:
     """Resolve path to a profile image.
@@ -346,8 +400,8 @@ def _get_options() -> dict:
     parser = argparse.ArgumentParser(
         description='Maps URLs in Tweets to local paths if possible.')
     parser.add_argument(
-        '-i', '--input', default='../data/texts/tweets_raw.json', type=str, 
-        help='Path to the raw Tweets file.')
+        '-i', '--input', default='../data/texts/tweets_raw', type=str, 
+        help='Path to the raw Tweets store (or file).')
     parser.add_argument(
         '-u', '--user', default='../data/texts/user_raw.json', type=str, 
         help='Path to the raw user info file.')
@@ -368,6 +422,11 @@ def _get_options() -> dict:
         '-x', '--export', default='data/media', type=str, 
         help='Path to the media directory relative to the final HTML file.'
              'The HTML file by default locates at the project root directory.')
+    parser.add_argument(
+        '-d', '--database', default=None, type=str, 
+        help='Path to an SQLite archive database. If set, Tweets and URLs of '
+             'the user are read from it and resolved media are written back '
+             'to it instead of the Tweets output file.')
     parser.add_argument(
         '--keep-thumbnails', action='store_true', default=False, 
         help='Keeps existing thumbnails.')
@@ -377,24 +436,32 @@ def _get_options() -> dict:
 if __name__ == '__main__':
     options = _get_options()
     io.make_directory(options.output)
-    tweets = io.load_json(options.input)
-    urls = io.load_json(options.references)
     user = io.load_json(options.user)
     settings = io.load_json(options.settings)
     video_settings = settings['video']
     image_settings = settings['image']
 
+    database = None
+    if options.database:
+        database = ArchiveDatabase(options.database)
+        get_media_directory = functools.partial(
+            database.get_media_path, user['id'])
+    else:
+        get_media_directory = io.load_json(options.references).get
+
     # Stage 1: Resolves paths to the avatar and the profile banner images.
     print(color.get_info(
         f"Resolving paths to profile images of {user['username']}..."))
     profile_image_url = user['profile_image_url']
-    local_directory = io.join_paths(options.media, urls[profile_image_url])
+    local_directory = io.join_paths(
+        options.media, get_media_directory(profile_image_url))
     user['profile_image_url'] = get_profile_image_path(
         local_directory, options.export, profile_image_url, image_settings)
 
     if 'profile_banner_url' in user:
         profile_banner_url = user['profile_banner_url']
-        local_directory = io.join_paths(options.media, urls[profile_banner_url])
+        local_directory = io.join_paths(
+            options.media, get_media_directory(profile_banner_url))
         user['profile_banner_url'] = get_profile_image_path(
             local_directory, options.export, profile_banner_url, image_settings)
     else:
@@ -409,38 +476,42 @@ if __name__ == '__main__':
     print()
 
     # Stage 2: Resolves paths to images and video files attached to Tweets.
-    print(color.get_info(f'Media paths of {len(tweets)} Tweets to resolve.'))
-    for i, (tid, tweet) in enumerate(tweets.items()):
-        text = tweet['text']
-        if 'urls' not in text:
+    if database:
+        # Tweets are streamed so the archive is never fully loaded.
+        tweet_count = database.count_tweets(user['id'])
+        tweets = ((str(tweet['id']), tweet)
+                  for tweet in database.iterate_tweets(user['id']))
+    else:
+        tweets = store.load_records(options.input)
+        tweet_count = len(tweets)
+        tweets = tweets.items()
+
+    print(color.get_info(f'Media paths of {tweet_count} Tweets to resolve.'))
+    for i, (tid, tweet) in enumerate(tweets):
+        if 'urls' not in tweet['text']:
             continue
 
         print(color.get_highlight(
-            f'({i + 1}/{len(tweets)}) Resolving media paths of Tweet #{tid}...'))
-        # Removes duplicated URLs within the same Tweet
-        seen_urls = set()
-        for url in text['urls']:
-            expanded_url = url['expanded_url']
-            if (expanded_url in urls) and (expanded_url not in seen_urls):
-                local_directory = io.join_paths(
-                    options.media, urls[expanded_url])
-                
-                if os.path.isdir(local_directory):
-                    local_paths = get_tweets_media_paths(
-                        local_directory, options.export, expanded_url,
-                        video_settings, image_settings, options.keep_thumbnails)
-                    if local_paths:
-                        if 'media' not in tweet:
-                            tweet['media'] = []
-                        tweet['media'].extend(local_paths)
-                seen_urls.add(expanded_url)
-
-    tweets_path = io.join_paths(options.output, TWEETS_OUTPUT_FILENAME)
-    if os.path.isfile(tweets_path):
-        archive_path = io.archive_file(tweets_path)
-        print(f"Archived '{tweets_path}' to '{archive_path}'.")
-    io.dump_json(tweets, tweets_path)
-    print(f"Saved {len(tweets)} path-resolved Tweets to '{tweets_path}'.")
+            f'({i + 1}/{tweet_count}) Resolving media paths of Tweet #{tid}...'))
+        local_paths = get_tweet_media(
+            tweet, get_media_directory, options.media, options.export,
+            video_settings, image_settings, options.keep_thumbnails)
+        if database:
+            database.set_tweet_media(tid, local_paths)
+        elif local_paths:
+            tweet['media'] = local_paths
+
+    if database:
+        database.close()
+        print(f"Saved {tweet_count} path-resolved Tweets to '{options.database}'.")
+    else:
+        tweets = dict(tweets)
+        tweets_path = io.join_paths(options.output, TWEETS_OUTPUT_FILENAME)
+        if os.path.isfile(tweets_path):
+            archive_path = io.archive_file(tweets_path)
+            print(f"Archived '{tweets_path}' to '{archive_path}'.")
+        io.dump_json(tweets, tweets_path)
+        print(f"Saved {len(tweets)} path-resolved Tweets to '{tweets_path}'.")
     print()
     
     print(color.get_ok('Done.'))
@@ -5,6 +5,9 @@ The default
 - Twitter setting file locates at 'configs/twitter.json'.
 - Output directory locates at '../data/texts'.
 
+Tweets are saved to an append-only segment store 'tweets_raw' under the output
+directory. See `utils.store`.
+
 Example usage:
     python twitter_downloader.py \
         -c "path/to/twitter/credential/file" \
@@ -14,60 +17,273 @@ Example usage:
 
 from __future__ import annotations
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 import os
+import threading
 from typing import Union
 
-import tweepy
+import requests
 from tweepy.client import Client
+from tweepy.errors import TooManyRequests
+from tweepy.media import Media
 from tweepy.tweet import Tweet
 
-from utils import color, io, string # pylint: disable=import-error
+from utils import color, io, rate_limit, string # pylint: disable=import-error
+from utils.database import ArchiveDatabase # pylint: disable=import-error
+from utils.rate_limit import RateLimitScheduler # pylint: disable=import-error
+from utils.store import SegmentStore # pylint: disable=import-error
 
 
 # Output filenames.
 USER_RAW_OUTPUT_FILENAME = 'user_raw.json'
-TWEETS_RAW_OUTPUT_FILENAME = 'tweets_raw.json'
+TWEETS_RAW_OUTPUT_DIRNAME = 'tweets_raw'
+# Replaced by the Tweets store. Imported on the first run.
+TWEETS_RAW_LEGACY_FILENAME = 'tweets_raw.json'
 URLS_RAW_OUTPUT_FILENAME = 'urls_raw.json'
+URLS_RAW_MARK_FILENAME = 'urls_raw_mark.json'
+# New URLs not yet consumed by the media downloader.
+URLS_RAW_DELTA_FILENAME = 'urls_raw_delta.json'
+CHECKPOINT_FILENAME = 'tweets_checkpoint.json'
+
+# Host of the Twitter API used by the client.
+TWITTER_API_HOST = 'https://api.twitter.com'
+
+# Maximum number of Tweet ids per lookup request.
+LOOKUP_BATCH_SIZE = 100
+
+# Checkpoint key of the regular (non-backfill) Tweets download.
+TIMELINE_CHECKPOINT_KEY = 'timeline'
+
+
+class HostSession(requests.Session):
+    """This class redirects requests to the Twitter API to another host.
+
+    e.g. A local mock server. See `mock_twitter_server`.
+    """
+    def __init__(self, host: str) -> None:
+        super().__init__()
+        self.host = host.rstrip('/')
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        if url.startswith(TWITTER_API_HOST):
+            url = self.host + url[len(TWITTER_API_HOST):]
+        return super().request(method, url, *args, **kwargs)
+
+
+class ScheduledClient(Client):
+    """This class sends every API request through a rate limit scheduler.
+
+    Requests are paced by the 'x-rate-limit-*' headers of previous responses. A
+    429 response parks the request until the rate limit window resets, then
+    retries it.
+    """
+    def __init__(
+            self, *args, scheduler: RateLimitScheduler = None, 
+            api_host: str = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler if scheduler else RateLimitScheduler()
+        if api_host:
+            self.session = HostSession(api_host)
+
+    def request(
+            self, method: str, route: str, params: dict = None, 
+            json: dict = None, user_auth: bool = False):
+        endpoint = rate_limit.get_endpoint(method, route)
+        while True:
+            self.scheduler.acquire(endpoint)
+            try:
+                response = super().request(
+                    method, route, params=params, json=json, 
+                    user_auth=user_auth)
+            except TooManyRequests as err:
+                wait_time = self.scheduler.park(endpoint, err.response.headers)
+                print(color.get_warning(
+                    f"WARNING: Rate limit of '{endpoint}' exceeded. "
+                    f'Waiting {int(wait_time)} seconds...'))
+                continue
+            self.scheduler.update(endpoint, response.headers)
+            return response
+
+
+class PageCheckpoint:
+    """This class persists fetched pages of Tweets as they arrive.
+
+    Each page is appended to the Tweets store (and the database, if any),
+    then the pagination token of the next page is saved to the checkpoint file
+    atomically. An interrupted download can therefore resume from the last
+    saved page. The checkpoint also keeps the since id (and time windows) of
+    the interrupted download, as the Tweets store alone would suggest a more
+    recent since id and leave a gap behind.
+
+    Checkpoint format:
+    {
+        'since_id': str('Since id of the interrupted download.'),
+        'windows': [
+            [str('Start time of a backfill window.'), str('End time of a backfill window.')]
+        ],
+        'pages': {
+            str('Timeline or window key.'): {
+                'pagination_token': str('Token of the next page to fetch.'),
+                'done': bool('Whether all pages are fetched.')
+            }
+        }
+    }
+    """
+    def __init__(
+            self, path: str, tweets_store: SegmentStore, tweets: dict,
+            database: ArchiveDatabase = None, author_id: int = None) -> None:
+        self.path = path
+        self.tweets_store = tweets_store
+        self.tweets = tweets
+        self.database = database
+        self.author_id = author_id
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.isfile(path):
+            self.state = io.load_json(path)
+
+    def exists(self) -> bool:
+        return bool(self.state)
+
+    def start(self, since_id: str, windows: list = None) -> None:
+        """Starts a new download unless resuming one of the same kind."""
+        if self.state and ('windows' in self.state) == bool(windows):
+            return
+        self.state = {'since_id': since_id, 'pages': {}}
+        if windows:
+            self.state['windows'] = [
+                [start_time.isoformat(), end_time.isoformat()]
+                for start_time, end_time in windows
+            ]
+        self._dump()
+
+    def get_since_id(self) -> str:
+        return self.state.get('since_id')
+
+    def get_windows(self) -> list:
+        """Gets the time windows of the checkpointed backfill, if any."""
+        return [
+            (datetime.fromisoformat(start_time), datetime.fromisoformat(end_time))
+            for start_time, end_time in self.state.get('windows', [])
+        ]
+
+    def restart(self) -> None:
+        """Discards saved pagination tokens but keeps the since id."""
+        self.state['pages'] = {}
+        self._dump()
+
+    def get_page(self, key: str) -> dict:
+        """Gets the progress of a timeline or window, or None if not started."""
+        with self.lock:
+            return self.state['pages'].get(key)
+
+    def save_page(self, key: str, tweets: dict, pagination_token: str) -> dict:
+        """Persists a page and the token of the next one.
+
+        Returns
+        -------
+        dict
+            New or changed Tweets in the page.
+        """
+        with self.lock:
+            new_tweets = {
+                tid: tweet for tid, tweet in tweets.items() 
+                if self.tweets.get(tid) != tweet
+            }
+            self.tweets_store.append(new_tweets)
+            if self.database:
+                self.database.upsert_tweets(new_tweets, self.author_id)
+            self.state['pages'][key] = {
+                'pagination_token': pagination_token,
+                'done': pagination_token is None,
+            }
+            self._dump()
+            return new_tweets
 
+    def clear(self) -> None:
+        """Removes the checkpoint once the download completes."""
+        self.state = {}
+        if os.path.isfile(self.path):
+            os.remove(self.path)
 
-def archive_tweets(path: str) -> tuple[dict, str]:
-    """Loads and archives the existing Tweets file. Extracts the since id as well.
+    def _dump(self) -> None:
+        io.dump_json(self.state, self.path, atomic=True)
+
+
+def archive_tweets(path: str, legacy_path: str) -> tuple[SegmentStore, dict, str]:
+    """Opens the Tweets store and loads existing Tweets. Extracts the since id as well.
+
+    A legacy Tweets JSON file is imported into an empty store as its first
+    segment, then archived and removed.
     
     Parameters
     ----------
     path: str
-        Path to the Tweets file.
+        Path to the Tweets store directory.
+    legacy_path: str
+        Path to the legacy Tweets file.
 
     Returns
     -------
+    SegmentStore:
+        Tweets store. New Tweets should be appended to it.
     dict:
         Existing Tweets.
     str:
         Since id. Tells the Twitter client to returns results with a Tweet ID 
         greater than (that is, more recent than) the specified 'since' Tweet ID.
     """
-    tweets = {}
+    tweets_store = SegmentStore(path)
+    if tweets_store.is_empty() and os.path.isfile(legacy_path):
+        tweets_store.append(io.load_json(legacy_path))
+        archive_path = io.archive_file(legacy_path)
+        os.remove(legacy_path)
+        print(f"Imported '{legacy_path}' into '{path}' and archived it to "
+              f"'{archive_path}'.")
+
+    tweets = tweets_store.load()
     since_id = None
-    if os.path.isfile(path):
-        tweets = io.load_json(path)
-        if tweets:
-            since_id = str(sorted(tweets)[-1])
-            archive_path = io.archive_file(path)
-            print(f"Archived '{path}' to '{archive_path}'.")
-    return tweets, since_id
+    if not tweets_store.is_empty():
+        since_id = str(tweets_store.get_max_id())
+    return tweets_store, tweets, since_id
+
 
+def load_urls(path: str, mark_path: str) -> tuple[dict, set]:
+    """Loads the existing URLs index and the ids of Tweets collected into it.
 
-def archive_urls(path: str) -> None:
-    """Archives the existing URLs file.
+    Tweets are not stored in id order: a resumed download or a backfill stores
+    older Tweets after newer ones. Hence every collected Tweet id is kept
+    rather than the most recent one.
 
     Parameters
     ----------
     path: str
         Path to the URLs file.
+    mark_path: str
+        Path to the mark file listing ids of Tweets whose URLs are collected.
+        Format:
+        {
+            'tweet_ids': [
+                str('Unique identifier of a Tweet.')
+            ]
+        }
+
+    Returns
+    -------
+    dict:
+        Existing mappings from URLs to their local download destinations.
+    set:
+        Ids of Tweets whose URLs are collected. Empty if URLs of all Tweets 
+        have to be collected, e.g. with a mark file of an older format.
     """
+    urls = {}
+    collected = set()
     if os.path.isfile(path):
-        archive_path = io.archive_file(path)
-        print(f"Archived '{path}' to '{archive_path}'.")
+        urls = io.load_json(path)
+        if os.path.isfile(mark_path):
+            collected = set(io.load_json(mark_path).get('tweet_ids', []))
+    return urls, collected
 
 
 def archive_user(path: str) -> None:
@@ -83,9 +299,127 @@ def archive_user(path: str) -> None:
         print(f"Archived '{path}' to '{archive_path}'.")
 
 
-def get_client(credentials: dict) -> Client:
+def backfill_tweets(
+        client: Client, uid: int, tweet_parameters: dict, windows: list,
+        workers: int, checkpoint: PageCheckpoint) -> dict:
+    """Fetches Tweets of several time windows concurrently.
+
+    Each window is paginated by its own worker. All workers share the same
+    client. Results are merged in the calling thread as windows complete, so
+    the total time is bounded by the slowest window rather than the sum of all
+    pages. Note that the client still returns up to the most recent 3200 Tweets.
+
+    Parameters
+    ----------
+    client: Client
+        Authenticated Twitter client.
+    uid: int
+        User id.
+    tweet_parameters: dict
+        Additional parameters involved in the search. See `get_tweets`.
+    windows: list
+        Time windows to fetch. See `get_time_windows`.
+        Format:
+        [
+            (datetime('Start time of the window.'), datetime('End time of the window.'))
+        ]
+    workers: int
+        Maximum number of windows to fetch at the same time.
+    checkpoint: PageCheckpoint
+        Persists each page as it arrives. Windows already completed in the
+        checkpoint are skipped, and unfinished ones are resumed.
+
+    Returns
+    -------
+    dict:
+        New or changed Tweets of all windows. See `get_tweets`.
+    """
+    tweets = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(
+                paginate_tweets, client, uid, tweet_parameters, checkpoint,
+                _get_window_key(start_time, end_time), start_time=start_time,
+                end_time=end_time): (start_time, end_time)
+            for start_time, end_time in windows
+        }
+        for future in as_completed(futures):
+            start_time, end_time = futures[future]
+            window_tweets = future.result()
+            tweets.update(window_tweets)
+            print(
+                f'Fetched {len(window_tweets)} new tweets between '
+                f'{start_time.isoformat()} and {end_time.isoformat()}. '
+                f'({len(tweets)} in total)')
+    return tweets
+
+
+def get_account_output(output: str, username: str, multiple: bool) -> str:
+    """Gets the output directory of an account.
+
+    Parameters
+    ----------
+    output: str
+        Output directory.
+    username: str
+        Username of the account.
+    multiple: bool
+        Whether or not the settings list multiple accounts. If so, each account
+        gets a subdirectory named after its username.
+
+    Returns
+    -------
+    str:
+        Output directory of the account.
+    """
+    if multiple:
+        return io.join_paths(output, username)
+    return output
+
+
+def get_accounts(settings: dict) -> list:
+    """Gets the accounts to archive from the Twitter settings.
+
+    Settings of a single account ('username', 'profile_banner_url' and 
+    'birthday' at the top level) are still supported.
+    Format:
+    {
+        'accounts': [
+            {
+                'username': str('The Twitter handle (screen name) of this user.'),
+                'profile_banner_url': str('The URL to the banner image for this user.'),
+                'birthday': str('Birthday of this user.')
+            }
+        ]
+    }
+
+    Parameters
+    ----------
+    settings: dict
+        Twitter settings.
+
+    Returns
+    -------
+    list:
+        Settings of each account.
+    """
+    if 'accounts' in settings:
+        return settings['accounts']
+    account = {'username': settings['username']}
+    for key in ('profile_banner_url', 'birthday'):
+        if key in settings:
+            account[key] = settings[key]
+    return [account]
+
+
+def get_client(
+        credentials: dict, scheduler: RateLimitScheduler = None,
+        api_host: str = None) -> Client:
     """Authenticates Twitter credentials.
 
+    All requests of the client are scheduled under the rate limits of their
+    endpoints. See `ScheduledClient`.
+
     Credentials format:
     {
         'access_token': str('Twitter API Access Token.'),
@@ -99,23 +433,167 @@ def get_client(credentials: dict) -> Client:
     ----------
     credentials: dict
         Twitter credentials.
+    scheduler: RateLimitScheduler, default: None
+        Rate limit scheduler shared by clients with the same credentials. A
+        new one is created if not given.
+    api_host: str, default: None
+        Sends requests to this host instead of the Twitter API. e.g. the URL 
+        of a local mock server.
     
     Returns
     -------
     Client:
         Authenticated Twitter client.
     """
-    return tweepy.Client(
+    return ScheduledClient(
         access_token=credentials['access_token'],
         access_token_secret=credentials['access_token_secret'],
         bearer_token=credentials['bearer_token'],
         consumer_key=credentials['consumer_key'],
-        consumer_secret=credentials['consumer_secret'])
+        consumer_secret=credentials['consumer_secret'],
+        scheduler=scheduler,
+        api_host=api_host)
+
+
+def paginate_tweets(
+        client: Client, uid: int, tweet_parameters: dict, 
+        checkpoint: PageCheckpoint, key: str, since_id: str = None,
+        start_time: datetime = None, end_time: datetime = None,
+        early_stop: bool = False, verbose: bool = False) -> dict:
+    """Fetches all pages of Tweets and checkpoints each page as it arrives.
+
+    Parameters
+    ----------
+    client: Client
+        Authenticated Twitter client.
+    uid: int
+        User id.
+    tweet_parameters: dict
+        Additional parameters involved in the search. See `get_tweets`.
+    checkpoint: PageCheckpoint
+        Persists each page as it arrives. If the checkpoint has the key, the 
+        download resumes from its saved pagination token.
+    key: str
+        Checkpoint key of the timeline or window.
+    since_id: str, default: None
+        See `get_tweets`.
+    start_time: datetime, default: None
+        See `get_tweets`.
+    end_time: datetime, default: None
+        See `get_tweets`.
+    early_stop: bool, default: False
+        Test: Early stops after the 1st page.
+    verbose: bool, default: False
+        Whether or not to print the progress of each page.
+
+    Returns
+    -------
+    dict:
+        New or changed Tweets fetched in this run. See `get_tweets`.
+    """
+    tweets = {}
+    pagination_token = None
+    page = checkpoint.get_page(key)
+    if page:
+        if page['done']:
+            return tweets
+        pagination_token = page['pagination_token']
+
+    while True:
+        new_tweets, pagination_token = get_tweets(
+            client, uid, tweet_parameters, pagination_token=pagination_token,
+            since_id=since_id, start_time=start_time, end_time=end_time)
+        tweets.update(checkpoint.save_page(key, new_tweets, pagination_token))
+        if verbose:
+            print(f'Fetched {len(tweets)} new tweets.')
+
+        if not pagination_token:
+            break
+        if early_stop:
+            print(color.get_warning(
+                'Early stop of Tweets download after the 1st page.'))
+            break
+    return tweets
+
+
+def get_public_metrics(client: Client, ids: list) -> dict:
+    """Fetches the latest public metrics of Tweets by their ids.
+
+    Parameters
+    ----------
+    client: Client
+        Authenticated Twitter client.
+    ids: list
+        Tweet ids. Up to 100 per request.
+
+    Returns
+    -------
+    dict:
+        Public metrics of Tweets. Deleted or protected Tweets are excluded.
+        Format:
+        {
+            str('Unique identifier of this Tweet.'): {
+                'like_count': int('Number of Likes of this Tweet.'),
+                'quote_count': int('Number of times this Tweet has been Retweeted with a comment.'),
+                'reply_count': int('Number of Replies of this Tweet.'),
+                'retweet_count': int('Number of times this Tweet has been Retweeted.')
+            }
+        }
+
+    Raises
+    ------
+    TypeError
+        If cannot get Tweets response from the client.
+    """
+    response = client.get_tweets(
+        ids, user_auth=True, tweet_fields=['public_metrics'])
+    if not response:
+        raise TypeError('Failed to fetch Tweets.')
+
+    metrics = {}
+    for tweet_response in response.data or []:
+        if tweet_response.public_metrics:
+            metrics[str(tweet_response.id)] = _parse_public_metrics(
+                tweet_response.public_metrics)
+    return metrics
+
+
+def get_time_windows(
+        start_time: datetime, end_time: datetime, count: int) -> list:
+    """Splits a time range into consecutive windows of equal length.
+
+    Parameters
+    ----------
+    start_time: datetime
+        Start of the time range. e.g. Creation time of the account.
+    end_time: datetime
+        End of the time range.
+    count: int
+        Number of windows.
+
+    Returns
+    -------
+    list
+        Consecutive time windows covering the whole range.
+        Format:
+        [
+            (datetime('Start time of the window.'), datetime('End time of the window.'))
+        ]
+    """
+    count = max(1, count)
+    step = (end_time - start_time) / count
+    windows = []
+    for i in range(count):
+        window_end = end_time if i == count - 1 else start_time + step * (i + 1)
+        windows.append((start_time + step * i, window_end))
+    return windows
 
 
 def get_tweets(
         client: Client, uid: int, tweet_parameters: dict, 
-        pagination_token: str = None, since_id: str = None) -> tuple[dict, str]:
+        pagination_token: str = None, since_id: str = None,
+        start_time: datetime = None, end_time: datetime = None
+        ) -> tuple[dict, str]:
     """Fetches Tweets.
 
     Note that the client returns up to the most recent 3200 Tweets.
@@ -133,6 +611,12 @@ def get_tweets(
             'max_results': int('Specifies the number of Tweets to try and retrieve, up to a maximum of 100 per distinct request.'),
             'tweet_fields': [
                 str('Selects which specific Tweet fields will deliver in each returned Tweet object.')
+            ],
+            'expansions': [
+                str('Optional. Expands objects referenced in the Tweets. e.g. attachments.media_keys')
+            ],
+            'media_fields': [
+                str('Optional. Selects which specific media fields will deliver in each expanded media object. e.g. url, variants')
             ]
         }
     pagination_token: str, default: None
@@ -140,6 +624,10 @@ def get_tweets(
     since_id: str, default: None
         Tells the Twitter client to returns results with a Tweet ID greater than 
         (that is, more recent than) the specified 'since' Tweet ID.
+    start_time: datetime, default: None
+        The oldest UTC timestamp from which the Tweets will be provided.
+    end_time: datetime, default: None
+        The newest UTC timestamp to which the Tweets will be provided.
     
     Returns
     -------
@@ -155,6 +643,13 @@ def get_tweets(
                 'reply_count': int('Number of Replies of this Tweet.'),
                 'retweet_count': int('Number of times this Tweet has been Retweeted.'),
                 'source': str('The name of the app the user Tweeted from.'),
+                'attachments': [
+                    {
+                        'media_key': str('Unique identifier of the attached media.'),
+                        'type': str('Media type, either photo, video or animated_gif.'),
+                        'url': str('Direct URL of the media file. The best-bitrate variant for videos.')
+                    }
+                ],
                 'text': {
                     'content': str('The content of the Tweet.'),
                     'hashtags': [
@@ -192,19 +687,31 @@ def get_tweets(
     # TODO: Gets complete original Tweets in Retweets. The Twitter API only
     #       returns the first few lines of the original Tweets.
     tweets = {}
+    # Tweepy rejects unset field parameters.
+    media_parameters = {
+        key: tweet_parameters[key] 
+        for key in ('expansions', 'media_fields') if key in tweet_parameters
+    }
     response = client.get_users_tweets(
         uid, user_auth=True, max_results=tweet_parameters['max_results'], 
         pagination_token=pagination_token,
         since_id=since_id,
-        tweet_fields=tweet_parameters['tweet_fields'])
+        start_time=start_time,
+        end_time=end_time,
+        tweet_fields=tweet_parameters['tweet_fields'],
+        **media_parameters)
     if not response:
         raise TypeError('Failed to fetch Tweets.')
     if not response.data:
         print(color.get_warning(f'WARNING: No (new) Tweets fetched.'))
         return tweets, None
 
+    media = {
+        media_response.media_key: media_response 
+        for media_response in response.includes.get('media', [])
+    }
     for tweet_response in response.data:
-        tweet = _parse_tweet(tweet_response)
+        tweet = _parse_tweet(tweet_response, media)
         tweets[str(tweet['id'])] = tweet
 
     if 'next_token' in response.meta:
@@ -214,8 +721,56 @@ def get_tweets(
     return tweets, pagination_token
 
 
+def refresh_metrics(client: Client, tweets: dict, workers: int) -> dict:
+    """Refreshes public metrics of existing Tweets.
+
+    Tweet ids are looked up in batches of 100, several batches at the same
+    time. Only the metric attributes are updated.
+
+    Parameters
+    ----------
+    client: Client
+        Authenticated Twitter client.
+    tweets: dict
+        Existing Tweets. See `get_tweets`.
+    workers: int
+        Maximum number of batches to fetch at the same time.
+
+    Returns
+    -------
+    dict:
+        Tweets whose metrics have changed, with the metrics updated. Tweets in 
+        the input are not modified.
+    """
+    tids = sorted(tweets)
+    batches = [
+        tids[i:i + LOOKUP_BATCH_SIZE] 
+        for i in range(0, len(tids), LOOKUP_BATCH_SIZE)
+    ]
+    updated_tweets = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(get_public_metrics, client, batch) 
+            for batch in batches
+        ]
+        for i, future in enumerate(as_completed(futures)):
+            for tid, metrics in future.result().items():
+                tweet = tweets[tid]
+                if any(tweet.get(key) != value for key, value in metrics.items()):
+                    updated_tweets[tid] = {**tweet, **metrics}
+            print(
+                f'({i + 1}/{len(batches)}) Refreshed metrics. '
+                f'({len(updated_tweets)} changed in total)')
+    return updated_tweets
+
+
 def get_urls(user: dict, tweets: dict) -> dict:
     """Gets URLs in user info and Tweets.
+
+    See `update_urls` to collect URLs incrementally.
+
+    Direct URLs of attached media (see `get_tweets`) are mapped to the same
+    destination as the media link of their Tweet.
     
     Parameters
     ----------
@@ -234,18 +789,56 @@ def get_urls(user: dict, tweets: dict) -> dict:
         }
     """
     urls = {}
+    update_urls(urls, user, tweets)
+    return urls
+
+
+def update_urls(urls: dict, user: dict, tweets: dict) -> dict:
+    """Adds URLs in user info and Tweets to the existing URLs.
+
+    Existing URLs keep their destinations. Profile image URLs are always part
+    of the delta, as profile images may get updated.
+
+    Parameters
+    ----------
+    urls: dict
+        Existing mappings from URLs to their local download destinations. 
+        Updated in place. See `get_urls`.
+    user: dict
+        User info
+    tweets: dict
+        Tweets to collect URLs from. e.g. Tweets newer than the ones collected
+        last time.
+
+    Returns
+    -------
+    dict:
+        Delta. Mappings from new (and profile image) URLs to their local 
+        download destinations.
+    """
+    delta = {}
     if 'profile_banner_url' in user:
-        urls[user['profile_banner_url']] = 'banner'
+        delta[user['profile_banner_url']] = 'banner'
     if 'profile_image_url' in user:
-        urls[user['profile_image_url']] = 'avatar'
+        delta[user['profile_image_url']] = 'avatar'
+    urls.update(delta)
+
+    def _add_url(url: str, path: str) -> str:
+        if url not in urls:
+            urls[url] = delta[url] = path
+        return urls[url]
 
     for tid, tweet in sorted(tweets.items()):
         if 'text' in tweet and 'urls' in tweet['text']:
             for idx, url_info in enumerate(tweet['text']['urls']):
                 expanded_url = url_info['expanded_url']
-                if expanded_url not in urls:
-                    urls[expanded_url] = f'{tid}_{idx}'
-    return urls
+                path = _add_url(expanded_url, f'{tid}_{idx}')
+                if _is_attachment_url(expanded_url, tid):
+                    # Attached media share the directory of the Tweet's own 
+                    # media link, so they are resolved along with it.
+                    for attachment in tweet.get('attachments', []):
+                        _add_url(attachment['url'], path)
+    return delta
 
 
 def get_user(client: Client, username: str, user_parameters: dict) -> dict:
@@ -373,7 +966,12 @@ def get_user(client: Client, username: str, user_parameters: dict) -> dict:
     return user
 
 
-def _parse_tweet(response: Tweet) -> dict:
+def _get_window_key(start_time: datetime, end_time: datetime) -> str:
+    return f'{start_time.isoformat()}/{end_time.isoformat()}'
+
+
+def _parse_tweet(response: Tweet, media: dict = None) -> dict:
+    media = media or {}
     tweet = {
         'id': response.id,
         'text': {
@@ -387,10 +985,17 @@ def _parse_tweet(response: Tweet) -> dict:
     
     public_metrics = response.public_metrics
     if public_metrics:
-        tweet['retweet_count'] = public_metrics['retweet_count']
-        tweet['reply_count'] = public_metrics['reply_count']
-        tweet['like_count'] = public_metrics['like_count']
-        tweet['quote_count'] = public_metrics['quote_count']
+        tweet.update(_parse_public_metrics(public_metrics))
+
+    if response.attachments and 'media_keys' in response.attachments:
+        attachments = []
+        for media_key in response.attachments['media_keys']:
+            if media_key in media:
+                attachment = _parse_media(media[media_key])
+                if attachment:
+                    attachments.append(attachment)
+        if attachments:
+            tweet['attachments'] = attachments
 
     entities = response.entities
     if entities:
@@ -403,40 +1008,44 @@ def _parse_tweet(response: Tweet) -> dict:
     return tweet
 
 
-def _get_options() -> dict:
-    parser = argparse.ArgumentParser(
-        description='Downloads user info and tweets from Twitter.')
-    parser.add_argument(
-        '-c', '--credentials', default='configs/credentials.json', type=str, 
-        help='Path to Twitter credential file.')
-    parser.add_argument(
-        '-s', '--settings', default='configs/twitter.json', type=str, 
-        help='Path to Twitter setting file')
-    parser.add_argument(
-        '-o', '--output', default='../data/texts', type=str, 
-        help='Path to output directory.')
+def _is_attachment_url(url: str, tid: str) -> bool:
+    return f'/status/{tid}/photo/' in url or f'/status/{tid}/video/' in url
 
-    # Testing arguments
-    parser.add_argument(
-        '--early-stop', action='store_true', default=False, 
-        help='Test: Early stops during the Tweets download (after the 2nd page).')
-    parser.add_argument(
-        '--use-existing-tweets', action='store_true', default=False, 
-        help="Test: Skips the Tweets download. Uses existing Tweets for testing.")
-    return parser.parse_args()
 
+def _parse_media(response: Media) -> dict:
+    # Photos have a direct URL. Videos and GIFs have variants of different
+    # bitrates instead.
+    url = response.data.get('url')
+    variants = [
+        variant for variant in response.data.get('variants', []) 
+        if variant.get('content_type') == 'video/mp4'
+    ]
+    if variants:
+        url = max(variants, key=lambda variant: variant.get('bit_rate', 0))['url']
+    if not url:
+        return None
+    return {
+        'media_key': response.media_key,
+        'type': response.type,
+        'url': url,
+    }
 
-if __name__ == '__main__':
-    options = _get_options()
-    io.make_directory(options.output)
-    credentials = io.load_json(options.credentials)['twitter']
-    settings = io.load_json(options.settings)
-    tweet_parameters = settings['tweet_parameters']
-    username = settings['username']
 
-    print(color.get_info('Authenticating...'))
-    client = get_client(credentials)
-    print()
+def _parse_public_metrics(public_metrics: dict) -> dict:
+    return {
+        'retweet_count': public_metrics['retweet_count'],
+        'reply_count': public_metrics['reply_count'],
+        'like_count': public_metrics['like_count'],
+        'quote_count': public_metrics['quote_count'],
+    }
+
+
+def _archive_account(
+        client: Client, account: dict, settings: dict, output: str,
+        database: ArchiveDatabase, options: argparse.Namespace) -> None:
+    username = account['username']
+    tweet_parameters = settings['tweet_parameters']
+    io.make_directory(output)
 
     # Stage 1: Gets user info
     print(color.get_info(f"Fetching user info of {username}..."))
@@ -444,54 +1053,206 @@ if __name__ == '__main__':
 
     # TODO: Finds an automatic method to get the URL of the banner image and
     #       the birthday.
-    if 'profile_banner_url' in settings:
-        user['profile_banner_url'] = settings['profile_banner_url']
-    if 'birthday' in settings:
-        user['birthday'] = settings['birthday']
+    if 'profile_banner_url' in account:
+        user['profile_banner_url'] = account['profile_banner_url']
+    if 'birthday' in account:
+        user['birthday'] = account['birthday']
 
-    user_path = io.join_paths(options.output, USER_RAW_OUTPUT_FILENAME)
+    user_path = io.join_paths(output, USER_RAW_OUTPUT_FILENAME)
     archive_user(user_path)
     io.dump_json(user, user_path)
     print(f"Saved user info of {username} to '{user_path}'.")
+    if database:
+        database.upsert_user(user)
+        print(f"Upserted user info of {username} into '{options.database}'.")
     print()
 
     # Stage 2: Gets Tweets
     print(color.get_info(f"Fetching Tweet(s) of {username}..."))
-    tweets_path = io.join_paths(options.output, TWEETS_RAW_OUTPUT_FILENAME)
-    tweets, since_id = archive_tweets(tweets_path)
+    tweets_path = io.join_paths(output, TWEETS_RAW_OUTPUT_DIRNAME)
+    tweets_store, tweets, since_id = archive_tweets(
+        tweets_path, 
+        io.join_paths(output, TWEETS_RAW_LEGACY_FILENAME))
+    # Also tags Tweets stored before the database kept their authors.
+    if database and database.count_tweets(user['id']) < len(tweets):
+        database.upsert_tweets(tweets, user['id'])
+        print(f"Imported {len(tweets)} tweets into '{options.database}'.")
 
     if options.use_existing_tweets:
         print(color.get_warning('Using existing Tweets.'))
     else:
-        # TODO: Gets Tweets older then the most recent 3200 ones.
-        new_tweets, pagination_token = get_tweets(
-            client, user['id'], settings['tweet_parameters'], since_id=since_id)
-        tweets.update(new_tweets)
-        print(f'Fetched {len(tweets)} tweets.')
+        checkpoint = PageCheckpoint(
+            io.join_paths(output, CHECKPOINT_FILENAME), tweets_store, 
+            tweets, database, user['id'])
+        if checkpoint.exists():
+            # Newer pages of the interrupted download are already stored.
+            since_id = checkpoint.get_since_id()
+            if options.resume:
+                print(color.get_warning('Resuming from the last checkpoint.'))
+            else:
+                print(color.get_warning(
+                    'WARNING: Found an interrupted download. Restarting it. '
+                    'Use --resume to continue from the last checkpoint.'))
+                checkpoint.restart()
+        elif options.resume:
+            print(color.get_warning('WARNING: No checkpoint to resume from.'))
 
-        while pagination_token:
-            new_tweets, pagination_token = get_tweets(
-                client, user['id'], settings['tweet_parameters'], 
-                pagination_token=pagination_token, since_id=since_id)
-            tweets.update(new_tweets)
-            print(f'Fetched {len(tweets)} tweets.')
+        if options.backfill:
+            windows = checkpoint.get_windows()
+            if not windows:
+                # The API rejects end times too close to the request time.
+                end_time = datetime.now(timezone.utc) - timedelta(seconds=30)
+                start_time = datetime.fromisoformat(user['created_at'])
+                windows = get_time_windows(
+                    start_time, end_time, options.windows)
+            checkpoint.start(None, windows)
+            print(
+                f'Backfilling {len(windows)} time window(s) with '
+                f'{options.workers} worker(s)...')
+            new_tweets = backfill_tweets(
+                client, user['id'], tweet_parameters, windows,
+                options.workers, checkpoint)
+        else:
+            # TODO: Gets Tweets older then the most recent 3200 ones.
+            checkpoint.start(since_id)
+            new_tweets = paginate_tweets(
+                client, user['id'], tweet_parameters, checkpoint,
+                TIMELINE_CHECKPOINT_KEY, since_id=since_id, 
+                early_stop=options.early_stop, verbose=True)
+        if not options.early_stop:
+            checkpoint.clear()
 
-            if options.early_stop:
-                print(color.get_warning(
-                    'Early stop of Tweets download after the 2nd page.'))
-                break
+        tweets.update(new_tweets)
+        print(
+            f"Saved {len(new_tweets)} new tweets of {username} to "
+            f"'{tweets_path}'. ({len(tweets)} in total)")
+        print()
 
-        io.dump_json(tweets, tweets_path)
-        print(f"Saved {len(tweets)} tweets of {username} to '{tweets_path}'.")
+    if options.refresh_metrics:
+        print(color.get_info(
+            f'Refreshing metrics of {len(tweets)} tweets of {username}...'))
+        updated_tweets = refresh_metrics(client, tweets, options.workers)
+        tweets_store.append(updated_tweets)
+        if database:
+            database.upsert_tweets(updated_tweets, user['id'])
+        tweets.update(updated_tweets)
+        print(
+            f"Saved {len(updated_tweets)} tweets with changed metrics to "
+            f"'{tweets_path}'.")
         print()
 
     # Stage 3: Collects URLs
-    print(color.get_info(f'Collecting URLs...'))
-    urls = get_urls(user, tweets)
-    urls_path = io.join_paths(options.output, URLS_RAW_OUTPUT_FILENAME)
-    archive_urls(urls_path)
-    io.dump_json(urls, urls_path)
+    print(color.get_info(f'Collecting URLs of {username}...'))
+    urls_path = io.join_paths(output, URLS_RAW_OUTPUT_FILENAME)
+    mark_path = io.join_paths(output, URLS_RAW_MARK_FILENAME)
+    urls, collected = load_urls(urls_path, mark_path)
+    unseen_tweets = {
+        tid: tweet for tid, tweet in tweets.items() if tid not in collected
+    }
+    delta = update_urls(urls, user, unseen_tweets)
+    io.dump_json(urls, urls_path, atomic=True)
     print(f"Saved {len(urls)} URLs to '{urls_path}'.")
+
+    # Deltas accumulate until the media downloader consumes them.
+    delta_path = io.join_paths(output, URLS_RAW_DELTA_FILENAME)
+    if os.path.isfile(delta_path):
+        delta = {**io.load_json(delta_path), **delta}
+    io.dump_json(delta, delta_path, atomic=True)
+    print(f"Saved {len(delta)} new URLs to '{delta_path}'.")
+
+    collected.update(unseen_tweets)
+    io.dump_json({'tweet_ids': sorted(collected)}, mark_path, atomic=True)
     print()
 
+
+def _get_options() -> dict:
+    parser = argparse.ArgumentParser(
+        description='Downloads user info and tweets from Twitter.')
+    parser.add_argument(
+        '-c', '--credentials', default='configs/credentials.json', type=str, 
+        help='Path to Twitter credential file.')
+    parser.add_argument(
+        '-s', '--settings', default='configs/twitter.json', type=str, 
+        help='Path to Twitter setting file')
+    parser.add_argument(
+        '-o', '--output', default='../data/texts', type=str, 
+        help='Path to output directory. Each account gets its own '
+             "subdirectory if the settings have an 'accounts' list.")
+    parser.add_argument(
+        '-d', '--database', default=None, type=str, 
+        help='Path to an SQLite archive database. If set, user info and new '
+             'Tweets are upserted into it as well.')
+
+    parser.add_argument(
+        '--parallel-accounts', default=4, type=int, 
+        help='Number of accounts to archive concurrently.')
+    parser.add_argument(
+        '--resume', action='store_true', default=False, 
+        help='Resumes an interrupted Tweets download from its last checkpoint.')
+    parser.add_argument(
+        '--backfill', action='store_true', default=False, 
+        help='Re-archives all Tweets by fetching time windows concurrently '
+             'instead of paginating since the latest Tweet.')
+    parser.add_argument(
+        '--windows', default=16, type=int, 
+        help='Number of time windows to split the account lifetime into. '
+             'Used with --backfill.')
+    parser.add_argument(
+        '--workers', default=4, type=int, 
+        help='Number of windows (with --backfill) or Tweet lookup batches '
+             '(with --refresh-metrics) to fetch concurrently.')
+    parser.add_argument(
+        '--refresh-metrics', action='store_true', default=False, 
+        help='Refreshes Like, Retweet, Reply and Quote counts of all existing '
+             'Tweets by looking up their ids in batches.')
+
+    # Testing arguments
+    parser.add_argument(
+        '--api-host', default=None, type=str, 
+        help='Test: Sends requests to this host instead of the Twitter API. '
+             'e.g. "http://localhost:8080" of mock_twitter_server.py.')
+    parser.add_argument(
+        '--early-stop', action='store_true', default=False, 
+        help='Test: Early stops during the Tweets download (after the 1st page).')
+    parser.add_argument(
+        '--use-existing-tweets', action='store_true', default=False, 
+        help="Test: Skips the Tweets download. Uses existing Tweets for testing.")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    options = _get_options()
+    credentials = io.load_json(options.credentials)['twitter']
+    settings = io.load_json(options.settings)
+    accounts = get_accounts(settings)
+
+    print(color.get_info('Authenticating...'))
+    client = get_client(credentials, api_host=options.api_host)
+    print()
+
+    database = None
+    if options.database:
+        database = ArchiveDatabase(options.database)
+
+    # All accounts share the client, thus the rate limits of all endpoints.
+    # Their requests interleave under the same budget.
+    with ThreadPoolExecutor(
+            max_workers=max(1, options.parallel_accounts)) as executor:
+        futures = {
+            executor.submit(
+                _archive_account, client, account, settings,
+                get_account_output(
+                    options.output, account['username'], 
+                    'accounts' in settings),
+                database, options): account['username']
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            future.result()
+            print(color.get_ok(f'Archived {futures[future]}.'))
+            print()
+
+    if database:
+        database.close()
+
     print(color.get_ok('Done.'))
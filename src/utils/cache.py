@@ -0,0 +1,64 @@
+"""This module persists key-value entries that expire after a time to live.
+
+The cache is a JSON file mapping each key to its value and the time it was set:
+    {
+        str('Key'): {
+            'value': Any JSON serializable value,
+            'time': float('Unix timestamp of the last update.')
+        }
+    }
+
+Usage example:
+    cache = ExpiringCache('path/to/cache.json', ttl=30 * 24 * 3600)
+    if cache.get('key') is None:
+        cache.set('key', 'value')
+    cache.save()
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Any
+
+from . import io # pylint: disable=import-error
+
+
+class ExpiringCache:
+    """This class reads and sets entries of an on-disk cache. It is thread-safe."""
+    def __init__(self, path: str, ttl: float) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path and os.path.isfile(path):
+            self.entries = io.load_json(path)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Gets the value of the key, or the default if missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or time.time() - entry['time'] > self.ttl:
+                return default
+            return entry['value']
+
+    def set(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = {'value': value, 'time': time.time()}
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def save(self) -> None:
+        """Writes unexpired entries to the cache file atomically."""
+        with self.lock:
+            now = time.time()
+            self.entries = {
+                key: entry for key, entry in self.entries.items()
+                if now - entry['time'] <= self.ttl
+            }
+            entries = dict(self.entries)
+        if self.path:
+            io.make_directory(os.path.dirname(self.path) or '.')
+            io.dump_json(entries, self.path, atomic=True)
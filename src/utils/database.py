@@ -0,0 +1,264 @@
+"""This module stores the archive in an SQLite database.
+
+The database is an optional backend for the user info, Tweets, URLs and media
+paths. Tweets are indexed by their snowflake id, creation time, hashtags and
+expanded URLs, so point queries and incremental updates do not require loading
+the whole archive into memory.
+
+Several accounts may share a database. Tweets are tagged with the id of their
+author, and media paths are kept per author, as each account has its own media
+directory.
+
+Usage example:
+    database = ArchiveDatabase('path/to/archive.db')
+    database.upsert_tweets(tweets, user['id'])
+    for tweet in database.iterate_tweets(user['id'], start_time='2021-01-01'):
+        ...
+    database.close()
+"""
+
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+from typing import Iterator
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_username ON users (username);
+
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY,
+    author_id INTEGER,
+    created_at TEXT,
+    data TEXT NOT NULL,
+    media TEXT
+);
+CREATE INDEX IF NOT EXISTS tweets_created_at ON tweets (created_at);
+CREATE INDEX IF NOT EXISTS tweets_author_id ON tweets (author_id, id);
+
+CREATE TABLE IF NOT EXISTS hashtags (
+    tweet_id INTEGER NOT NULL REFERENCES tweets (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tweet_id, tag)
+);
+CREATE INDEX IF NOT EXISTS hashtags_tag ON hashtags (tag);
+
+CREATE TABLE IF NOT EXISTS urls (
+    tweet_id INTEGER NOT NULL REFERENCES tweets (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    expanded_url TEXT NOT NULL,
+    PRIMARY KEY (tweet_id, idx)
+);
+CREATE INDEX IF NOT EXISTS urls_expanded_url ON urls (expanded_url);
+
+CREATE TABLE IF NOT EXISTS media_paths (
+    author_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (author_id, url)
+);
+'''
+
+# Upgrades databases created before Tweets and media paths were kept per
+# author. Tweets without an author are tagged when their account is archived
+# again. Media paths are upserted again by every media download.
+MIGRATIONS = {
+    'tweets': 'ALTER TABLE tweets ADD COLUMN author_id INTEGER',
+    'media_paths': 'DROP TABLE media_paths',
+}
+
+
+class ArchiveDatabase:
+    """This class reads and upserts archive data in an SQLite database."""
+    def __init__(self, path: str) -> None:
+        # Stages may share the database from worker threads. Writes are
+        # serialized so their transactions do not interleave.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self._migrate()
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def upsert_user(self, user: dict) -> None:
+        """Inserts or replaces the user info. See `twitter_downloader.get_user`."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO users (id, username, data) '
+                'VALUES (?, ?, ?)',
+                (user['id'], user['username'], _dumps(user)))
+
+    def get_user(self, username: str) -> dict:
+        """Gets the user info by username, or None if not found."""
+        row = self.connection.execute(
+            'SELECT data FROM users WHERE username = ?',
+            (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def upsert_tweets(self, tweets: dict, author_id: int) -> int:
+        """Inserts or replaces Tweets along with their hashtags and URLs.
+
+        Resolved media of existing Tweets are kept.
+
+        Parameters
+        ----------
+        tweets: dict
+            Tweets. See `twitter_downloader.get_tweets`.
+        author_id: int
+            User id of the author of the Tweets.
+
+        Returns
+        -------
+        int
+            Number of Tweets upserted.
+        """
+        with self.lock, self.connection:
+            for tweet in tweets.values():
+                tid = tweet['id']
+                self.connection.execute(
+                    'INSERT INTO tweets (id, author_id, created_at, data) '
+                    'VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET '
+                    'author_id = excluded.author_id, '
+                    'created_at = excluded.created_at, data = excluded.data',
+                    (tid, author_id, tweet.get('created_at'), _dumps(tweet)))
+                self.connection.execute(
+                    'DELETE FROM hashtags WHERE tweet_id = ?', (tid,))
+                self.connection.execute(
+                    'DELETE FROM urls WHERE tweet_id = ?', (tid,))
+
+                text = tweet.get('text', {})
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO hashtags (tweet_id, tag) '
+                    'VALUES (?, ?)',
+                    [(tid, hashtag['tag'])
+                     for hashtag in text.get('hashtags', [])])
+                self.connection.executemany(
+                    'INSERT INTO urls (tweet_id, idx, expanded_url) '
+                    'VALUES (?, ?, ?)',
+                    [(tid, idx, url['expanded_url'])
+                     for idx, url in enumerate(text.get('urls', []))])
+        return len(tweets)
+
+    def set_tweet_media(self, tid: int, media: list) -> None:
+        """Sets the resolved media paths of a Tweet. See `path_resolver`."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE tweets SET media = ? WHERE id = ?',
+                (_dumps(media) if media else None, int(tid)))
+
+    def get_tweet(self, tid: int) -> dict:
+        """Gets a Tweet by its id, or None if not found."""
+        row = self.connection.execute(
+            'SELECT data, media FROM tweets WHERE id = ?',
+            (int(tid),)).fetchone()
+        return _loads_tweet(row) if row else None
+
+    def count_tweets(self, author_id: int = None) -> int:
+        """Counts Tweets of the author, or of all authors if not set."""
+        if author_id is None:
+            query, parameters = 'SELECT COUNT(*) FROM tweets', ()
+        else:
+            query = 'SELECT COUNT(*) FROM tweets WHERE author_id = ?'
+            parameters = (author_id,)
+        return self.connection.execute(query, parameters).fetchone()[0]
+
+    def iterate_tweets(
+            self, author_id: int = None, start_time: str = None, 
+            end_time: str = None) -> Iterator[dict]:
+        """Iterates over Tweets in ascending id order.
+
+        Parameters
+        ----------
+        author_id: int, default: None
+            Only yields Tweets of this author, if set.
+        start_time: str, default: None
+            Only yields Tweets created at or after this ISO 8601 timestamp.
+        end_time: str, default: None
+            Only yields Tweets created before this ISO 8601 timestamp.
+
+        Yields
+        ------
+        dict
+            A Tweet. Includes its resolved 'media' if set.
+        """
+        query = 'SELECT data, media FROM tweets'
+        conditions = []
+        parameters = []
+        if author_id is not None:
+            conditions.append('author_id = ?')
+            parameters.append(author_id)
+        if start_time:
+            conditions.append('created_at >= ?')
+            parameters.append(start_time)
+        if end_time:
+            conditions.append('created_at < ?')
+            parameters.append(end_time)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id'
+        for row in self.connection.execute(query, parameters):
+            yield _loads_tweet(row)
+
+    def find_tweets_by_hashtag(self, tag: str) -> list:
+        """Gets Tweets with the hashtag in ascending id order."""
+        rows = self.connection.execute(
+            'SELECT data, media FROM tweets WHERE id IN '
+            '(SELECT tweet_id FROM hashtags WHERE tag = ?) ORDER BY id',
+            (tag,))
+        return [_loads_tweet(row) for row in rows]
+
+    def find_tweets_by_url(self, expanded_url: str) -> list:
+        """Gets Tweets containing the expanded URL in ascending id order."""
+        rows = self.connection.execute(
+            'SELECT data, media FROM tweets WHERE id IN '
+            '(SELECT tweet_id FROM urls WHERE expanded_url = ?) ORDER BY id',
+            (expanded_url,))
+        return [_loads_tweet(row) for row in rows]
+
+    def upsert_media_paths(self, author_id: int, urls: dict) -> int:
+        """Upserts mappings from URLs of an author to local media directories."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO media_paths (author_id, url, path) '
+                'VALUES (?, ?, ?)',
+                [(author_id, url, path) for url, path in urls.items()])
+        return len(urls)
+
+    def get_media_path(self, author_id: int, url: str) -> str:
+        """Gets the local media directory of an author's URL, or None."""
+        row = self.connection.execute(
+            'SELECT path FROM media_paths WHERE author_id = ? AND url = ?', 
+            (author_id, url)).fetchone()
+        return row[0] if row else None
+
+    def _migrate(self) -> None:
+        with self.lock, self.connection:
+            for table, statement in MIGRATIONS.items():
+                columns = [
+                    row[1] for row in self.connection.execute(
+                        f'PRAGMA table_info({table})')
+                ]
+                if columns and 'author_id' not in columns:
+                    self.connection.execute(statement)
+
+
+def _dumps(obj: tuple[dict, list]) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True)
+
+
+def _loads_tweet(row: tuple) -> dict:
+    data, media = row
+    tweet = json.loads(data)
+    if media:
+        tweet['media'] = json.loads(media)
+    return tweet
@@ -0,0 +1,79 @@
+"""This module indexes content hashes of files to find duplicates.
+
+The index is a JSON file written atomically:
+    {
+        str('Path relative to the indexed directory.'): {
+            'size': int('File size in bytes.'),
+            'mtime_ns': int('Modification time in nanoseconds.'),
+            'sha256': str('Hex digest of the file content.')
+        }
+    }
+A recorded hash is reused as long as the size and modification time of its
+file are unchanged, so only new or modified files are hashed again.
+
+Usage example:
+    index = HashIndex('path/to/media_hashes.json', 'path/to/media')
+    digest = index.get_hash('123_0/photo.jpg')
+    index.prune(existing_paths)
+    index.save()
+"""
+
+from __future__ import annotations
+import os
+
+from . import io # pylint: disable=import-error
+
+
+class HashIndex:
+    """This class caches content hashes of files in a directory."""
+    def __init__(self, path: str, root: str) -> None:
+        self.path = path
+        self.root = root
+        self.entries = {}
+        self.hashed = 0
+        if os.path.isfile(path):
+            self.entries = io.load_json(path)
+
+    def get_hash(self, filename: str, stat: os.stat_result = None) -> str:
+        """Gets the hash of a file, hashing it only if new or modified.
+
+        Parameters
+        ----------
+        filename: str
+            Path relative to the indexed directory.
+        stat: os.stat_result, default: None
+            Status of the file, if known already.
+        """
+        path = io.join_paths(self.root, filename)
+        stat = stat or os.stat(path)
+        entry = self.entries.get(filename)
+        if (entry and entry['size'] == stat.st_size and 
+                entry['mtime_ns'] == stat.st_mtime_ns):
+            return entry['sha256']
+        digest = io.get_hash(path)
+        self.hashed += 1
+        self.update(filename, digest, stat)
+        return digest
+
+    def update(
+            self, filename: str, digest: str, 
+            stat: os.stat_result = None) -> None:
+        """Records the hash of a file, e.g. after it is replaced by a link."""
+        stat = stat or os.stat(io.join_paths(self.root, filename))
+        self.entries[filename] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest,
+        }
+
+    def prune(self, filenames: set) -> None:
+        """Removes entries of files other than the given ones."""
+        self.entries = {
+            filename: entry for filename, entry in self.entries.items()
+            if filename in filenames
+        }
+
+    def save(self) -> None:
+        """Writes the index atomically."""
+        io.make_directory(os.path.dirname(self.path) or '.')
+        io.dump_json(self.entries, self.path, atomic=True)
@@ -0,0 +1,311 @@
+"""This module runs media extractors in long-lived worker processes.
+
+Running 'you-get' or 'youtube-dl' as a command starts a new interpreter and
+imports the whole extractor package for every URL. Instead, each worker process
+here imports both packages once and then downloads URLs until the pool is
+closed. Worker processes (rather than threads) keep the global state of
+you-get and any crash of an extractor away from the caller.
+
+Usage example:
+    extractors = ExtractorPool(workers=4)
+    returncode, output, started = extractors.run(
+        'youtube-dl', url, 'path/to/dst')
+    results = extractors.run_batch('youtube-dl', [(url, 'path/to/dst'), ...])
+    size, error = extractors.get_size('youtube-dl', url)
+    extractors.close()
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import os
+import re
+import time
+
+
+YOU_GET = 'you-get'
+YOUTUBE_DL = 'youtube-dl'
+
+# Output filename template of youtube-dl.
+YOUTUBE_DL_TEMPLATE = '%(title)s-%(id)s.%(ext)s'
+
+# Sizes printed by you-get in info-only mode. e.g. '1.2 MiB (1258291 Bytes)'
+YOU_GET_SIZE_PATTERN = re.compile(r'\((\d+) Bytes\)')
+
+
+class _OutputLogger:
+    """This class captures messages of youtube-dl per URL."""
+    def __init__(self) -> None:
+        self.output = StringIO()
+
+    def debug(self, message: str) -> None:
+        print(message, file=self.output)
+
+    warning = debug
+    error = debug
+
+
+class ExtractorPool:
+    """This class dispatches downloads to extractor worker processes."""
+    def __init__(self, workers: int = 1) -> None:
+        self.executor = ProcessPoolExecutor(
+            max_workers=max(workers, 1), initializer=_import_extractors)
+
+    def run(
+            self, downloader: str, url: str, dst: str, quiet: bool = False,
+            rate_limit: int = None) -> tuple[int, str, float]:
+        """Downloads a piece of media in a worker process.
+
+        Parameters
+        ----------
+        downloader: str
+            Either 'you-get' or 'youtube-dl'.
+        url: str
+            URL to download.
+        dst: str
+            Local download directory.
+        quiet: bool, default: False
+            Whether to capture outputs of the extractor instead of printing
+            them.
+        rate_limit: int, default: None
+            Maximum download rate in bytes per second. Only supported by
+            youtube-dl.
+
+        Returns
+        -------
+        int
+            The exit status. 0 indicates a success while 1 indicates an error.
+        str
+            Captured outputs if quiet, otherwise empty.
+        float
+            Unix timestamp when the worker process started the download, or
+            None if it crashed. Starting a worker process imports the
+            extractors first.
+
+        Raises
+        ------
+        ValueError
+            If unsupported downloader.
+        """
+        if downloader not in (YOU_GET, YOUTUBE_DL):
+            raise ValueError(f"Unsupported extractor '{downloader}'.")
+        try:
+            return self.executor.submit(
+                _download, downloader, url, dst, quiet, rate_limit).result()
+        except BrokenProcessPool as err:
+            return 1, f'Extractor worker crashed: {err}', None
+
+    def run_batch(
+            self, downloader: str, batch: list, quiet: bool = False,
+            rate_limit: int = None) -> list[tuple[int, str, float]]:
+        """Downloads a batch of media in a single session of a worker process.
+
+        youtube-dl reuses a single YoutubeDL instance (and its HTTP session)
+        for the whole batch, switching the output template per URL.
+
+        Parameters
+        ----------
+        downloader: str
+            Either 'you-get' or 'youtube-dl'.
+        batch: list
+            Pairs of URLs and their local download directories.
+            Format:
+            [
+                (str('URL'), str('Local download directory.'))
+            ]
+        quiet: bool, default: False
+            Whether to capture outputs of the extractor instead of printing
+            them.
+        rate_limit: int, default: None
+            Maximum download rate in bytes per second. See `run`.
+
+        Returns
+        -------
+        list
+            The exit status, captured outputs and start timestamp of each URL.
+            See `run`.
+
+        Raises
+        ------
+        ValueError
+            If unsupported downloader.
+        """
+        if downloader not in (YOU_GET, YOUTUBE_DL):
+            raise ValueError(f"Unsupported extractor '{downloader}'.")
+        try:
+            return self.executor.submit(
+                _download_batch, downloader, batch, quiet, rate_limit).result()
+        except BrokenProcessPool as err:
+            return [(1, f'Extractor worker crashed: {err}', None)] * len(batch)
+
+    def get_size(self, downloader: str, url: str) -> tuple[int, str]:
+        """Gets the size of a piece of media from its metadata only.
+
+        Parameters
+        ----------
+        downloader: str
+            Either 'you-get' or 'youtube-dl'.
+        url: str
+            URL of the media.
+
+        Returns
+        -------
+        int
+            Size in bytes of all files of the media, or None if unknown.
+        str
+            Error message if the metadata cannot be extracted, otherwise None.
+
+        Raises
+        ------
+        ValueError
+            If unsupported downloader.
+        """
+        if downloader not in (YOU_GET, YOUTUBE_DL):
+            raise ValueError(f"Unsupported extractor '{downloader}'.")
+        try:
+            return self.executor.submit(_get_size, downloader, url).result()
+        except BrokenProcessPool as err:
+            return None, f'Extractor worker crashed: {err}'
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+def _import_extractors() -> None:
+    # Missing packages are reported per download instead.
+    try:
+        import you_get.common # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        pass
+    try:
+        import youtube_dl # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        pass
+
+
+def _download(
+        downloader: str, url: str, dst: str, quiet: bool,
+        rate_limit: int = None) -> tuple[int, str, float]:
+    started = time.time()
+    if not quiet:
+        return _run_extractor(downloader, url, dst, rate_limit), '', started
+    output = StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        returncode = _run_extractor(downloader, url, dst, rate_limit)
+    return returncode, output.getvalue(), started
+
+
+def _download_batch(
+        downloader: str, batch: list, quiet: bool,
+        rate_limit: int = None) -> list[tuple[int, str, float]]:
+    if downloader != YOUTUBE_DL:
+        return [
+            _download(downloader, url, dst, quiet, rate_limit)
+            for url, dst in batch
+        ]
+    try:
+        from youtube_dl import YoutubeDL # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        return [(1, f'{downloader}: {err!r}', time.time())] * len(batch)
+
+    logger = _OutputLogger() if quiet else None
+    params = {
+        'ignoreerrors': True, # Continues on download errors
+        'nooverwrites': True, # No overwrite
+    }
+    if logger:
+        params['logger'] = logger
+    if rate_limit:
+        params['ratelimit'] = rate_limit
+    results = []
+    with YoutubeDL(params) as ydl:
+        for url, dst in batch:
+            started = time.time()
+            ydl.params['outtmpl'] = os.path.join(dst, YOUTUBE_DL_TEMPLATE)
+            output = StringIO()
+            if logger:
+                logger.output = output
+            # Failed downloads only set the exit status of the instance, and
+            # still return the extracted info. Resets it per URL.
+            ydl._download_retcode = 0 # pylint: disable=protected-access
+            try:
+                # Errors are reported rather than raised, with no result.
+                info = ydl.extract_info(url)
+                returncode = ydl._download_retcode if info else 1 # pylint: disable=protected-access
+            except (Exception, SystemExit) as err: # pylint: disable=broad-except
+                (logger.error if logger else print)(f'{downloader}: {err!r}')
+                returncode = 1
+            results.append((returncode, output.getvalue(), started))
+    return results
+
+
+def _get_size(downloader: str, url: str) -> tuple[int, str]:
+    output = StringIO()
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            if downloader == YOU_GET:
+                from you_get import common # pylint: disable=import-outside-toplevel
+                common.any_download(
+                    url, output_dir='.', merge=True, info_only=True)
+                sizes = YOU_GET_SIZE_PATTERN.findall(output.getvalue())
+                return sum(map(int, sizes)) if sizes else None, None
+            from youtube_dl import YoutubeDL # pylint: disable=import-outside-toplevel
+            params = {'logger': _OutputLogger(), 'skip_download': True}
+            with YoutubeDL(params) as ydl:
+                info = ydl.extract_info(url, download=False)
+            if not info:
+                return None, params['logger'].output.getvalue().strip()
+            return _get_info_size(info), None
+    except (Exception, SystemExit) as err: # pylint: disable=broad-except
+        return None, f'{downloader}: {err!r}'
+
+
+def _get_info_size(info: dict) -> int:
+    # Playlists sum up their known entries. Merged formats sum up their parts.
+    if info.get('entries') is not None:
+        sizes = [_get_info_size(entry or {}) for entry in info['entries']]
+        return sum(size for size in sizes if size) or None
+    sizes = [
+        media.get('filesize') or media.get('filesize_approx')
+        for media in info.get('requested_formats') or [info]
+    ]
+    return int(sum(sizes)) if all(sizes) else None
+
+
+def _run_extractor(
+        downloader: str, url: str, dst: str, rate_limit: int = None) -> int:
+    try:
+        if downloader == YOU_GET:
+            return _run_you_get(url, dst)
+        return _run_youtube_dl(url, dst, rate_limit)
+    except (Exception, SystemExit) as err: # pylint: disable=broad-except
+        # Extractors may exit on errors.
+        print(f'{downloader}: {err!r}')
+        return 1
+
+
+def _run_you_get(url: str, dst: str) -> int:
+    from you_get import common # pylint: disable=import-outside-toplevel
+    # Equivalent to '--skip-existing-file-size-check'. No overwrite.
+    common.skip_existing_file_size_check = True
+    os.makedirs(dst, exist_ok=True)
+    common.any_download(
+        url, output_dir=dst, merge=True, info_only=False, caption=True)
+    return 0
+
+
+def _run_youtube_dl(url: str, dst: str, rate_limit: int = None) -> int:
+    from youtube_dl import YoutubeDL # pylint: disable=import-outside-toplevel
+    # A new instance per URL keeps download states apart. Creating it is cheap
+    # once the package is imported.
+    params = {
+        'ignoreerrors': True, # Continues on download errors
+        'nooverwrites': True, # No overwrite
+        'outtmpl': os.path.join(dst, YOUTUBE_DL_TEMPLATE),
+    }
+    if rate_limit:
+        params['ratelimit'] = rate_limit
+    with YoutubeDL(params) as ydl:
+        return ydl.download([url])
@@ -0,0 +1,536 @@
+"""This module handles HTTP requests and downloads.
+
+Connections are kept alive and reused per host by a connection pool, which is
+thread-safe and can be shared by concurrent workers. Files are streamed to
+disk in chunks through a temporary file, and interrupted downloads resume with
+range requests. Large files may be split into byte ranges downloaded in
+parallel.
+
+Usage example:
+    pool = ConnectionPool()
+    final_url = resolve_url('https://t.co/abc', pool)
+    info = download_file(
+        'https://pbs.twimg.com/media/abc.jpg', 'path/to/dst', pool)
+    info = refresh_file(url, 'path/to/dst', etag=info['etag'])
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import http.client
+import mimetypes
+import os
+import threading
+from typing import Callable, Iterator
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from . import io # pylint: disable=import-error
+
+
+# Size of each chunk streamed to disk.
+CHUNK_SIZE = 1 << 20
+
+# Minimum size of each part of a ranged download.
+RANGE_MIN_PART_SIZE = 8 << 20
+
+# Suffix of the progress file of a ranged download.
+PROGRESS_SUFFIX = '.parts'
+
+# Status codes of redirects.
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Some hosts reject requests without a browser-like user agent.
+USER_AGENT = 'Mozilla/5.0 (compatible; kano_hanayori_twitter_timeline)'
+
+
+class ConnectionPool:
+    """This class keeps idle keep-alive connections per host."""
+    def __init__(self, max_idle: int = 8, timeout: float = 60) -> None:
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def open(
+            self, method: str, url: str, headers: dict = None
+            ) -> Iterator[http.client.HTTPResponse]:
+        """Sends a request and yields its response.
+
+        The connection returns to the pool if the response is fully read.
+
+        Raises
+        ------
+        OSError
+            If the request fails.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        headers = {'User-Agent': USER_AGENT, **(headers or {})}
+
+        connection, response = None, None
+        # An idle connection may have been closed by the server. Retries once
+        # with a new connection.
+        for reused in (True, False):
+            connection = self._acquire(key, reused)
+            try:
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+                break
+            except (OSError, http.client.HTTPException) as err:
+                connection.close()
+                if not reused:
+                    raise OSError(f"Request to '{url}' failed: {err}") from err
+
+        try:
+            yield response
+        finally:
+            if response.isclosed() and not response.will_close:
+                self._release(key, connection)
+            else:
+                connection.close()
+
+    def _acquire(self, key: tuple, reused: bool) -> http.client.HTTPConnection:
+        if reused:
+            with self.lock:
+                connections = self.idle.get(key)
+                if connections:
+                    return connections.pop()
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(
+            self, key: tuple, connection: http.client.HTTPConnection) -> None:
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+
+def get_filename(url: str) -> str:
+    """Gets the filename of a direct file URL, ignoring its query string."""
+    return os.path.basename(urllib.parse.urlsplit(url).path)
+
+
+def resolve_url(
+        url: str, pool: ConnectionPool, max_redirects: int = 10) -> str:
+    """Follows redirects of the URL with HEAD requests.
+
+    Parameters
+    ----------
+    url: str
+        URL to resolve. e.g. A shortened URL.
+    pool: ConnectionPool
+        Connection pool to send requests with.
+    max_redirects: int, default: 10
+        Maximum number of redirects to follow.
+
+    Returns
+    -------
+    str
+        The final URL. The last URL reached if a host rejects HEAD requests or
+        a request after the first redirect fails.
+
+    Raises
+    ------
+    OSError
+        If the first request fails.
+    """
+    for i in range(max_redirects):
+        try:
+            with pool.open('HEAD', url) as response:
+                response.read()
+                location = response.getheader('Location')
+        except OSError:
+            if i == 0:
+                raise
+            return url
+        if response.status not in REDIRECT_STATUSES or not location:
+            return url
+        url = urllib.parse.urljoin(url, location)
+    return url
+
+
+def get_size(
+        url: str, pool: ConnectionPool, max_redirects: int = 10) -> int:
+    """Gets the size of a file with HEAD requests, following redirects.
+
+    Returns
+    -------
+    int
+        Size in bytes, or None if the server does not tell.
+
+    Raises
+    ------
+    OSError
+        If a request fails.
+    """
+    _, headers = _probe(url, pool, max_redirects)
+    size = headers.get('content-length')
+    return int(size) if size and size.isdigit() else None
+
+
+def download_file(
+        url: str, dst: str, pool: ConnectionPool = None,
+        max_redirects: int = 10, parts: int = 1,
+        min_part_size: int = RANGE_MIN_PART_SIZE,
+        throttle: Callable[[int], None] = None) -> dict:
+    """Downloads a file into the directory unless it already exists.
+
+    The file is streamed in chunks to a temporary file, which is renamed once
+    complete. An interrupted download leaves the temporary file behind, and
+    the next download resumes it with a range request if the server supports
+    it.
+
+    With several parts, a file advertising 'Accept-Ranges' is preallocated and
+    its byte ranges are downloaded in parallel, each over its own connection.
+    Finished ranges are tracked in a progress file, so an interrupted download
+    only fetches the rest. Files too small to split, servers without range
+    support, or files changed since the ranges started fall back to a single
+    stream.
+
+    Parameters
+    ----------
+    url: str
+        Direct URL of the file.
+    dst: str
+        Local download directory.
+    pool: ConnectionPool, default: None
+        Connection pool to send requests with. Shares keep-alive connections
+        between downloads if given.
+    max_redirects: int, default: 10
+        Maximum number of redirects to follow.
+    parts: int, default: 1
+        Maximum number of byte ranges downloaded in parallel.
+    min_part_size: int, default: RANGE_MIN_PART_SIZE
+        Minimum size in bytes of each range.
+    throttle: Callable, default: None
+        Called with the size of each chunk before it is written. May block to
+        limit the rate. See `utils.throttle.Throttle.consume`.
+
+    Returns
+    -------
+    dict
+        The downloaded file and its validators. Validators are None if the
+        file already exists or the server does not send them.
+        Format:
+        {
+            'path': str('Path to the downloaded file.'),
+            'etag': str('ETag response header.'),
+            'last_modified': str('Last-Modified response header.')
+        }
+
+    Raises
+    ------
+    OSError
+        If the download fails or is incomplete.
+    """
+    io.make_directory(dst)
+    path = io.join_paths(dst, get_filename(url))
+    info = {'path': path, 'etag': None, 'last_modified': None}
+    if os.path.isfile(path):
+        return info
+    pool = pool or ConnectionPool()
+    temporary_path = path + io.TEMPORARY_SUFFIX
+    progress_path = temporary_path + PROGRESS_SUFFIX
+
+    if parts > 1:
+        validators = _download_ranges(
+            url, temporary_path, pool, max_redirects, parts, min_part_size,
+            throttle)
+        if validators is not None:
+            os.replace(temporary_path, path)
+            return {**info, **validators}
+    if os.path.isfile(progress_path):
+        # A preallocated file of a ranged download cannot resume as a stream.
+        os.remove(progress_path)
+        if os.path.isfile(temporary_path):
+            os.remove(temporary_path)
+
+    for _ in range(max_redirects):
+        offset = 0
+        headers = {}
+        if os.path.isfile(temporary_path):
+            offset = os.path.getsize(temporary_path)
+            headers['Range'] = f'bytes={offset}-'
+
+        with pool.open('GET', url, headers) as response:
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                response.read()
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status == 416:
+                # The temporary file may be complete or stale.
+                response.read()
+                total = _get_total_length(response)
+                if total is not None and total == offset:
+                    break
+                os.remove(temporary_path)
+                continue
+            if response.status >= 400:
+                response.read()
+                raise OSError(
+                    f'HTTP Error {response.status}: {response.reason}')
+
+            if response.status != 206 or _get_range_start(response) != offset:
+                # The server sends the whole file instead.
+                offset = 0
+            expected = response.getheader('Content-Length')
+            written = 0
+            with open(temporary_path, 'r+b' if offset else 'wb') as f:
+                f.seek(offset)
+                f.truncate()
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    if throttle:
+                        throttle(len(chunk))
+                    f.write(chunk)
+                    written += len(chunk)
+            info['etag'] = response.getheader('ETag')
+            info['last_modified'] = response.getheader('Last-Modified')
+        if expected is not None and written != int(expected):
+            raise OSError(
+                f"Incomplete download of '{url}': "
+                f'{written} of {expected} bytes.')
+        break
+    else:
+        raise OSError(f"Too many redirects of '{url}'.")
+
+    os.replace(temporary_path, path)
+    return info
+
+
+def refresh_file(
+        url: str, dst: str, etag: str = None, last_modified: str = None,
+        timeout: float = 60, throttle: Callable[[int], None] = None) -> dict:
+    """Downloads a file with a conditional GET, keeping it only if changed.
+
+    The file is not transferred if the server reports it unchanged through
+    the validators. Otherwise the content is compared with existing files in
+    the directory by hash, and a new file is kept only if none matches.
+
+    Parameters
+    ----------
+    url: str
+        Direct URL of the file. e.g. An avatar.
+    dst: str
+        Local download directory.
+    etag: str, default: None
+        ETag of the last download, sent as 'If-None-Match'.
+    last_modified: str, default: None
+        Last-Modified of the last download, sent as 'If-Modified-Since'.
+    timeout: float, default: 60
+        Timeout in seconds of blocking operations.
+    throttle: Callable, default: None
+        Called with the size of each chunk before it is written. See
+        `download_file`.
+
+    Returns
+    -------
+    dict
+        The current file and its validators.
+        Format:
+        {
+            'path': str('Path to the matching or new file. None if not modified.'),
+            'etag': str('ETag response header.'),
+            'last_modified': str('Last-Modified response header.'),
+            'changed': bool('Whether or not a new file is kept.')
+        }
+
+    Raises
+    ------
+    OSError
+        If the download fails.
+    """
+    headers = {'User-Agent': USER_AGENT}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+
+    io.make_directory(dst)
+    filename = get_filename(url)
+    temporary_path = io.join_paths(dst, filename + io.TEMPORARY_SUFFIX)
+    digest = hashlib.sha256()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            with open(temporary_path, 'wb') as f:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    if throttle:
+                        throttle(len(chunk))
+                    digest.update(chunk)
+                    f.write(chunk)
+            content_type = response.headers.get_content_type()
+            etag = response.headers.get('ETag', etag)
+            last_modified = response.headers.get('Last-Modified', last_modified)
+    except urllib.error.HTTPError as err:
+        if err.code != 304:
+            raise
+        return {
+            'path': None, 'etag': etag, 'last_modified': last_modified,
+            'changed': False,
+        }
+    info = {'etag': etag, 'last_modified': last_modified, 'changed': False}
+
+    # Matches existing files of the same size by hash.
+    size = os.path.getsize(temporary_path)
+    for existing in sorted(os.listdir(dst)):
+        path = io.join_paths(dst, existing)
+        if (path != temporary_path and os.path.isfile(path) and
+                os.path.getsize(path) == size and
+                io.get_hash(path) == digest.hexdigest()):
+            os.remove(temporary_path)
+            return {**info, 'path': path}
+
+    # Some URLs have no extension. e.g. Profile banners.
+    if not os.path.splitext(filename)[1]:
+        filename += mimetypes.guess_extension(content_type) or ''
+    path = io.join_paths(dst, filename)
+    if os.path.exists(path):
+        stem, extension = os.path.splitext(filename)
+        path = io.join_paths(
+            dst, f'{stem}-{digest.hexdigest()[:8]}{extension}')
+    os.replace(temporary_path, path)
+    return {**info, 'path': path, 'changed': True}
+
+
+def _probe(
+        url: str, pool: ConnectionPool, max_redirects: int) -> tuple[str, dict]:
+    # Follows redirects with HEAD requests. Returns the final URL and headers.
+    for _ in range(max_redirects):
+        with pool.open('HEAD', url) as response:
+            response.read()
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status >= 400:
+                raise OSError(
+                    f'HTTP Error {response.status}: {response.reason}')
+            return url, {
+                key.lower(): value for key, value in response.getheaders()
+            }
+    raise OSError(f"Too many redirects of '{url}'.")
+
+
+def _download_ranges(
+        url: str, temporary_path: str, pool: ConnectionPool,
+        max_redirects: int, parts: int, min_part_size: int,
+        throttle: Callable[[int], None]) -> dict:
+    # Returns validators, or None if the file cannot be split or changed
+    # since the ranged download started.
+    url, headers = _probe(url, pool, max_redirects)
+    size = int(headers.get('content-length', 0))
+    count = min(parts, size // max(min_part_size, 1))
+    if headers.get('accept-ranges') != 'bytes' or count < 2:
+        return None
+    validators = {
+        'etag': headers.get('etag'),
+        'last_modified': headers.get('last-modified'),
+    }
+
+    progress_path = temporary_path + PROGRESS_SUFFIX
+    progress = {
+        'size': size, 'count': count, 'done': [], 'written': 0, **validators,
+    }
+    if os.path.isfile(progress_path) and os.path.isfile(temporary_path):
+        previous = io.load_json(progress_path)
+        if all(key in previous and (
+                key in ('done', 'written') or previous[key] == value)
+               for key, value in progress.items()):
+            progress = previous
+    if not progress['done']:
+        with open(temporary_path, 'wb') as f:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+        io.dump_json(progress, progress_path, atomic=True)
+
+    # Maps the start of each range to its end. The last one takes the rest.
+    part_size = size // count
+    ranges = {
+        i * part_size: (i + 1) * part_size - 1 for i in range(count - 1)
+    }
+    ranges[(count - 1) * part_size] = size - 1
+    lock = threading.Lock()
+
+    def download_range(start: int) -> None:
+        end = ranges[start]
+        headers = {'Range': f'bytes={start}-{end}'}
+        if validators['etag']:
+            # The server sends the whole file instead if it changed meanwhile.
+            headers['If-Range'] = validators['etag']
+        with pool.open('GET', url, headers) as response:
+            if response.status == 200 and validators['etag']:
+                raise _FileChanged(url)
+            if response.status != 206 or _get_range_start(response) != start:
+                raise OSError(f"Range request of '{url}' not honored.")
+            written = 0
+            with open(temporary_path, 'r+b') as f:
+                f.seek(start)
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    if throttle:
+                        throttle(len(chunk))
+                    f.write(chunk)
+                    written += len(chunk)
+        if written != end - start + 1:
+            raise OSError(
+                f"Incomplete range {start}-{end} of '{url}': "
+                f'{written} of {end - start + 1} bytes.')
+        with lock:
+            progress['done'].append(start)
+            progress['written'] += written
+            io.dump_json(progress, progress_path, atomic=True)
+
+    starts = [start for start in ranges if start not in progress['done']]
+    if starts:
+        try:
+            with ThreadPoolExecutor(max_workers=len(starts)) as executor:
+                # Raises the first error, if any.
+                list(executor.map(download_range, starts))
+        except _FileChanged:
+            # Fails over to downloading the whole file.
+            return None
+
+    # The preallocated file always has the full size. Counts bytes received.
+    if progress['written'] != size:
+        raise OSError(
+            f"Size mismatch of '{url}': "
+            f"{progress['written']} of {size} bytes.")
+    os.remove(progress_path)
+    return validators
+
+
+class _FileChanged(OSError):
+    # The file changed since the ranged download started.
+    pass
+
+
+def _get_range_start(response: http.client.HTTPResponse) -> int:
+    # e.g. 'Content-Range: bytes 100-199/200'
+    content_range = response.getheader('Content-Range', '')
+    try:
+        return int(content_range.split()[1].split('-')[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _get_total_length(response: http.client.HTTPResponse) -> int:
+    # e.g. 'Content-Range: bytes */200'
+    content_range = response.getheader('Content-Range', '')
+    try:
+        return int(content_range.rsplit('/', 1)[1])
+    except (IndexError, ValueError):
+        return None
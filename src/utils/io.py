@@ -1,10 +1,15 @@
 """This module handles file IO."""
 
+import hashlib
 import json
 import os
 import shutil
 
 
+# Suffix of files being written before an atomic rename.
+TEMPORARY_SUFFIX = '.tmp'
+
+
 def add_suffix(path: str, suffix: str) -> str:
     """Adds a suffix to the path before the last extension."""
     norm_path, ext = os.path.splitext(os.path.normpath(path))
@@ -47,10 +52,63 @@ def load_json(path: str) -> dict:
         return json.load(f)
 
 
-def dump_json(obj: dict, path: str, sorted_keys: bool = True) -> None:
-    """Dumps a dictionary to a JSON file with utf-8 encoding."""
-    with open(os.path.normpath(path), 'w', encoding='utf-8') as f:
+def dump_json(
+        obj: dict, path: str, sorted_keys: bool = True, 
+        atomic: bool = False) -> None:
+    """Dumps a dictionary to a JSON file with utf-8 encoding.
+    
+    If atomic, writes to a temporary file first and then renames it, so readers
+    never see a partially written file.
+    """
+    path = os.path.normpath(path)
+    dst = path + TEMPORARY_SUFFIX if atomic else path
+    with open(dst, 'w', encoding='utf-8') as f:
         json.dump(obj, f, ensure_ascii=False, indent=4, sort_keys=sorted_keys)
+        if atomic:
+            f.flush()
+            os.fsync(f.fileno())
+    if atomic:
+        os.replace(dst, path)
+
+
+def get_hash(path: str) -> str:
+    """Gets the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(os.path.normpath(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_file(src: str, dst: str) -> None:
+    """Copies the file, replacing the destination atomically.
+
+    An existing destination is replaced rather than overwritten, so files
+    hardlinked to it keep their content.
+    """
+    dst = os.path.normpath(dst)
+    temporary_path = dst + TEMPORARY_SUFFIX
+    shutil.copyfile(os.path.normpath(src), temporary_path)
+    os.replace(temporary_path, dst)
+
+
+def link_file(src: str, dst: str) -> None:
+    """Hardlinks the destination to the file, replacing it atomically.
+
+    Raises
+    ------
+    OSError
+        If the file system does not support hardlinks between the paths.
+    """
+    dst = os.path.normpath(dst)
+    temporary_path = dst + TEMPORARY_SUFFIX
+    try:
+        os.link(os.path.normpath(src), temporary_path)
+        os.replace(temporary_path, dst)
+    except OSError:
+        if os.path.lexists(temporary_path):
+            os.remove(temporary_path)
+        raise
 
 
 def has_extension(path: str, extension: str) -> bool:
@@ -0,0 +1,188 @@
+"""This module tracks downloaded files per URL in a manifest.
+
+The manifest is a JSON file written atomically:
+    {
+        str('URL'): {
+            'downloader': str('Downloader of the URL.'),
+            'path': str('Local download directory, relative to the output.'),
+            'status': str('complete', 'partial' or 'failed'),
+            'files': {
+                str('Filename'): {
+                    'size': int('File size in bytes.'),
+                    'sha256': str('Hex digest of the file content.')
+                }
+            },
+            'etag': str('ETag response header, if any.'),
+            'last_modified': str('Last-Modified response header, if any.'),
+            'time': float('Unix timestamp of the last update.')
+        }
+    }
+
+A URL is verifiably complete if its status is 'complete' and it has files, all
+of which still exist with the recorded sizes (and hashes, if verified).
+
+Usage example:
+    manifest = DownloadManifest('path/to/downloads_manifest.json')
+    if not manifest.is_complete(url, 'path/to/media'):
+        ...
+        manifest.record(url, downloader, path, COMPLETE, files)
+    manifest.save()
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+
+from . import http, io # pylint: disable=import-error
+
+
+COMPLETE = 'complete'
+PARTIAL = 'partial'
+FAILED = 'failed'
+
+# Suffixes of unfinished files left by downloaders.
+PARTIAL_SUFFIXES = (
+    '.part', '.ytdl', '.download', io.TEMPORARY_SUFFIX, http.PROGRESS_SUFFIX)
+
+# Saves the manifest after this many updates.
+SAVE_INTERVAL = 50
+
+
+class DownloadManifest:
+    """This class reads and records download states. It is thread-safe."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries = {}
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        if os.path.isfile(path):
+            self.entries = io.load_json(path)
+
+    def get(self, url: str) -> dict:
+        """Gets the entry of the URL, or None if not recorded."""
+        with self.lock:
+            return self.entries.get(url)
+
+    def is_complete(self, url: str, root: str, verify: bool = False) -> bool:
+        """Whether or not the URL is verifiably complete.
+
+        Parameters
+        ----------
+        url: str
+            URL to check.
+        root: str
+            Media output directory.
+        verify: bool, default: False
+            Whether to verify file hashes in addition to sizes.
+        """
+        entry = self.get(url)
+        # A download without files may have silently failed.
+        if not entry or entry['status'] != COMPLETE or not entry['files']:
+            return False
+        dst = io.join_paths(root, entry['path'])
+        for filename, info in entry['files'].items():
+            path = io.join_paths(dst, filename)
+            if not os.path.isfile(path) or os.path.getsize(path) != info['size']:
+                return False
+            if verify and io.get_hash(path) != info['sha256']:
+                return False
+        return True
+
+    def record(
+            self, url: str, downloader: str, path: str, status: str,
+            files: dict, etag: str = None, last_modified: str = None) -> None:
+        """Records the download state of the URL.
+
+        Validators of a previous record are kept unless new ones are given.
+        Saves the manifest every `SAVE_INTERVAL` records.
+        """
+        with self.lock:
+            entry = self.entries.get(url, {})
+            self.entries[url] = {
+                'downloader': downloader,
+                'path': path,
+                'status': status,
+                'files': files,
+                'etag': etag or entry.get('etag'),
+                'last_modified': last_modified or entry.get('last_modified'),
+                'time': time.time(),
+            }
+            self.unsaved += 1
+            should_save = self.unsaved >= SAVE_INTERVAL
+        if should_save:
+            self.save()
+
+    def save(self) -> None:
+        """Writes the manifest atomically."""
+        with self.lock:
+            self.unsaved = 0
+            io.make_directory(os.path.dirname(self.path) or '.')
+            io.dump_json(self.entries, self.path, atomic=True)
+
+
+def get_file(path: str) -> dict:
+    """Gets the size and hash of a file. See the module docstring."""
+    return {'size': os.path.getsize(path), 'sha256': io.get_hash(path)}
+
+
+def is_partial(filename: str) -> bool:
+    """Whether or not the file is an unfinished download."""
+    return filename.endswith(PARTIAL_SUFFIXES)
+
+
+def list_files(dst: str, since: float = None) -> tuple[dict, bool]:
+    """Gets finished files in the directory.
+
+    See `scan_files` for the parameters.
+
+    Returns
+    -------
+    dict
+        Maps filenames to their paths.
+    bool
+        Whether or not the directory has unfinished files.
+    """
+    if not os.path.isdir(dst):
+        return {}, False
+    paths = {}
+    has_partial = False
+    for filename in sorted(os.listdir(dst)):
+        path = io.join_paths(dst, filename)
+        if not os.path.isfile(path):
+            continue
+        if is_partial(filename):
+            has_partial = True
+        else:
+            paths[filename] = path
+
+    if since is not None:
+        recent = {
+            filename: path for filename, path in paths.items()
+            if os.path.getmtime(path) >= since
+        }
+        paths = recent or paths
+    return paths, has_partial
+
+
+def scan_files(dst: str, since: float = None) -> tuple[dict, bool]:
+    """Gets finished files in the directory along with their sizes and hashes.
+
+    Parameters
+    ----------
+    dst: str
+        Local download directory.
+    since: float, default: None
+        Only includes files modified at or after this Unix timestamp, if any
+        exists. Otherwise includes all finished files.
+
+    Returns
+    -------
+    dict
+        Maps filenames to their sizes and hashes. See the module docstring.
+    bool
+        Whether or not the directory has unfinished files.
+    """
+    paths, has_partial = list_files(dst, since)
+    files = {filename: get_file(path) for filename, path in paths.items()}
+    return files, has_partial
@@ -0,0 +1,122 @@
+"""This module schedules API requests under rate limits.
+
+Each endpoint owns a token bucket refilled from the 'x-rate-limit-*' response
+headers. Requests are paced so that the remaining quota spreads evenly over
+the rest of the rate limit window. Once the quota is used up (or a 429 response
+arrives), callers are parked until the window resets instead of failing.
+
+Usage example:
+    scheduler = RateLimitScheduler()
+    endpoint = get_endpoint('GET', '/2/users/123/tweets')
+    scheduler.acquire(endpoint)
+    response = send_request()
+    scheduler.update(endpoint, response.headers)
+"""
+
+from __future__ import annotations
+import re
+import threading
+import time
+from typing import Mapping
+
+
+# Rate limit response headers.
+REMAINING_HEADER = 'x-rate-limit-remaining'
+RESET_HEADER = 'x-rate-limit-reset'
+
+# Numeric path segments of a route (except the API version), e.g. user ids.
+ID_PATTERN = r'(?<=.)/\d+(?=/|$)'
+
+# Length of a Twitter rate limit window in seconds.
+DEFAULT_WINDOW = 15 * 60
+
+
+def get_endpoint(method: str, route: str) -> str:
+    """Gets the rate limit key of a request by replacing ids in the route."""
+    return f"{method} {re.sub(ID_PATTERN, '/:id', route)}"
+
+
+class TokenBucket:
+    """This class tracks the quota of a single endpoint."""
+    def __init__(self, margin: int = 1) -> None:
+        self.margin = margin
+        self.tokens = None
+        self.reset_time = 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a request is allowed, then consumes a token."""
+        while True:
+            with self.lock:
+                now = time.time()
+                if self.tokens is not None and now >= self.reset_time:
+                    # The window has reset. The quota is unknown until the
+                    # next response arrives.
+                    self.tokens = None
+                    self.next_time = now
+
+                if self.tokens is None:
+                    return
+                if self.tokens > 0 and now >= self.next_time:
+                    self.tokens -= 1
+                    # Paces the rest of the quota over the rest of the window.
+                    interval = (self.reset_time - now) / max(self.tokens, 1)
+                    self.next_time = now + interval
+                    return
+
+                wait_until = (
+                    self.next_time if self.tokens > 0 else self.reset_time)
+            time.sleep(max(wait_until - now, 0.01))
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Refills the bucket with the quota reported by response headers."""
+        if REMAINING_HEADER not in headers or RESET_HEADER not in headers:
+            return
+        with self.lock:
+            remaining = max(int(headers[REMAINING_HEADER]) - self.margin, 0)
+            reset_time = float(headers[RESET_HEADER])
+            # Responses of concurrent requests may arrive out of order.
+            if self.tokens is None or reset_time > self.reset_time:
+                self.tokens = remaining
+            else:
+                self.tokens = min(self.tokens, remaining)
+            self.reset_time = reset_time
+
+    def park(self, headers: Mapping[str, str]) -> float:
+        """Empties the bucket until the window resets. Returns the wait time."""
+        with self.lock:
+            now = time.time()
+            self.tokens = 0
+            if RESET_HEADER in headers:
+                self.reset_time = float(headers[RESET_HEADER]) + 1
+            else:
+                self.reset_time = now + DEFAULT_WINDOW
+            return max(self.reset_time - now, 0)
+
+
+class RateLimitScheduler:
+    """This class keeps one token bucket per endpoint.
+
+    A scheduler is thread-safe and can be shared by all workers using the same
+    credentials.
+    """
+    def __init__(self, margin: int = 1) -> None:
+        self.margin = margin
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, endpoint: str) -> TokenBucket:
+        with self.lock:
+            if endpoint not in self.buckets:
+                self.buckets[endpoint] = TokenBucket(self.margin)
+            return self.buckets[endpoint]
+
+    def acquire(self, endpoint: str) -> None:
+        self.get_bucket(endpoint).acquire()
+
+    def update(self, endpoint: str, headers: Mapping[str, str]) -> None:
+        self.get_bucket(endpoint).update(headers)
+
+    def park(self, endpoint: str, headers: Mapping[str, str]) -> float:
+        return self.get_bucket(endpoint).park(headers)
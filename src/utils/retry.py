@@ -0,0 +1,146 @@
+"""This module schedules retries of failed tasks and journals failures.
+
+Retries are delayed by a jittered exponential backoff and kept in a queue
+ordered by due time, so other tasks carry on meanwhile. The failure journal is
+a JSON file that persists failures across runs, written atomically:
+    {
+        str('Key. e.g. A URL.'): {
+            'attempts': int('Number of failures recorded since the last success or death.'),
+            'last_error': str('Error of the last failed attempt.'),
+            'last_time': float('Unix timestamp of the last failed attempt.'),
+            'dead_until': float('Unix timestamp until which the key is dead, if any.')
+        }
+    }
+A dead key is negatively cached: it is not attempted again until it expires.
+
+Usage example:
+    queue = RetryQueue()
+    journal = FailureJournal('path/to/failures.json', dead_after=3, ttl=86400)
+    if not journal.is_dead(url):
+        ...
+        queue.push(url, get_backoff(attempt))
+    journal.save()
+"""
+
+from __future__ import annotations
+import heapq
+import os
+import random
+import threading
+import time
+
+from . import io # pylint: disable=import-error
+
+
+def get_backoff(
+        attempt: int, base: float = 5, cap: float = 300,
+        generator: random.Random = random) -> float:
+    """Gets the delay in seconds before a retry.
+
+    The delay is jittered between half and all of the exponential ceiling, so
+    concurrent retries spread out.
+
+    Parameters
+    ----------
+    attempt: int
+        Number of failed attempts so far, starting from 1.
+    base: float, default: 5
+        Delay ceiling of the first retry.
+    cap: float, default: 300
+        Maximum delay ceiling.
+    generator: random.Random, default: random
+        Source of the jitter.
+    """
+    ceiling = min(cap, base * 2 ** (attempt - 1))
+    return generator.uniform(ceiling / 2, ceiling)
+
+
+class RetryQueue:
+    """This class keeps tasks until their retries are due. It is thread-safe."""
+    def __init__(self) -> None:
+        self.heap = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.heap)
+
+    def push(self, task: str, delay: float) -> None:
+        with self.lock:
+            # The counter breaks ties without comparing tasks.
+            heapq.heappush(self.heap, (time.time() + delay, self.count, task))
+            self.count += 1
+
+    def pop_due(self) -> list:
+        """Removes and returns the tasks that are due."""
+        tasks = []
+        with self.lock:
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                tasks.append(heapq.heappop(self.heap)[2])
+        return tasks
+
+    def get_wait(self) -> float:
+        """Gets seconds until the next task is due, or None if empty."""
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(self.heap[0][0] - time.time(), 0)
+
+
+class FailureJournal:
+    """This class records failures and negatively caches dead keys.
+
+    It is thread-safe.
+    """
+    def __init__(self, path: str, dead_after: int = 3, ttl: float = 0) -> None:
+        self.path = path
+        self.dead_after = dead_after
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.isfile(path):
+            self.entries = io.load_json(path)
+
+    def get(self, key: str) -> dict:
+        with self.lock:
+            return self.entries.get(key)
+
+    def is_dead(self, key: str) -> bool:
+        """Whether or not the key is negatively cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+            return bool(
+                entry and entry.get('dead_until') and
+                entry['dead_until'] > time.time())
+
+    def record_failure(
+            self, key: str, error: str, permanent: bool = False) -> bool:
+        """Records a failed attempt. Returns whether the key is now dead.
+
+        A key is dead after `dead_after` failed attempts, or at once if the
+        failure is permanent. Dead keys expire after the TTL.
+        """
+        with self.lock:
+            entry = self.entries.setdefault(key, {'attempts': 0})
+            entry['attempts'] += 1
+            entry['last_error'] = error
+            entry['last_time'] = time.time()
+            is_dead = bool(self.ttl) and (
+                permanent or entry['attempts'] >= self.dead_after)
+            if is_dead:
+                entry['dead_until'] = entry['last_time'] + self.ttl
+                # Counts again once expired.
+                entry['attempts'] = 0
+            return is_dead
+
+    def record_success(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def save(self) -> None:
+        """Writes the journal atomically."""
+        with self.lock:
+            io.make_directory(os.path.dirname(self.path) or '.')
+            io.dump_json(self.entries, self.path, atomic=True)
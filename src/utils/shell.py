@@ -1,7 +1,14 @@
 """This modules handles interactions with shell."""
 
+from io import BufferedReader
 import subprocess
 from subprocess import CompletedProcess
+import threading
+import time
+
+
+# Maximum bytes read at once from outputs of a timed command.
+READ_SIZE = 1 << 16
 
 
 def run(command: list, capture_output: bool = True) -> CompletedProcess:
@@ -26,3 +33,51 @@ def run(command: list, capture_output: bool = True) -> CompletedProcess:
     """
     return subprocess.run(
         command, capture_output=capture_output, encoding='utf-8')
+
+
+def run_timed(
+        command: list, 
+        capture_output: bool = True) -> tuple[CompletedProcess, float]:
+    """Executes the shell command like `run` and times its first output.
+
+    The startup of a command (e.g. the interpreter and imports of a Python 
+    tool) roughly ends at its first output, so it can only be timed if the 
+    outputs are captured.
+
+    Returns
+    -------
+    CompletedProcess
+        The execution result. See `run`.
+    float
+        Unix timestamp of the first output, or None if not captured or no 
+        output.
+    """
+    if not capture_output:
+        return run(command, capture_output=False), None
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    outputs = ([], [])
+    first_times = []
+
+    def read(stream: BufferedReader, chunks: list) -> None:
+        while True:
+            chunk = stream.read1(READ_SIZE)
+            if not chunk:
+                break
+            if not chunks:
+                first_times.append(time.time())
+            chunks.append(chunk)
+
+    threads = [
+        threading.Thread(target=read, args=(stream, chunks))
+        for stream, chunks in zip((process.stdout, process.stderr), outputs)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    returncode = process.wait()
+    stdout, stderr = (
+        b''.join(chunks).decode('utf-8', errors='replace') for chunks in outputs)
+    result = CompletedProcess(command, returncode, stdout, stderr)
+    return result, min(first_times, default=None)
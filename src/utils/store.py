@@ -0,0 +1,144 @@
+"""This module stores records in an append-only segment log.
+
+A store is a directory of JSONL segments plus a small manifest:
+    store/
+        manifest.json
+        000001.jsonl
+        000002.jsonl
+        ...
+
+Each append writes the new records as a new segment, so the I/O cost depends on
+the number of new records rather than the size of the store. When a record
+appears in several segments, the latest one wins. Once there are too many
+segments, they are compacted into a single one.
+
+Usage example:
+    tweets = SegmentStore('path/to/tweets_raw')
+    tweets.append({'123': {'id': 123, 'text': {'content': 'Hello'}}})
+    records = tweets.load()
+"""
+
+from __future__ import annotations
+import json
+import os
+
+from . import io # pylint: disable=import-error
+
+
+MANIFEST_FILENAME = 'manifest.json'
+SEGMENT_EXTENSION = '.jsonl'
+
+# Compacts the store once it has more segments than this.
+DEFAULT_MAX_SEGMENTS = 32
+
+
+class SegmentStore:
+    """This class reads and appends records keyed by their 'id' attribute."""
+    def __init__(
+            self, path: str, max_segments: int = DEFAULT_MAX_SEGMENTS) -> None:
+        self.path = os.path.normpath(path)
+        self.max_segments = max_segments
+        self.manifest_path = io.join_paths(self.path, MANIFEST_FILENAME)
+        self.manifest = {
+            'segments': [],
+            'next_segment': 1,
+            'max_id': None,
+        }
+        if os.path.isfile(self.manifest_path):
+            self.manifest = io.load_json(self.manifest_path)
+
+    def is_empty(self) -> bool:
+        return not self.manifest['segments']
+
+    def get_max_id(self) -> int:
+        """Gets the largest record id in the store, or None if empty."""
+        return self.manifest['max_id']
+
+    def load(self) -> dict:
+        """Loads all records.
+
+        Returns
+        -------
+        dict
+            Mappings from record ids (as str) to records.
+        """
+        records = {}
+        for segment in self.manifest['segments']:
+            records.update(self._read_segment(segment))
+        return records
+
+    def append(self, records: dict) -> int:
+        """Appends records as a new segment.
+
+        Compacts the store if it has too many segments afterwards.
+
+        Parameters
+        ----------
+        records: dict
+            Mappings from record ids (as str) to records. Each record must have
+            an integer 'id' attribute.
+
+        Returns
+        -------
+        int
+            Number of records appended.
+        """
+        if not records:
+            return 0
+        io.make_directory(self.path)
+        segment = self._write_segment(records)
+
+        max_id = max(record['id'] for record in records.values())
+        if self.manifest['max_id'] is not None:
+            max_id = max(max_id, self.manifest['max_id'])
+        self.manifest['segments'].append(segment)
+        self.manifest['max_id'] = max_id
+        self._dump_manifest()
+
+        if len(self.manifest['segments']) > self.max_segments:
+            self.compact()
+        return len(records)
+
+    def compact(self) -> None:
+        """Merges all segments into one and removes the old segments."""
+        old_segments = self.manifest['segments']
+        if len(old_segments) <= 1:
+            return
+        segment = self._write_segment(self.load())
+        self.manifest['segments'] = [segment]
+        self._dump_manifest()
+        for old_segment in old_segments:
+            os.remove(io.join_paths(self.path, old_segment))
+
+    def _read_segment(self, segment: str) -> dict:
+        records = {}
+        with io.open_text(io.join_paths(self.path, segment), 'r') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[str(record['id'])] = record
+        return records
+
+    def _write_segment(self, records: dict) -> str:
+        segment = f"{self.manifest['next_segment']:06d}{SEGMENT_EXTENSION}"
+        self.manifest['next_segment'] += 1
+        path = io.join_paths(self.path, segment)
+        temporary_path = path + io.TEMPORARY_SUFFIX
+        with io.open_text(temporary_path, 'w') as f:
+            for _, record in sorted(records.items()):
+                f.write(json.dumps(record, ensure_ascii=False, sort_keys=True))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+        return segment
+
+    def _dump_manifest(self) -> None:
+        io.dump_json(self.manifest, self.manifest_path, atomic=True)
+
+
+def load_records(path: str) -> dict:
+    """Loads records from either a segment store directory or a JSON file."""
+    if os.path.isdir(path):
+        return SegmentStore(path).load()
+    return io.load_json(path)
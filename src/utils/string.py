@@ -17,3 +17,16 @@ def remove_last(text: str, target: str) -> str:
 def replace_first(text: str, old: str, new: str) -> str:
     """Replaces the first occurence of the old token with the new one."""
     return text.replace(old, new, 1)
+
+
+def format_table(rows: list) -> str:
+    """Formats rows of cells as a table with aligned columns.
+
+    The first column is left-aligned and the others are right-aligned.
+    """
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(
+            cell.ljust(width) if i == 0 else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(row, widths)))
+        for row in rows)
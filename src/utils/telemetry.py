@@ -0,0 +1,169 @@
+"""This module records download metrics and summarizes them.
+
+Each download attempt appends a record to a JSONL metrics file:
+    {
+        'time': float('Unix timestamp of the record.'),
+        'url': str('URL.'),
+        'downloader': str('Downloader of the URL.'),
+        'domain': str('Host of the URL.'),
+        'status': str('success', 'retry' or 'failure'),
+        'returncode': int('Exit status. 0 indicates a success.'),
+        'bytes': int('Size of the downloaded files.'),
+        'wall_time': float('Seconds spent on the attempt.'),
+        'startup_time': float('Seconds before the downloader started, if known.'),
+        'retries': int('Number of previous attempts of the URL.')
+    }
+Records of a run are summarized as percentiles per domain or downloader. Past
+records also estimate durations of planned downloads.
+
+Usage example:
+    metrics = MetricsLog('path/to/downloads_metrics.jsonl')
+    metrics.write({'url': url, 'downloader': 'http', ...})
+    metrics.close()
+    print(format_summary(summarize(metrics.records, 'domain'), 'domain'))
+"""
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+
+from . import io, string # pylint: disable=import-error
+
+
+PERCENTILES = (50, 90, 99)
+
+
+class MetricsLog:
+    """This class appends metrics records to a JSONL file. It is thread-safe.
+
+    Records written since it was opened are kept in `records`.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records = []
+        self.lock = threading.Lock()
+        io.make_directory(os.path.dirname(path) or '.')
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record: dict) -> None:
+        record = {'time': time.time(), **record}
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+            self.records.append(record)
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+def load_records(path: str) -> list:
+    """Loads all metrics records of the file, or none if it does not exist."""
+    if not os.path.isfile(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_percentile(values: list, percentile: float) -> float:
+    """Gets a percentile of values with linear interpolation.
+
+    Returns None if no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * percentile / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize(records: list, key: str) -> dict:
+    """Summarizes metrics records grouped by an attribute.
+
+    Parameters
+    ----------
+    records: list
+        Metrics records. See the module docstring.
+    key: str
+        Attribute to group by. e.g. 'domain' or 'downloader'.
+
+    Returns
+    -------
+    dict
+        Format:
+        {
+            str('Group'): {
+                'count': int('Number of attempts.'),
+                'failures': int('Number of failed attempts.'),
+                'retries': int('Number of attempts that were retries.'),
+                'bytes': int('Total downloaded bytes.'),
+                'throughput': float('Bytes per second of wall time.'),
+                'wall_time': {
+                    int('Percentile'): float('Seconds.')
+                },
+                'startup_time': {
+                    int('Percentile'): float('Seconds, or None if unknown.')
+                }
+            }
+        }
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(record[key], []).append(record)
+    summary = {}
+    for group, items in sorted(groups.items()):
+        wall_times = [item['wall_time'] for item in items]
+        startup_times = [
+            item['startup_time'] for item in items
+            if item['startup_time'] is not None
+        ]
+        total_bytes = sum(item['bytes'] for item in items)
+        total_time = sum(wall_times)
+        summary[group] = {
+            'count': len(items),
+            'failures': sum(1 for item in items if item['returncode']),
+            'retries': sum(1 for item in items if item['retries']),
+            'bytes': total_bytes,
+            'throughput': total_bytes / total_time if total_time else 0,
+            'wall_time': {
+                percentile: get_percentile(wall_times, percentile)
+                for percentile in PERCENTILES
+            },
+            'startup_time': {
+                percentile: get_percentile(startup_times, percentile)
+                for percentile in PERCENTILES
+            },
+        }
+    return summary
+
+
+def format_summary(summary: dict, key: str) -> str:
+    """Formats a summary of `summarize` as a table."""
+    headers = [key, 'count', 'fail', 'retry', 'MiB', 'MiB/s'] + [
+        f'p{percentile}' for percentile in PERCENTILES
+    ] + [f'start p{percentile}' for percentile in PERCENTILES]
+    rows = [headers]
+    for group, stats in summary.items():
+        rows.append([
+            group,
+            str(stats['count']),
+            str(stats['failures']),
+            str(stats['retries']),
+            f"{stats['bytes'] / (1 << 20):.1f}",
+            f"{stats['throughput'] / (1 << 20):.2f}",
+        ] + [
+            _format_seconds(stats['wall_time'][percentile])
+            for percentile in PERCENTILES
+        ] + [
+            _format_seconds(stats['startup_time'][percentile])
+            for percentile in PERCENTILES
+        ])
+    return string.format_table(rows)
+
+
+def _format_seconds(seconds: float) -> str:
+    return '-' if seconds is None else f'{seconds:.2f}s'
@@ -0,0 +1,148 @@
+"""This module throttles bandwidth and disk usage of concurrent downloads.
+
+A throttle is shared by all download workers. The total bandwidth is split
+into equal shares per job. Each worker paces its chunks to its own share, and
+downloaders limiting their own rate (e.g. youtube-dl) get the same share, so
+concurrent jobs never exceed the total together. Every chunk also consumes
+tokens of a global disk write bucket, and the queue pauses while free disk
+space is below a threshold.
+
+Usage example:
+    throttle = Throttle(
+        'path/to/media', rate=10 << 20, min_free=1 << 30, jobs=4)
+    throttle.wait_for_space()
+    consume = throttle.get_consumer()
+    for chunk in chunks:
+        consume(len(chunk))
+        f.write(chunk)
+"""
+
+from __future__ import annotations
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Callable
+
+
+# Seconds between checks of free disk space while paused.
+SPACE_CHECK_INTERVAL = 10
+
+# Bytes written between checks of free disk space.
+SPACE_CHECK_BYTES = 64 << 20
+
+# Size units, e.g. '10M' or '1.5G'.
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    """Parses a size in bytes with an optional unit. e.g. '512K' or '2G'.
+
+    Raises
+    ------
+    ValueError
+        If the size is malformed.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*', size, re.I)
+    if not match:
+        raise ValueError(f"Invalid size '{size}'.")
+    return int(float(match[1]) * SIZE_UNITS[match[2].upper()])
+
+
+class ByteBucket:
+    """This class paces bytes to a rate. It is thread-safe."""
+    def __init__(self, rate: float, burst: float = None) -> None:
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        """Blocks until the bytes fit the rate.
+
+        A chunk larger than the bucket goes into debt, which later callers
+        wait for, so the average rate holds.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Throttle:
+    """This class limits bandwidth, disk writes and disk usage.
+
+    Each limit is disabled if not set. The bandwidth is limited per job, at
+    `job_rate` each.
+    """
+    def __init__(
+            self, path: str, rate: float = None, write_rate: float = None,
+            min_free: int = None, jobs: int = 1) -> None:
+        self.path = path
+        self.rate = rate
+        self.job_rate = rate / max(jobs, 1) if rate else None
+        self.write_bucket = ByteBucket(write_rate) if write_rate else None
+        self.min_free = min_free
+        self.unchecked = 0
+        self.lock = threading.Lock()
+        # Buckets of the job rate per worker thread. They last across
+        # downloads, so small files cannot start each one with a full burst.
+        self.local = threading.local()
+
+    def get_consumer(self) -> Callable[[int], None]:
+        """Gets a function accounting for chunks of the calling worker's job.
+
+        It paces chunks to the job rate, then calls `consume`. It may be
+        called from other threads of the same job, e.g. byte ranges.
+        """
+        bucket = None
+        if self.job_rate:
+            bucket = getattr(self.local, 'bucket', None)
+            if bucket is None:
+                bucket = self.local.bucket = ByteBucket(self.job_rate)
+
+        def consume(amount: int) -> None:
+            if bucket:
+                bucket.consume(amount)
+            self.consume(amount)
+        return consume
+
+    def consume(self, amount: int) -> None:
+        """Accounts for a chunk written to disk. See `get_consumer`."""
+        if self.write_bucket:
+            self.write_bucket.consume(amount)
+        if not self.min_free:
+            return
+        with self.lock:
+            self.unchecked += amount
+            should_check = self.unchecked >= SPACE_CHECK_BYTES
+            if should_check:
+                self.unchecked = 0
+        if should_check:
+            self.wait_for_space()
+
+    def wait_for_space(self) -> None:
+        """Blocks while free disk space is below the threshold."""
+        if not self.min_free:
+            return
+        warned = False
+        while self.get_free_space() < self.min_free:
+            if not warned:
+                print(
+                    f'Paused: less than {self.min_free >> 20} MiB free in '
+                    f"'{self.path}'.")
+                warned = True
+            time.sleep(SPACE_CHECK_INTERVAL)
+
+    def get_free_space(self) -> int:
+        path = self.path
+        while path and not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path or '.').free
@@ -0,0 +1,68 @@
+"""This module matches strings against many prefixes at once.
+
+A prefix trie walks each string once, character by character, regardless of
+the number of prefixes. Each prefix carries values of one or more rules, and a
+match returns the longest prefix of every rule in a single pass.
+
+Usage example:
+    trie = PrefixTrie()
+    trie.insert('https://twitter.com/', 'redundant', ['/photo/1'])
+    trie.insert('https://twitter.com/kano_hanayori/', 'local', True)
+    rules = trie.match('https://twitter.com/kano_hanayori/status/1')
+    # {'redundant': ('https://twitter.com/', ['/photo/1']),
+    #  'local': ('https://twitter.com/kano_hanayori/', True)}
+"""
+
+from __future__ import annotations
+from typing import Any
+
+
+# Key of the rules of a node. Never a character.
+_RULES = ''
+
+
+class PrefixTrie:
+    """This class finds the longest matching prefix of each rule."""
+    def __init__(self) -> None:
+        self.root = {}
+        self.size = 0
+
+    def insert(self, prefix: str, rule: str, value: Any) -> None:
+        """Adds a prefix with the value of a rule. Overwrites the same rule."""
+        node = self.root
+        for character in prefix:
+            node = node.setdefault(character, {})
+        rules = node.setdefault(_RULES, {})
+        if rule not in rules:
+            self.size += 1
+        rules[rule] = (prefix, value)
+
+    def match(self, text: str) -> dict:
+        """Gets the longest prefix of the text and its value per rule.
+
+        Returns
+        -------
+        dict
+            Format:
+            {
+                str('Rule'): (str('Longest matching prefix'), Any('Value'))
+            }
+        """
+        matches = {}
+        node = self.root
+        if _RULES in node:
+            matches.update(node[_RULES])
+        for character in text:
+            node = node.get(character)
+            if node is None:
+                break
+            if _RULES in node:
+                matches.update(node[_RULES])
+        return matches
+
+    def find(self, text: str, rule: str) -> tuple[str, Any]:
+        """Gets the longest prefix of the text and its value of a rule.
+
+        Returns None if no prefix of the rule matches.
+        """
+        return self.match(text).get(rule)
@@ -22,10 +22,11 @@ import re
 import urllib.parse
 
 from utils import color, io, string # pylint: disable=import-error
+from utils.database import ArchiveDatabase # pylint: disable=import-error
 from utils.html import HTMLWriter # pylint: disable=import-error
 
 
-# Output filename
+# Default output filename
 WEBPAGE_OUTPUT_FILENAME = 'index.html'
 
 
@@ -467,6 +468,14 @@ def _get_options() -> None:
     parser.add_argument(
         '-o', '--output', default='..', type=str, 
         help='Path to output directory.')
+    parser.add_argument(
+        '-f', '--filename', default=WEBPAGE_OUTPUT_FILENAME, type=str, 
+        help='Filename of the webpage. e.g. one per account.')
+    parser.add_argument(
+        '-d', '--database', default=None, type=str, 
+        help='Path to an SQLite archive database. If set, path-resolved '
+             'Tweets of the user are streamed from it instead of the Tweets '
+             'file.')
     parser.add_argument(
         '--use-remote-video', action='store_true', default=False, 
         help='Maps video files to their remote URLs instead of their local path.')
@@ -475,10 +484,9 @@ def _get_options() -> None:
 
 if __name__ == '__main__':
     options = _get_options()
-    tweets = io.load_json(options.input)
     user = io.load_json(options.user)
     settings = io.load_json(options.settings)
-    webpage_path = io.join_paths(options.output, WEBPAGE_OUTPUT_FILENAME)
+    webpage_path = io.join_paths(options.output, options.filename)
     webpage = io.open_text(webpage_path)
     writer = HTMLWriter(webpage)
 
@@ -491,10 +499,20 @@ if __name__ == '__main__':
     write_user(writer, user=user)
     writer.open_div(classes=['mt-4'])
 
-    for _, tweet in sorted(tweets.items()):
+    if options.database:
+        database = ArchiveDatabase(options.database)
+        tweets = database.iterate_tweets(user['id'])
+    else:
+        tweets = io.load_json(options.input)
+        tweets = (tweet for _, tweet in sorted(tweets.items()))
+
+    for tweet in tweets:
         write_tweet(writer, user, tweet, options.use_remote_video)
         writer.open_horizontal_rule()
 
+    if options.database:
+        database.close()
+
     writer.close_div().close_div()
     write_footer(writer, settings['footer'])
     writer.close_body().close_html()
@@ -0,0 +1,6 @@
+"""Makes the scripts and utilities in 'src' importable as they are run."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
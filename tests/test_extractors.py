@@ -0,0 +1,75 @@
+"""Tests exit statuses of batched extractor downloads."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('youtube_dl')
+
+from utils import extractors # pylint: disable=import-error,wrong-import-position
+
+
+SIZE = 1000
+
+
+class VideoHandler(BaseHTTPRequestHandler):
+    """Serves direct video links.
+
+    Videos under '/forbidden/' are extracted from their headers but fail to
+    download.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._send_headers(200, SIZE)
+
+    def do_GET(self) -> None:
+        if self.path.startswith('/forbidden/'):
+            self._send_headers(403, 0)
+            return
+        self._send_headers(200, SIZE)
+        self.wfile.write(b'\0' * SIZE)
+
+    def _send_headers(self, status: int, length: int) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+
+@pytest.fixture(scope='module')
+def host():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), VideoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = extractors.ExtractorPool(workers=1)
+    yield pool
+    pool.close()
+
+
+def test_batch_reports_failed_downloads_of_extracted_media(
+        tmp_path, host, pool):
+    batch = [
+        (f'{host}/videos/1.mp4', str(tmp_path / '1')),
+        (f'{host}/forbidden/2.mp4', str(tmp_path / '2')),
+        (f'{host}/videos/3.mp4', str(tmp_path / '3')),
+    ]
+    results = pool.run_batch(extractors.YOUTUBE_DL, batch, quiet=True)
+
+    assert [returncode for returncode, _, _ in results] == [0, 1, 0]
+    assert 'HTTP Error 403' in results[1][1]
+    # The failure does not leak into the next URL of the session.
+    assert os.listdir(tmp_path / '3')
+    assert not os.path.isdir(tmp_path / '2') or not os.listdir(tmp_path / '2')
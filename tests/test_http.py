@@ -0,0 +1,123 @@
+"""Tests ranged downloads against a local server with range support."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import re
+import threading
+
+import pytest
+
+from utils import http, io # pylint: disable=import-error
+
+
+SIZE = 1 << 20
+PARTS = 4
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves a single file with ETag and Range support.
+
+    `fail_starts` makes ranges starting there fail once, like an interrupted
+    download. `changes` replaces the file after the next HEAD request.
+    """
+    protocol_version = 'HTTP/1.1'
+    content = os.urandom(SIZE)
+    etag = '"1"'
+    fail_starts = set()
+    changes = None
+    requests = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._send(head=True)
+        cls = type(self)
+        if cls.changes:
+            cls.content, cls.etag = cls.changes
+            cls.changes = None
+
+    def do_GET(self) -> None:
+        self._send(head=False)
+
+    def _send(self, head: bool) -> None:
+        cls = type(self)
+        start, end = 0, len(cls.content) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        ranged = match and (if_range is None or if_range == cls.etag)
+        if ranged:
+            start = int(match[1])
+            end = int(match[2]) if match[2] else end
+        if not head:
+            cls.requests.append(self.headers.get('Range'))
+            if ranged and start in cls.fail_starts:
+                cls.fail_starts.discard(start)
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        self.send_response(206 if ranged else 200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', cls.etag)
+        if ranged:
+            self.send_header(
+                'Content-Range', f'bytes {start}-{end}/{len(cls.content)}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if not head:
+            self.wfile.write(cls.content[start:end + 1])
+
+
+@pytest.fixture
+def url():
+    RangeHandler.fail_starts = set()
+    RangeHandler.changes = None
+    RangeHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/video.mp4'
+    server.shutdown()
+    server.server_close()
+
+
+def _download(url: str, dst: str) -> dict:
+    return http.download_file(
+        url, dst, parts=PARTS, min_part_size=SIZE // PARTS)
+
+
+def test_ranged_download_resumes_failed_ranges(tmp_path, url):
+    last_start = (PARTS - 1) * (SIZE // PARTS)
+    RangeHandler.fail_starts = {last_start}
+    with pytest.raises(OSError):
+        _download(url, str(tmp_path))
+    path = str(tmp_path / 'video.mp4')
+    temporary_path = path + io.TEMPORARY_SUFFIX
+    progress = io.load_json(temporary_path + http.PROGRESS_SUFFIX)
+    assert len(progress['done']) == PARTS - 1
+    assert progress['written'] == last_start
+
+    RangeHandler.requests = []
+    info = _download(url, str(tmp_path))
+    # Only the failed range is downloaded again.
+    assert RangeHandler.requests == [f'bytes={last_start}-{SIZE - 1}']
+    assert info['path'] == path
+    assert info['etag'] == RangeHandler.etag
+    with open(path, 'rb') as f:
+        assert f.read() == RangeHandler.content
+    assert sorted(os.listdir(tmp_path)) == ['video.mp4']
+
+
+def test_ranged_download_fails_over_to_changed_file(tmp_path, url):
+    content = os.urandom(SIZE)
+    RangeHandler.changes = (content, '"2"')
+    info = _download(url, str(tmp_path))
+
+    # Ranges of the old file are answered with the whole new file.
+    assert RangeHandler.requests[-1] is None
+    assert info['etag'] == '"2"'
+    with open(info['path'], 'rb') as f:
+        assert f.read() == content
+    assert sorted(os.listdir(tmp_path)) == ['video.mp4']
@@ -0,0 +1,46 @@
+"""Tests detection of unfinished downloads in media directories."""
+
+import pytest
+
+from utils import http, io, manifest # pylint: disable=import-error
+
+
+@pytest.mark.parametrize('filename', [
+    'video.mp4.part',
+    'video.mp4.ytdl',
+    'video.mp4.download',
+    'image.jpg' + io.TEMPORARY_SUFFIX,
+    'video.mp4' + io.TEMPORARY_SUFFIX + http.PROGRESS_SUFFIX,
+])
+def test_unfinished_files_are_partial(tmp_path, filename):
+    (tmp_path / 'image.jpg').write_bytes(b'image')
+    (tmp_path / filename).write_bytes(b'unfinished')
+
+    assert manifest.is_partial(filename)
+    files, has_partial = manifest.list_files(str(tmp_path))
+    assert has_partial
+    assert list(files) == ['image.jpg']
+
+
+def test_finished_files_are_not_partial(tmp_path):
+    (tmp_path / 'image.jpg').write_bytes(b'image')
+    (tmp_path / 'video.mp4').write_bytes(b'video')
+
+    files, has_partial = manifest.list_files(str(tmp_path))
+    assert not has_partial
+    assert sorted(files) == ['image.jpg', 'video.mp4']
+
+
+def test_complete_urls_need_their_files(tmp_path):
+    media = tmp_path / 'media'
+    (media / 'a').mkdir(parents=True)
+    (media / 'a' / 'image.jpg').write_bytes(b'image')
+    downloads = manifest.DownloadManifest(str(tmp_path / 'manifest.json'))
+    files = {'image.jpg': manifest.get_file(str(media / 'a' / 'image.jpg'))}
+    downloads.record('https://a.com/1', 'http', 'a', manifest.COMPLETE, files)
+    downloads.record('https://a.com/2', 'you-get', 'b', manifest.COMPLETE, {})
+
+    assert downloads.is_complete('https://a.com/1', str(media), verify=True)
+    assert not downloads.is_complete('https://a.com/2', str(media))
+    (media / 'a' / 'image.jpg').write_bytes(b'another image')
+    assert not downloads.is_complete('https://a.com/1', str(media))
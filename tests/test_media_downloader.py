@@ -0,0 +1,137 @@
+"""Tests dispatching downloads and recording their results."""
+
+import os
+from subprocess import CompletedProcess
+import time
+
+import media_downloader # pylint: disable=import-error
+from utils import manifest as manifests # pylint: disable=import-error
+from utils.manifest import DownloadManifest # pylint: disable=import-error
+from utils.retry import FailureJournal # pylint: disable=import-error
+from utils.telemetry import MetricsLog # pylint: disable=import-error
+
+
+def _pop_all(limiter: media_downloader.DomainLimiter) -> list:
+    tasks = []
+    while True:
+        key, task = limiter.pop()
+        if task is None:
+            return tasks
+        tasks.append((key, task))
+
+
+def test_capped_domains_do_not_hold_back_others():
+    limiter = media_downloader.DomainLimiter(
+        {'https://a.com/': 1, 'default': 2})
+    urls = [
+        'https://a.com/1', 'https://a.com/2', 'https://b.com/1', 
+        'https://b.com/2', 'https://b.com/3', 'https://c.com/1',
+    ]
+    for priority, url in enumerate(urls):
+        limiter.push(url, url, priority)
+
+    started = _pop_all(limiter)
+    assert [task for _, task in started] == [
+        'https://a.com/1', 'https://b.com/1', 'https://b.com/2', 
+        'https://c.com/1',
+    ]
+    assert len(limiter) == 2
+
+    # A finished task frees a slot of its own domain only.
+    limiter.release(started[1][0])
+    assert [task for _, task in _pop_all(limiter)] == ['https://b.com/3']
+    limiter.release(started[0][0])
+    assert [task for _, task in _pop_all(limiter)] == ['https://a.com/2']
+    assert not len(limiter)
+
+
+def test_tasks_start_in_the_order_of_priority():
+    limiter = media_downloader.DomainLimiter({})
+    limiter.push('https://a.com/2', 'a2', 2)
+    limiter.push('https://b.com/1', 'b1', 1)
+    limiter.push('https://a.com/0', 'a0', 0)
+
+    assert [task for _, task in _pop_all(limiter)] == ['a0', 'b1', 'a2']
+
+
+def _download_nothing(downloader, url, dst, *args, **kwargs):
+    # Exits successfully without writing any file, like an extractor that
+    # found no media.
+    return CompletedProcess([downloader, url], 0, '', ''), time.time()
+
+
+def test_downloads_without_files_fail_everywhere(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_downloader, 'download_media', _download_nothing)
+    url = 'https://example.com/video'
+    downloads = {url: {'downloader': 'youtube-dl', 'path': 'video'}}
+    manifest = DownloadManifest(str(tmp_path / 'manifest.json'))
+    journal = FailureJournal(str(tmp_path / 'journal.json'))
+
+    results = media_downloader.download_all(
+        downloads, str(tmp_path / 'media'), manifest=manifest, 
+        journal=journal)
+
+    assert results == {url: media_downloader.FAILURE}
+    assert manifest.get(url)['status'] == manifests.FAILED
+    assert journal.get(url)['attempts'] == 1
+    urls = {url: 'video'}
+    assert media_downloader.get_pending_urls(
+        urls, urls, downloads, results, journal) == urls
+
+
+def _download_missing(downloader, url, dst, *args, **kwargs):
+    return CompletedProcess(
+        [downloader, url], 1, '', 'HTTP Error 404: Not Found'), time.time()
+
+
+def _download_video(downloader, url, dst, *args, **kwargs):
+    os.makedirs(dst, exist_ok=True)
+    with open(os.path.join(dst, 'video.mp4'), 'wb') as f:
+        f.write(b'video')
+    return CompletedProcess([downloader, url], 0, '', ''), time.time()
+
+
+def test_dead_urls_stay_in_the_delta_until_they_expire(tmp_path, monkeypatch):
+    url = 'https://example.com/video'
+    delta = {url: 'video'}
+    downloads = {url: {'downloader': 'youtube-dl', 'path': 'video'}}
+    journal = FailureJournal(str(tmp_path / 'journal.json'), ttl=3600)
+
+    def run(download_media):
+        nonlocal delta
+        monkeypatch.setattr(
+            media_downloader, 'download_media', download_media)
+        results = media_downloader.download_all(
+            downloads, str(tmp_path / 'media'), journal=journal)
+        delta = media_downloader.get_pending_urls(
+            delta, delta, downloads, results, journal)
+        return results[url]
+
+    # A permanent error marks the URL as dead at once.
+    assert run(_download_missing) == media_downloader.FAILURE
+    assert journal.is_dead(url)
+    assert delta == {url: 'video'}
+
+    # Skipped as dead, yet kept for a later run.
+    assert run(_download_video) == media_downloader.SKIP
+    assert delta == {url: 'video'}
+
+    journal.entries[url]['dead_until'] = time.time() - 1
+    assert run(_download_video) == media_downloader.SUCCESS
+    assert not delta
+
+
+def test_metrics_only_count_bytes_downloaded_now(tmp_path, monkeypatch):
+    url = 'https://example.com/video'
+    downloads = {url: {'downloader': 'youtube-dl', 'path': 'video'}}
+    media = tmp_path / 'media'
+    metrics = MetricsLog(str(tmp_path / 'metrics.jsonl'))
+    monkeypatch.setattr(media_downloader, 'download_media', _download_video)
+    media_downloader.download_all(downloads, str(media), metrics=metrics)
+
+    # The existing file is not overwritten.
+    monkeypatch.setattr(media_downloader, 'download_media', _download_nothing)
+    media_downloader.download_all(downloads, str(media), metrics=metrics)
+    metrics.close()
+
+    assert [record['bytes'] for record in metrics.records] == [5, 0]
@@ -0,0 +1,117 @@
+"""Tests URL collection of the Twitter downloader against the mock Twitter API."""
+
+import argparse
+from http.server import ThreadingHTTPServer
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('tweepy')
+
+import twitter_downloader # pylint: disable=import-error,wrong-import-position
+from mock_twitter_server import MockTwitter, MockTwitterHandler # pylint: disable=import-error,wrong-import-position
+from utils import io # pylint: disable=import-error,wrong-import-position
+from utils.database import ArchiveDatabase # pylint: disable=import-error,wrong-import-position
+
+
+SETTINGS_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'src', 'configs', 'twitter.json')
+CREDENTIALS = {
+    key: 'test' for key in (
+        'access_token', 'access_token_secret', 'bearer_token', 
+        'consumer_key', 'consumer_secret')
+}
+
+
+@pytest.fixture(scope='module')
+def api_host():
+    MockTwitterHandler.twitter = MockTwitter(500, 10000, 900, 0.3, 0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockTwitterHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def _archive(output: str, api_host: str, **flags) -> None:
+    options = argparse.Namespace(
+        database=None, use_existing_tweets=False, resume=False, 
+        backfill=False, windows=4, workers=2, refresh_metrics=False, 
+        early_stop=False)
+    for key, value in flags.items():
+        setattr(options, key, value)
+    settings = io.load_json(SETTINGS_PATH)
+    client = twitter_downloader.get_client(CREDENTIALS, api_host=api_host)
+    account = twitter_downloader.get_accounts(settings)[0]
+    database = options.database and ArchiveDatabase(options.database)
+    try:
+        twitter_downloader._archive_account( # pylint: disable=protected-access
+            client, account, settings, output, database, options)
+    finally:
+        if database:
+            database.close()
+
+
+def _load(output: str, filename: str) -> dict:
+    return io.load_json(os.path.join(output, filename))
+
+
+def test_resume_collects_urls_of_older_pages(tmp_path, api_host):
+    clean = str(tmp_path / 'clean')
+    _archive(clean, api_host)
+    resumed = str(tmp_path / 'resumed')
+    _archive(resumed, api_host, early_stop=True)
+    _archive(resumed, api_host, resume=True)
+
+    urls = _load(clean, twitter_downloader.URLS_RAW_OUTPUT_FILENAME)
+    assert _load(resumed, twitter_downloader.URLS_RAW_OUTPUT_FILENAME) == urls
+    # Both deltas of the resumed download add up to all URLs.
+    assert _load(resumed, twitter_downloader.URLS_RAW_DELTA_FILENAME) == urls
+
+
+def test_backfill_collects_urls_of_older_tweets(tmp_path, api_host):
+    clean = str(tmp_path / 'clean')
+    _archive(clean, api_host)
+    backfilled = str(tmp_path / 'backfilled')
+    _archive(backfilled, api_host, early_stop=True)
+    _archive(backfilled, api_host, backfill=True)
+
+    urls = _load(clean, twitter_downloader.URLS_RAW_OUTPUT_FILENAME)
+    assert _load(
+        backfilled, twitter_downloader.URLS_RAW_OUTPUT_FILENAME) == urls
+
+
+def _load_tweet_ids(database_path: str) -> list:
+    database = ArchiveDatabase(database_path)
+    try:
+        return [tweet['id'] for tweet in database.iterate_tweets()]
+    finally:
+        database.close()
+
+
+def test_windowed_backfill_fetches_every_tweet(tmp_path, api_host):
+    clean = str(tmp_path / 'clean.sqlite')
+    _archive(str(tmp_path / 'clean'), api_host, database=clean)
+    backfilled = str(tmp_path / 'backfilled.sqlite')
+    _archive(
+        str(tmp_path / 'backfilled'), api_host, database=backfilled, 
+        backfill=True, windows=16, workers=4)
+
+    # Concurrent windows neither drop Tweets at their bounds nor overlap.
+    tweet_ids = _load_tweet_ids(clean)
+    assert tweet_ids
+    assert _load_tweet_ids(backfilled) == tweet_ids
+
+
+def test_urls_are_collected_once(tmp_path, api_host):
+    output = str(tmp_path / 'output')
+    _archive(output, api_host)
+    os.remove(os.path.join(
+        output, twitter_downloader.URLS_RAW_DELTA_FILENAME))
+    _archive(output, api_host, use_existing_tweets=True)
+
+    # Only profile images are part of every delta.
+    delta = _load(output, twitter_downloader.URLS_RAW_DELTA_FILENAME)
+    assert set(delta.values()) <= {'avatar', 'banner'}